@@ -35,9 +35,23 @@ class Config(BaseSettings):
     S3_BUCKET_ID: str
     S3_ACCESS_KEY: str
     S3_SECRET_KEY: str
+    S3_MAX_POOL_CONNECTIONS: int = 50  # Shared client connection pool size
+    S3_KEEPALIVE_TIMEOUT_SECONDS: int = 12  # Idle pooled connections
+    STORAGE_USAGE_RECONCILE_INTERVAL: int = 3600  # Ledger vs. bucket listing
+
+    # Bytes of inputs a user may store, by realm role and by user ID. A user
+    # quota takes precedence, otherwise the most generous role quota
+    # applies. None is unlimited.
+    STORAGE_QUOTA_BYTES_BY_ROLE: dict[str, int | None] = {
+        "admin": None,
+        "user": 500 * 1024**3,
+    }
+    STORAGE_QUOTA_BYTES_BY_USER: dict[str, int | None] = {}
     INCOMPLETE_OBJECT_TIMEOUT_SECONDS: int
     INCOMPLETE_OBJECT_CHECK_INTERVAL: int
     INCOMPLETE_OBJECT_CONSIDER_ABANDONED: int = 60
+    # Interval at which upload progress is written from cache to database
+    UPLOAD_PROGRESS_FLUSH_INTERVAL_SECONDS: int = 5
 
     # Key to prefix to all assets in the S3 bucket. Should be distinct to the
     # deployment as to avoid conflicts
@@ -52,6 +66,26 @@ class Config(BaseSettings):
     ALLOWED_FILETYPES: list[str] = ["video/mp4"]
     INPUT_FOLDER_PREFIX: str = "inputs/"
 
+    # Size of each chunk read from S3 bodies when streaming, and the folder
+    # used for scratch files (None uses the system temporary directory)
+    S3_STREAM_CHUNK_SIZE_BYTES: int = 1024 * 1024
+    SCRATCH_DIR: str | None = None
+
+    # Video statistics are read from the MP4 moov box with ranged requests.
+    # The MD5 hash is taken from the ETag of single-part uploads, so that
+    # only kilobytes of the video are read. Multipart uploads (ie. all
+    # uploads through tusd) have an empty hash_md5sum, unless enabling
+    # VIDEO_STATISTICS_FULL_MD5, which streams the whole file through the
+    # hash.
+    VIDEO_PROBE_HEAD_BYTES: int = 64 * 1024
+    VIDEO_PROBE_MAX_MOOV_BYTES: int = 32 * 1024 * 1024
+    VIDEO_STATISTICS_FULL_MD5: bool = False
+
+    # Worker processes for CPU-bound work, and how many further jobs may wait
+    # for a free process before callers are held back
+    PROCESS_POOL_MAX_WORKERS: int = 2
+    PROCESS_POOL_MAX_QUEUE: int = 4
+
     # Keycloak
     KEYCLOAK_REALM: str
     KEYCLOAK_URL: str
@@ -63,6 +97,25 @@ class Config(BaseSettings):
     SERIALIZER_SECRET_KEY: str
     SERIALIZER_EXPIRY_HOURS: int = 6
 
+    # Opt-in (S3_PRESIGNED_DOWNLOADS=true): redirect downloads to presigned
+    # S3 URLs instead of streaming the file through the API, which supports
+    # Range requests. URLs never outlive the download token.
+    S3_PRESIGNED_DOWNLOADS: bool = False
+    S3_PRESIGNED_URL_EXPIRY_SECONDS: int = 300
+
+    # Levels of detail of point cloud previews, from a voxel grid with the
+    # base number of cells along the longest axis, doubling at each level
+    POINT_CLOUD_LOD_LEVELS: int = 6
+    POINT_CLOUD_BASE_GRID_CELLS: int = 32
+
+    # Seconds a client is asked to wait before requesting a preview again,
+    # while it is built by a worker
+    PREVIEW_RETRY_AFTER_SECONDS: int = 5
+
+    # Tile pyramids of raster outputs, and how long browsers may cache tiles
+    TILE_SIZE: int = 256
+    TILE_CACHE_MAX_AGE_SECONDS: int = 7 * 24 * 3600
+
     TIMEOUT: httpx.Timeout = httpx.Timeout(
         5.0,
         connect=2.0,
@@ -74,6 +127,27 @@ class Config(BaseSettings):
     SUBMISSION_JOB_CHECK_POLLING_INTERVAL: int = 10
     SUBMISSION_JOB_CHECK_TIMEOUT: int = 120  # Seconds
 
+    # Durable task queue (see app.worker)
+    TASK_WORKER_CONCURRENCY: int = 4
+    TASK_POLL_INTERVAL_SECONDS: float = 1.0
+    TASK_MAX_ATTEMPTS: int = 5
+    TASK_RETRY_BACKOFF_SECONDS: float = 5.0
+    TASK_RETRY_BACKOFF_MAX_SECONDS: float = 600.0
+    # Running tasks whose worker stopped renewing their lock for this time
+    # are handed to another worker
+    TASK_LOCK_TIMEOUT_SECONDS: int = 3600
+    # Workers renew the lock of their running tasks at this interval, so it
+    # must be shorter than the lock timeout
+    TASK_HEARTBEAT_SECONDS: float = 60.0
+    # Workers check whether periodic jobs are due at most this often. Each
+    # job runs once per interval across all workers.
+    TASK_PERIODIC_CHECK_SECONDS: float = 60.0
+    # Finished tasks are deleted once unchanged for these times, checked
+    # every TASK_PRUNE_INTERVAL_SECONDS
+    TASK_SUCCEEDED_RETENTION_SECONDS: int = 24 * 3600
+    TASK_FAILED_RETENTION_SECONDS: int = 30 * 24 * 3600
+    TASK_PRUNE_INTERVAL_SECONDS: int = 3600
+
     # Redis cache
     CACHE_ENABLED: bool = True
     CACHE_URL: str
@@ -82,6 +156,18 @@ class Config(BaseSettings):
     CACHE_DB: int = 0
     CACHE_SECRET: str  # Secret key for cache hashing
     CACHE_PASSWORD: str  # Redis' password
+    # Expiry of the cached counts of unfiltered listings, which are also
+    # invalidated when rows are added or removed
+    LIST_COUNT_CACHE_SECONDS: int = 300
+    # Expiry of cached list and detail results, which are also made stale by
+    # writes to the resources they were read from (see app.query_cache)
+    QUERY_CACHE_SECONDS: int = 300
+
+    # Server-Sent Events, published over Redis pub/sub on the cache server
+    EVENTS_HEARTBEAT_SECONDS: int = 15
+    EVENTS_CLIENT_QUEUE_SIZE: int = 100
+    # Upload progress events are published at most this often per upload
+    EVENTS_PROGRESS_INTERVAL_SECONDS: float = 1.0
 
     VALID_ROLES: list[str] = ["admin", "user"]
 
@@ -1,13 +1,150 @@
 from app.db import get_session, AsyncSession
-from fastapi import Depends, Response
+from app.fieldsets import Fieldset
+from app.matching import contains
+from fastapi import Depends, HTTPException, Response
 from sqlmodel import select
-from typing import Any
+from sqlmodel.sql.sqltypes import AutoString, GUID
+from typing import Any, Callable
+import functools
 import json
 from sqlalchemy.sql import func
-from sqlalchemy import or_
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, inspect, or_
 from uuid import UUID
 from app.users.models import User
 from app.auth.services import get_user_info
+from app.pagination import (
+    fetch_page,
+    list_count_key,
+    paginate_by_cursor,
+    next_cursor,
+    DEFAULT_PAGE_SIZE,
+)
+
+
+class ListPlan:
+    """Filter and sort plan of a model for the list endpoints
+
+    Built once per model (see list_plan) from its mapper, so that a filter
+    param, ie. {"name": "bar"}, is a lookup of the field's operator rather
+    than an inspection of the model:
+
+    - UUID columns must match exactly, or be in a list of values
+    - Boolean columns are compared to the value
+    - String columns match case-insensitively anywhere (ILIKE), or any of a
+      list of values; names, filenames and descriptions have pg_trgm
+      indexes for these
+    - Numeric and datetime columns are equal to the value, or in a list
+    - Relationships are filtered on having related rows or not (bool)
+
+    Values are bound as parameters, so that statements of the same shape
+    share SQLAlchemy's compiled statement cache. Other fields (eg. JSON and
+    geometry columns), and sorts on anything but a column, are rejected
+    with a 400.
+    """
+
+    def __init__(self, db_model: Any):
+        self.db_model = db_model
+        self.filters: dict[str, Callable[[Any], Any]] = {}
+        self.sort_columns: dict[str, Any] = {}
+
+        mapper = inspect(db_model)
+        for attr in mapper.column_attrs:
+            if attr.key == "deleted_utc":
+                continue
+            column = getattr(db_model, attr.key)
+            column_type = attr.columns[0].type
+            if isinstance(column_type, GUID):
+                self.filters[attr.key] = functools.partial(
+                    self.match_uuid, column
+                )
+            elif isinstance(column_type, Boolean):
+                self.filters[attr.key] = column.__eq__
+            elif isinstance(column_type, (AutoString, String)):
+                self.filters[attr.key] = functools.partial(
+                    self.match_text, column
+                )
+            elif isinstance(column_type, (Integer, Float, DateTime)):
+                self.filters[attr.key] = functools.partial(
+                    self.match_value, column
+                )
+            else:
+                continue
+            self.sort_columns[attr.key] = column
+
+        for relationship in mapper.relationships:
+            self.filters[relationship.key] = functools.partial(
+                self.match_related,
+                getattr(db_model, relationship.key),
+                relationship.uselist,
+            )
+
+    @staticmethod
+    def match_uuid(column: Any, value: Any) -> Any:
+        try:
+            if isinstance(value, list):
+                return column.in_([UUID(str(v)) for v in value])
+            return column == UUID(str(value))
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail=f"{value} is not a valid id"
+            )
+
+    @staticmethod
+    def match_text(column: Any, value: Any) -> Any:
+        if isinstance(value, list):
+            return or_(*[contains(column, v) for v in value])
+        return contains(column, value)
+
+    @staticmethod
+    def match_value(column: Any, value: Any) -> Any:
+        if isinstance(value, list):
+            return column.in_(value)
+        return column == value
+
+    @staticmethod
+    def match_related(relationship: Any, uselist: bool, value: Any) -> Any:
+        condition = relationship.any() if uselist else relationship.has()
+        return condition if value else ~condition
+
+    def filter(self, query: Any, filter: dict) -> Any:
+        """Apply the filter params of a listing, ie. {"name": "bar"}"""
+
+        for field, value in filter.items():
+            try:
+                condition = self.filters[field]
+            except KeyError:
+                raise HTTPException(
+                    status_code=400, detail=f"{field} is not a valid filter"
+                )
+            query = query.where(condition(value))
+
+        return query
+
+    def sort_column(self, sort_field: str) -> Any:
+        try:
+            return self.sort_columns[sort_field]
+        except KeyError:
+            raise HTTPException(
+                status_code=400, detail=f"{sort_field} is not a valid field"
+            )
+
+    def sort(self, query: Any, sort: list) -> Any:
+        """Apply the sort params of a listing, ie. ["name", "ASC"]"""
+
+        if len(sort) != 2:
+            return query
+
+        sort_field, sort_order = sort
+        column = self.sort_column(sort_field)
+        if sort_order == "ASC":
+            return query.order_by(column)
+
+        return query.order_by(column.desc())
+
+
+@functools.cache
+def list_plan(db_model: Any) -> ListPlan:
+    return ListPlan(db_model)
 
 
 class CRUD:
@@ -17,50 +154,50 @@ class CRUD:
         db_model_read: Any,
         db_model_create: Any,
         db_model_update: Any,
+        fieldset: Fieldset | None = None,
+        cursor_sort: tuple[str, str] = ("iterator", "ASC"),
     ):
         self.db_model = db_model
         self.db_model_read = db_model_read
         self.db_model_create = db_model_create
         self.db_model_update = db_model_update
+        # Fields of db_model_read and how to load them (see app.loaders)
+        self.fieldset = fieldset
+        # Sort when paginating by cursor without a sort
+        self.cursor_sort = cursor_sort
+        self.plan = list_plan(db_model)
 
     async def __call__(self, *args: Any, **kwds: Any) -> Any:
         pass
 
-    @property
-    def exact_match_fields(
+    def load_options(
         self,
-    ) -> list[str]:
-        """Returns a list of all the UUID fields in the model
+        fields: frozenset | None = None,
+        required: tuple[str, ...] = (),
+    ) -> tuple:
+        """Loader options for fields of db_model_read, or all of them"""
 
-        These cannot be performed with a likeness query and must have an
-        exact match.
+        if self.fieldset is None:
+            return ()
 
-        """
-        schema = self.db_model.model_json_schema()
-
-        uuid_properties = []
-        for prop_name, prop_details in schema["properties"].items():
-            prop_type = prop_details.get("type")
-            if isinstance(prop_type, list) and "string" in prop_type:
-                any_of_types = prop_details.get("anyOf")
-                if any_of_types:
-                    for any_of_type in any_of_types:
-                        if "string" in any_of_type.get("type", []):
-                            uuid_properties.append(prop_name)
-                            break
-                elif (
-                    "format" in prop_details
-                    and prop_details["format"] == "uuid"
-                ):
-                    uuid_properties.append(prop_name)
-            elif prop_type in ["string", "null"]:  # Allow case when optional
-                if (
-                    "format" in prop_details
-                    and prop_details["format"] == "uuid"
-                ):
-                    uuid_properties.append(prop_name)
-
-        return uuid_properties
+        return self.fieldset.load_options(fields, required)
+
+    def hide_deleted(self, query: Any) -> Any:
+        """Exclude rows that are pending deletion, if the model has them"""
+
+        if hasattr(self.db_model, "deleted_utc"):
+            query = query.where(self.db_model.deleted_utc.is_(None))
+
+        return query
+
+    def count_query(self, user: User, filter: dict) -> Any:
+        """Query for the count of a listing, with a filter applied"""
+
+        query = self.hide_deleted(select(func.count(self.db_model.iterator)))
+        if not user.is_admin:
+            query = query.where(self.db_model.owner == user.id)
+
+        return self.plan.filter(query, filter)
 
     async def get_model_data(
         self,
@@ -69,86 +206,82 @@ class CRUD:
         range: str,
         user: User = Depends(get_user_info),
         session: AsyncSession = Depends(get_session),
+        cursor: str | None = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        response: Response | None = None,
+        fields: frozenset | None = None,
     ) -> list:
         """Returns the data of a model with a filter applied
 
-        Similar to the count query except returns the data instead of the count
+        The total count is taken in the same query (see fetch_page) and set
+        in the Content-Range header of the response, if one is given.
+
+        With a cursor, the range is ignored and the data is paginated by
+        cursor instead, with the next cursor set on the response.
+
+        With fields (see app.fieldsets), only the columns and relationships
+        of those fields are loaded.
         """
 
         sort = json.loads(sort) if sort else []
         range = json.loads(range) if range else []
         filter = json.loads(filter) if filter else {}
 
-        query = select(self.db_model)
+        query = self.hide_deleted(select(self.db_model))
 
         if not user.is_admin:
             query = query.where(self.db_model.owner == user.id)
 
-        if len(filter):
-            for field, value in filter.items():
-                if field in self.exact_match_fields:
-                    if isinstance(value, list):
-                        # Combine multiple filters with OR
-                        or_conditions = []
-                        for v in value:
-                            or_conditions.append(
-                                getattr(self.db_model, field) == v
-                            )
-
-                        query = query.filter(or_(*or_conditions))
-                    else:
-                        # If it's not a list, apply a simple equality filter
-                        query = query.filter(
-                            getattr(self.db_model, field) == value
-                        )
-                else:
-                    if isinstance(value, list):
-                        or_conditions = []
-                        for v in value:
-                            or_conditions.append(
-                                getattr(self.db_model, field).like(
-                                    f"%{str(v)}%"
-                                )
-                            )
-
-                        query = query.filter(or_(*or_conditions))
-                    elif isinstance(value, bool):
-                        if value is True:
-                            query = query.filter(
-                                getattr(self.db_model, field).has()
-                            )
-                        else:
-                            query = query.filter(
-                                ~getattr(self.db_model, field).has()
-                            )
-                    else:
-                        # Apply a LIKE filter for string matching
-                        query = query.filter(
-                            getattr(self.db_model, field).like(
-                                f"%{str(value)}%"
-                            )
-                        )
-
-        if len(sort) == 2:
-            sort_field, sort_order = sort
-            # Make sure sort_field is a valid field
-            if not hasattr(self.db_model, sort_field):
-                raise ValueError(f"{sort_field} is not a valid field")
-
-            if sort_order == "ASC":
-                query = query.order_by(getattr(self.db_model, sort_field))
-            else:
-                query = query.order_by(
-                    getattr(self.db_model, sort_field).desc()
-                )
+        query = self.plan.filter(query, filter)
+
+        if cursor is not None:
+            sort_field, sort_order = (
+                sort if len(sort) == 2 else self.cursor_sort
+            )
+            # A 400 for unknown fields, before they are loaded
+            self.plan.sort_column(sort_field)
+            query = query.options(
+                *self.load_options(fields, (sort_field, "iterator"))
+            )
+            query = paginate_by_cursor(
+                query, self.db_model, sort_field, sort_order, cursor, page_size
+            )
+        else:
+            query = query.options(*self.load_options(fields))
+            query = self.plan.sort(query, sort)
 
-        if len(range):
+        if len(range) and cursor is None:
             start, end = range
             query = query.offset(start).limit(end - start)
 
-        res = await session.exec(query)
+        rows, total_count = await fetch_page(
+            session,
+            query,
+            self.count_query(user, filter),
+            window=cursor is None,
+            count_key=(
+                list_count_key(self.db_model)
+                if user.is_admin and not len(filter)
+                else None
+            ),
+        )
+
+        if response is not None:
+            if len(range) == 2 and cursor is None:
+                start, end = range
+            else:
+                start, end = [0, total_count]  # For content-range header
+
+            response.headers["Content-Range"] = (
+                f"sensor {start}-{end}/{total_count}"
+            )
 
-        return res.all()
+        if cursor is not None:
+            return next_cursor(
+                rows, sort_field, sort_order, page_size, response
+            )
+
+        return rows
 
     async def get_total_count(
         self,
@@ -164,57 +297,7 @@ class CRUD:
         filter = json.loads(filter) if filter else {}
         range = json.loads(range) if range else []
 
-        query = select(func.count(self.db_model.iterator))
-        if not user.is_admin:
-            query = query.where(self.db_model.owner == user.id)
-
-        if len(filter):
-            for field, value in filter.items():
-                if field in self.exact_match_fields:
-                    if isinstance(value, list):
-                        # Combine multiple filters with OR
-                        or_conditions = []
-                        for v in value:
-                            or_conditions.append(
-                                getattr(self.db_model, field) == v
-                            )
-
-                        query = query.filter(or_(*or_conditions))
-                    else:
-                        # If it's not a list, apply a simple equality filter
-                        query = query.filter(
-                            getattr(self.db_model, field) == value
-                        )
-                else:
-                    if isinstance(value, list):
-                        or_conditions = []
-                        for v in value:
-                            or_conditions.append(
-                                getattr(self.db_model, field).like(
-                                    f"%{str(v)}%"
-                                )
-                            )
-
-                        query = query.filter(or_(*or_conditions))
-                    elif isinstance(value, bool):
-                        if value is True:
-                            # If true, the field has a value and the value
-                            query = query.filter(
-                                getattr(self.db_model, field).has()
-                            )
-                        else:
-                            query = query.filter(
-                                ~getattr(self.db_model, field).has()
-                            )
-                    else:
-                        # Apply a LIKE filter for string matching
-                        query = query.filter(
-                            getattr(self.db_model, field).like(
-                                f"%{str(value)}%"
-                            )
-                        )
-
-        count = await session.exec(query)
+        count = await session.exec(self.count_query(user, filter))
         total_count = count.one()
 
         if len(range) == 2:
@@ -234,10 +317,13 @@ class CRUD:
         user: User,
         *,
         model_id: UUID,
+        fields: frozenset | None = None,
     ) -> Any:
-        """Get a model by id"""
+        """Get a model by id, with only the given fields loaded if any"""
 
-        query = select(self.db_model).where(self.db_model.id == model_id)
+        query = self.hide_deleted(
+            select(self.db_model).where(self.db_model.id == model_id)
+        ).options(*self.load_options(fields))
         if not user.is_admin:
             query = query.filter(self.db_model.owner == user.id)
 
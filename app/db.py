@@ -1,11 +1,12 @@
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import DDL, event
+from sqlmodel import SQLModel
 from app.config import config
 from typing import AsyncGenerator
 from cashews import cache
 
-
 engine = create_async_engine(
     config.DB_URL, echo=False, future=True, pool_pre_ping=True
 )
@@ -14,6 +15,17 @@ async_session = sessionmaker(
 )
 
 
+# The trigram indexes of the models need pg_trgm, for databases created
+# with create_all rather than the migrations (eg. in tests)
+event.listen(
+    SQLModel.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+        dialect="postgresql"
+    ),
+)
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session() as session:
         yield session
@@ -0,0 +1,256 @@
+"""Cascade deletion of input objects, submissions and transects
+
+Deletion happens in two steps. The request tombstones the row, and the rows
+that depend on it, by setting their deleted_utc, which hides them from the
+API, and queues a cascade_delete task. The task deletes their files from
+S3 in batches over paginated listings, reporting progress as events, then
+removes all of the rows in a single transaction. S3 deletes are idempotent,
+so a task that fails part way through is retried from the start.
+"""
+
+from app.config import config
+from app.db import AsyncSession
+from app.events.models import EventType
+from app.events.service import publish_event
+from app.objects.models import InputObject, InputObjectAssociations
+from app.objects.service import (
+    upload_keys,
+    delete_s3_keys,
+    S3_DELETE_BATCH_SIZE,
+)
+from app.query_cache import invalidate
+from app.status.service import (
+    record_storage_usage,
+    INPUTS_FOLDER,
+    OUTPUTS_FOLDER,
+)
+from app.submissions.models import Submission
+from app.submissions.outputs.models import SubmissionOutput
+from app.submissions.status.models import RunStatus
+from app.tasks.models import Task
+from app.tasks.service import register_task, enqueue
+from app.transects.models import Transect
+from botocore.exceptions import ClientError
+from collections import defaultdict
+from enum import Enum
+from sqlalchemy import func, or_
+from sqlmodel import select, update, delete
+from typing import Any
+from uuid import UUID
+import datetime
+
+
+class DeletionResource(str, Enum):
+    INPUT_OBJECT = "input_object"
+    SUBMISSION = "submission"
+    TRANSECT = "transect"
+
+
+# Models of the rows tombstoned with each resource
+TOMBSTONED_MODELS = {
+    DeletionResource.TRANSECT: (Transect, InputObject, Submission),
+    DeletionResource.SUBMISSION: (Submission,),
+    DeletionResource.INPUT_OBJECT: (InputObject,),
+}
+
+
+async def request_deletion(
+    session: AsyncSession,
+    resource: DeletionResource,
+    id: UUID,
+) -> Task:
+    """Tombstone a resource and what depends on it, and queue its deletion
+
+    The tombstones and the task are committed together.
+    """
+
+    now = datetime.datetime.now()
+    if resource == DeletionResource.TRANSECT:
+        for model, column in (
+            (Transect, Transect.id),
+            (InputObject, InputObject.transect_id),
+            (Submission, Submission.transect_id),
+        ):
+            await session.exec(
+                update(model).where(column == id).values(deleted_utc=now)
+            )
+    elif resource == DeletionResource.SUBMISSION:
+        await session.exec(
+            update(Submission)
+            .where(Submission.id == id)
+            .values(deleted_utc=now)
+        )
+    else:
+        await session.exec(
+            update(InputObject)
+            .where(InputObject.id == id)
+            .values(deleted_utc=now)
+        )
+
+    task = await enqueue(
+        session,
+        "cascade_delete",
+        {"resource": resource.value, "id": str(id)},
+    )
+    await invalidate(*TOMBSTONED_MODELS[resource])
+
+    return task
+
+
+@register_task("cascade_delete")
+async def cascade_delete(
+    resource: str,
+    id: str,
+    session: AsyncSession,
+    s3: Any,
+) -> None:
+    """Delete the S3 files and the rows of a tombstoned resource"""
+
+    resource = DeletionResource(resource)
+
+    owner = None
+    object_filter = submission_filter = None
+    if resource == DeletionResource.TRANSECT:
+        res = await session.exec(
+            select(Transect.owner).where(Transect.id == id)
+        )
+        owner = res.one_or_none()
+        object_filter = InputObject.transect_id == id
+        submission_filter = Submission.transect_id == id
+    elif resource == DeletionResource.SUBMISSION:
+        submission_filter = Submission.id == id
+    else:
+        object_filter = InputObject.id == id
+
+    # Only the columns needed, rather than loading the relationships
+    objects = []
+    if object_filter is not None:
+        res = await session.exec(
+            select(
+                InputObject.id,
+                InputObject.owner,
+                InputObject.size_bytes,
+                InputObject.upload_id,
+                InputObject.all_parts_received,
+            ).where(object_filter)
+        )
+        objects = res.all()
+    submissions = []
+    if submission_filter is not None:
+        res = await session.exec(
+            select(Submission.id, Submission.owner).where(submission_filter)
+        )
+        submissions = res.all()
+
+    if owner is None and (objects or submissions):
+        owner = (objects or submissions)[0].owner
+
+    keys_deleted = 0
+
+    async def report_progress(completed: bool = False) -> None:
+        await publish_event(
+            EventType.DELETION,
+            id,
+            owner,
+            resource=resource.value,
+            keys_deleted=keys_deleted,
+            completed=completed,
+        )
+
+    # Uploads, including the parts of unfinished multipart uploads
+    for obj in objects:
+        if obj.upload_id and not obj.all_parts_received:
+            try:
+                await s3.abort_multipart_upload(
+                    Bucket=config.S3_BUCKET_ID,
+                    Key=upload_keys(obj.id)[0],
+                    UploadId=obj.upload_id,
+                )
+            except ClientError:
+                pass
+    keys = [key for obj in objects for key in upload_keys(obj.id)]
+    for i in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+        batch = keys[i : i + S3_DELETE_BATCH_SIZE]
+        await delete_s3_keys(s3, batch)
+        keys_deleted += len(batch)
+        await report_progress()
+
+    # Outputs and their previews, a page of a listing at a time
+    paginator = s3.get_paginator("list_objects_v2")
+    for submission in submissions:
+        for folder in ("outputs", "previews"):
+            async for page in paginator.paginate(
+                Bucket=config.S3_BUCKET_ID,
+                Prefix=f"{config.S3_PREFIX}/{folder}/{str(submission.id)}/",
+                PaginationConfig={"PageSize": S3_DELETE_BATCH_SIZE},
+            ):
+                batch = [obj["Key"] for obj in page.get("Contents", [])]
+                if batch:
+                    await delete_s3_keys(s3, batch)
+                    keys_deleted += len(batch)
+                    await report_progress()
+
+    # Release the storage usage of the owners
+    usage: dict[tuple[str, UUID], list[int]] = defaultdict(lambda: [0, 0])
+    for obj in objects:
+        usage[(INPUTS_FOLDER, obj.owner)][0] -= 1
+        usage[(INPUTS_FOLDER, obj.owner)][1] -= obj.size_bytes or 0
+
+    object_ids = [obj.id for obj in objects]
+    submission_ids = [submission.id for submission in submissions]
+    if submission_ids:
+        res = await session.exec(
+            select(
+                Submission.owner,
+                func.count(SubmissionOutput.id),
+                func.coalesce(func.sum(SubmissionOutput.size_bytes), 0),
+            )
+            .join(
+                SubmissionOutput,
+                SubmissionOutput.submission_id == Submission.id,
+            )
+            .where(Submission.id.in_(submission_ids))
+            .group_by(Submission.owner)
+        )
+        for submission_owner, object_count, size_bytes in res.all():
+            usage[(OUTPUTS_FOLDER, submission_owner)][0] -= object_count
+            usage[(OUTPUTS_FOLDER, submission_owner)][1] -= size_bytes
+
+    for (folder, usage_owner), (object_count, size_bytes) in usage.items():
+        await record_storage_usage(
+            session, folder, usage_owner, object_count, size_bytes
+        )
+
+    # All of the rows go in one transaction
+    await session.exec(
+        delete(InputObjectAssociations).where(
+            or_(
+                InputObjectAssociations.input_object_id.in_(object_ids),
+                InputObjectAssociations.submission_id.in_(submission_ids),
+            )
+        )
+    )
+    await session.exec(
+        delete(RunStatus).where(RunStatus.submission_id.in_(submission_ids))
+    )
+    await session.exec(
+        delete(SubmissionOutput).where(
+            SubmissionOutput.submission_id.in_(submission_ids)
+        )
+    )
+    await session.exec(
+        delete(Submission).where(Submission.id.in_(submission_ids))
+    )
+    await session.exec(
+        delete(InputObject).where(InputObject.id.in_(object_ids))
+    )
+    if resource == DeletionResource.TRANSECT:
+        await session.exec(delete(Transect).where(Transect.id == id))
+    await session.commit()
+    await invalidate(*TOMBSTONED_MODELS[resource])
+
+    print(
+        f"Deleted {resource.value} {id}: {len(object_ids)} input objects, "
+        f"{len(submission_ids)} submissions and {keys_deleted} S3 keys"
+    )
+    await report_progress(completed=True)
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Any
+from uuid import UUID
+from enum import Enum
+
+
+class EventType(str, Enum):
+    INPUT_OBJECT = "input_object"
+    RUN_STATUS = "run_status"
+    DELETION = "deletion"
+
+
+class Event(BaseModel):
+    """A change pushed to clients subscribed to the event stream"""
+
+    type: EventType
+    id: UUID  # ID of the resource the event is about
+    owner: UUID | None = None
+    data: dict[str, Any] = {}
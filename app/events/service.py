@@ -0,0 +1,122 @@
+"""Publishing and fan-out of events over Redis pub/sub
+
+Events are published to a Redis channel so that every API replica receives
+them. Each replica holds a single subscription to the channel and passes
+the events on to the queues of its connected clients.
+
+Publishing is best-effort: a failure to publish is logged and ignored, as
+clients can always fall back to reading the resource. Events are only
+published on changes, and frequent ones (eg. upload progress) are
+throttled with event_due.
+"""
+
+from app.config import config
+from app.events.models import Event, EventType
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator
+from uuid import UUID
+import asyncio
+import redis.asyncio as redis
+
+_redis: redis.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+
+    if _redis is None:
+        _redis = redis.Redis(
+            host=config.CACHE_URL,
+            port=config.CACHE_PORT,
+            db=config.CACHE_DB,
+            password=config.CACHE_PASSWORD,
+        )
+
+    return _redis
+
+
+def events_channel() -> str:
+    # Prefixed by deployment, as the Redis instance may be shared
+    return f"{config.S3_PREFIX}:events"
+
+
+async def publish_event(
+    type: EventType,
+    id: UUID | str,
+    owner: UUID | str | None,
+    **data: Any,
+) -> None:
+    event = Event(type=type, id=id, owner=owner, data=data)
+    try:
+        await get_redis().publish(events_channel(), event.model_dump_json())
+    except Exception as e:
+        print(f"Failed to publish {type.value} event for {id}: {e}")
+
+
+async def event_due(key: str, interval_seconds: float) -> bool:
+    """Whether an event of key is due, at most once per interval
+
+    Shared by all replicas through Redis. If Redis cannot be reached, the
+    event is due (and its publishing will fail in turn).
+    """
+
+    try:
+        return bool(
+            await get_redis().set(
+                f"{events_channel()}:due:{key}",
+                1,
+                nx=True,
+                px=int(interval_seconds * 1000),
+            )
+        )
+    except Exception as e:
+        print(f"Failed to throttle {key} events: {e}")
+        return True
+
+
+class EventBroker:
+    """Single Redis subscription per process, fanned out to client queues"""
+
+    def __init__(self) -> None:
+        self.subscribers: set[asyncio.Queue] = set()
+        self._listener: asyncio.Task | None = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = get_redis().pubsub()
+                await pubsub.subscribe(events_channel())
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = Event.model_validate_json(message["data"])
+                    for queue in list(self.subscribers):
+                        try:
+                            queue.put_nowait(event)
+                        except asyncio.QueueFull:
+                            pass  # Slow client, drop rather than buffer
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncGenerator[asyncio.Queue, None]:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+        queue = asyncio.Queue(maxsize=config.EVENTS_CLIENT_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self.subscribers.discard(queue)
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+
+broker = EventBroker()
@@ -0,0 +1,68 @@
+from fastapi import Depends, APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from app.events.models import Event, EventType
+from app.events.service import broker
+from app.users.models import User
+from app.auth.services import get_user_info
+from app.config import config
+from typing import AsyncGenerator
+from uuid import UUID
+import asyncio
+
+router = APIRouter()
+
+
+def is_visible(
+    event: Event,
+    user: User,
+    types: list[EventType] | None,
+    ids: list[UUID] | None,
+) -> bool:
+    if not user.is_admin and str(event.owner) != user.id:
+        return False
+    if types and event.type not in types:
+        return False
+    if ids and event.id not in ids:
+        return False
+
+    return True
+
+
+@router.get("", response_class=StreamingResponse)
+async def get_event_stream(
+    request: Request,
+    user: User = Depends(get_user_info),
+    *,
+    type: list[EventType] | None = Query(None),
+    id: list[UUID] | None = Query(None),
+) -> StreamingResponse:
+    """Server-Sent Events stream of upload progress and job state changes
+
+    Replaces polling the objects and submissions endpoints. Users receive
+    events about their own resources only, admins receive all. Optionally
+    narrowed to event types and resource IDs.
+    """
+
+    async def stream() -> AsyncGenerator[str, None]:
+        async with broker.subscribe() as queue:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=config.EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Comment line to keep proxies from closing the stream
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if is_visible(event, user, type, id):
+                    yield (
+                        f"event: {event.type.value}\n"
+                        f"data: {event.model_dump_json()}\n\n"
+                    )
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,157 @@
+"""Sparse fieldsets: the fields param of the list and detail endpoints
+
+fields=id,name,transect asks for only those fields of a read model (the id
+is always included). The query then loads only the columns of those fields
+(load_only) and the relationships among them, and the rows are validated
+into a sparse read model: a subclass of the read model in which the fields
+that were not asked for are optional and never serialized.
+
+Sparse read models are created once per set of fields, and pickle by their
+read model and fields so that they can be kept in the query cache.
+"""
+
+from fastapi import HTTPException
+from pydantic import Field, create_model
+from sqlalchemy.orm import load_only
+from typing import Any, ClassVar, Optional
+import functools
+
+ALWAYS_INCLUDED = frozenset({"id"})
+
+
+def restore_sparse(read_model: Any, fields: frozenset, state: dict) -> Any:
+    model = sparse_model(read_model, fields)
+    obj = model.__new__(model)
+    obj.__setstate__(state)
+
+    return obj
+
+
+class SparseReadModel:
+    sparse_read_model: ClassVar[Any]
+    sparse_fields: ClassVar[frozenset]
+
+    def __reduce__(self) -> tuple:
+        return (
+            restore_sparse,
+            (self.sparse_read_model, self.sparse_fields, self.__getstate__()),
+        )
+
+
+@functools.cache
+def sparse_model(read_model: Any, fields: frozenset) -> Any:
+    """The read model with only fields serialized"""
+
+    model = create_model(
+        f"{read_model.__name__}Sparse",
+        __base__=(SparseReadModel, read_model),
+        **{
+            name: (Optional[info.annotation], Field(None, exclude=True))
+            for name, info in read_model.model_fields.items()
+            if name not in fields
+        },
+    )
+    model.sparse_read_model = read_model
+    model.sparse_fields = fields
+
+    return model
+
+
+class Fieldset:
+    """Fields of a read model and how to load them from its table model
+
+    relationships are the loader options of each relationship field (see
+    app.loaders), and depends the further columns that fields are computed
+    from, eg. by the validators of the read model. Those columns are loaded
+    and validated along with the fields, but not serialized.
+    """
+
+    def __init__(
+        self,
+        db_model: Any,
+        read_model: Any,
+        relationships: dict[str, tuple],
+        depends: dict[str, tuple[str, ...]] | None = None,
+    ):
+        self.db_model = db_model
+        self.read_model = read_model
+        self.relationships = relationships
+        self.depends = depends or {}
+        self.columns = frozenset(db_model.__table__.columns.keys())
+
+    def parse(self, fields: str | None) -> frozenset | None:
+        """The fields asked for, or None for all of them"""
+
+        if not fields:
+            return None
+
+        parsed = frozenset(
+            field.strip() for field in fields.split(",") if field.strip()
+        )
+        for field in parsed - self.read_model.model_fields.keys():
+            raise HTTPException(
+                status_code=400, detail=f"{field} is not a valid field"
+            )
+
+        return parsed | ALWAYS_INCLUDED
+
+    def dependencies(self, fields: frozenset) -> set[str]:
+        return {
+            column
+            for field in fields
+            for column in self.depends.get(field, ())
+        }
+
+    def load_options(
+        self,
+        fields: frozenset | None = None,
+        required: tuple[str, ...] = (),
+    ) -> tuple:
+        """Loader options for fields, and the required columns
+
+        eg. the sort column for paginating by cursor
+        """
+
+        if fields is None:
+            return tuple(
+                option
+                for options in self.relationships.values()
+                for option in options
+            )
+
+        columns = (fields & self.columns) | self.dependencies(fields)
+        columns |= set(required)
+
+        return (
+            load_only(
+                *[
+                    getattr(self.db_model, column)
+                    for column in sorted(columns)
+                ],
+                raiseload=True,
+            ),
+            *[
+                option
+                for field in sorted(fields & self.relationships.keys())
+                for option in self.relationships[field]
+            ],
+        )
+
+    def model(self, fields: frozenset | None) -> Any:
+        if fields is None:
+            return self.read_model
+
+        return sparse_model(self.read_model, fields)
+
+    def validate(self, row: Any, fields: frozenset | None) -> Any:
+        """Validate a row loaded with load_options(fields)"""
+
+        if fields is None:
+            return self.read_model.model_validate(row)
+
+        attributes = fields & (self.columns | self.relationships.keys())
+        attributes |= self.dependencies(fields)
+
+        return self.model(fields).model_validate(
+            {attribute: getattr(row, attribute) for attribute in attributes}
+        )
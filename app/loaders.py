@@ -0,0 +1,150 @@
+"""Loading plans for the relationships serialized by the read models
+
+All relationships are declared lazy="raise", so nothing related to a row is
+loaded unless the endpoint asks for it, and a relationship that was not
+planned for fails loudly instead of querying once per row. Endpoints pass
+the plan of the read model they return to .options().
+
+Collections are loaded with selectinload, one further query for all of the
+rows of a page, and many-to-ones with joinedload, so the number of queries
+of a page is fixed whatever the size of the related data.
+
+The *_RESOURCES of each read model are the models whose writes can change
+it, for the generations of cached results (see app.query_cache). Writes to
+the associations of objects and submissions bump both of them, and writes
+to run statuses bump submissions.
+
+Tombstoned rows (see app.deletion) are left out of the relationships as
+well as the top-level queries, by the criteria of each plan: associations
+with a tombstoned object or submission, and tombstoned transects, inputs
+and submissions.
+
+The *_FIELDSET of each read model maps its relationship fields to their
+plans, for the fields param of the endpoints (see app.fieldsets).
+"""
+
+from app.fieldsets import Fieldset
+from app.objects.models import (
+    InputObject,
+    InputObjectAssociations,
+    InputObjectRead,
+)
+from app.submissions.models import Submission, SubmissionRead
+from app.submissions.status.models import RunStatus
+from app.transects.models import Transect, TransectRead
+from sqlalchemy import exists
+from sqlalchemy.orm import joinedload, selectinload
+
+# InputObjectRead: the object's associations and transect. Upload progress
+# is merged by the time of the last part of incomplete uploads
+INPUT_OBJECT_FIELDSET = Fieldset(
+    InputObject,
+    InputObjectRead,
+    {
+        "input_associations": (
+            selectinload(
+                InputObject.input_associations.and_(
+                    exists().where(
+                        Submission.id == InputObjectAssociations.submission_id,
+                        Submission.deleted_utc.is_(None),
+                    )
+                )
+            ),
+        ),
+        "transect": (
+            joinedload(
+                InputObject.transect.and_(Transect.deleted_utc.is_(None))
+            ),
+        ),
+    },
+    depends={
+        "processing_message": (
+            "all_parts_received",
+            "last_part_received_utc",
+        ),
+        "last_part_received_utc": ("all_parts_received",),
+    },
+)
+
+INPUT_OBJECT_READ = INPUT_OBJECT_FIELDSET.load_options()
+
+INPUT_OBJECT_READ_RESOURCES = (InputObject, Transect)
+
+# SubmissionRead: run statuses with their logs, the input objects of the
+# associations, and the transect. The file outputs are read from the
+# manifest of the submission and its owner's outputs (see get_submission)
+SUBMISSION_FIELDSET = Fieldset(
+    Submission,
+    SubmissionRead,
+    {
+        "run_status": (selectinload(Submission.run_status),),
+        "input_associations": (
+            selectinload(
+                Submission.input_associations.and_(
+                    exists().where(
+                        InputObject.id
+                        == InputObjectAssociations.input_object_id,
+                        InputObject.deleted_utc.is_(None),
+                    )
+                )
+            ).joinedload(InputObjectAssociations.input_object),
+        ),
+        "transect": (
+            joinedload(
+                Submission.transect.and_(Transect.deleted_utc.is_(None))
+            ),
+        ),
+    },
+    depends={
+        "file_outputs": ("owner", "percentage_covers"),
+        "percentage_covers": ("owner",),
+    },
+)
+
+SUBMISSION_READ = SUBMISSION_FIELDSET.load_options()
+
+SUBMISSION_READ_RESOURCES = (Submission, InputObject, Transect)
+
+# TransectRead: the input objects, and the submissions with the run
+# statuses of SubmissionReadSimple, leaving out their logs. The latitudes
+# and longitudes are those of the start and end of the geometry
+TRANSECT_FIELDSET = Fieldset(
+    Transect,
+    TransectRead,
+    {
+        "inputs": (
+            selectinload(
+                Transect.inputs.and_(InputObject.deleted_utc.is_(None))
+            ),
+        ),
+        "submissions": (
+            selectinload(
+                Transect.submissions.and_(Submission.deleted_utc.is_(None))
+            )
+            .selectinload(Submission.run_status)
+            .load_only(
+                RunStatus.id,
+                RunStatus.submission_id,
+                RunStatus.status,
+                RunStatus.is_running,
+                RunStatus.is_successful,
+                RunStatus.time_started,
+                RunStatus.last_updated,
+                raiseload=True,
+            ),
+        ),
+    },
+    depends={
+        field: ("geom",)
+        for field in (
+            "latitude_start",
+            "longitude_start",
+            "latitude_end",
+            "longitude_end",
+        )
+    },
+)
+
+TRANSECT_READ = TRANSECT_FIELDSET.load_options()
+
+TRANSECT_READ_RESOURCES = (Transect, InputObject, Submission)
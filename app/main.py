@@ -10,8 +10,24 @@ from app.status.views import router as status_router
 from app.transects.views import router as transects_router
 from app.users.views import router as users_router
 from app.root.views import router as root_router
+from app.events.views import router as events_router
+from app.search.views import router as search_router
+from app.events.service import broker
+from app.objects.service import open_s3_client, close_s3_client
+from app.processing import shutdown_process_pool
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_s3_client()
+    yield
+    await close_s3_client()
+    await broker.stop()
+    shutdown_process_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -55,6 +71,16 @@ app.include_router(
     prefix=f"{config.API_PREFIX}/users",
     tags=["users"],
 )
+app.include_router(
+    events_router,
+    prefix=f"{config.API_PREFIX}/events",
+    tags=["events"],
+)
+app.include_router(
+    search_router,
+    prefix=f"{config.API_PREFIX}/search",
+    tags=["search"],
+)
 app.include_router(
     submission_job_logs_router,
     prefix=f"{config.API_PREFIX}/submission_job_logs",
@@ -0,0 +1,25 @@
+"""Substring matching of text columns
+
+Filters and search match a value anywhere in a column with ILIKE, which
+the pg_trgm indexes serve. The LIKE wildcards of the value are escaped, so
+that "%" and "_" match themselves.
+"""
+
+from typing import Any
+
+LIKE_ESCAPE = "\\"
+
+
+def like_pattern(q: str) -> str:
+    """Match q anywhere, with its LIKE wildcards taken literally"""
+
+    for char in (LIKE_ESCAPE, "%", "_"):
+        q = q.replace(char, f"{LIKE_ESCAPE}{char}")
+
+    return f"%{q}%"
+
+
+def contains(column: Any, value: Any) -> Any:
+    """Case-insensitive match of value anywhere in column"""
+
+    return column.ilike(like_pattern(str(value)), escape=LIKE_ESCAPE)
@@ -1,15 +1,20 @@
 from app.users.models import User
 from app.objects.models import InputObject
 from app.config import config
-from fastapi import HTTPException, status, BackgroundTasks
+from fastapi import HTTPException, status
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlmodel import update, select
-from app.objects.utils import (
-    generate_video_statistics,
-    delete_incomplete_object,
+from sqlmodel import update, select, delete
+from app.tasks.service import enqueue
+from app.query_cache import invalidate
+from app.objects.progress import record_upload_progress, progress_message
+from app.events.service import event_due, publish_event
+from app.events.models import EventType
+from app.status.service import (
+    record_storage_usage,
+    get_storage_quota,
+    INPUTS_FOLDER,
 )
-from aioboto3 import Session as S3Session
 import datetime
 
 
@@ -31,6 +36,21 @@ async def pre_create(
         )
     size_in_bytes = payload["Event"]["Upload"]["Size"]
 
+    # Reserve the size of the upload in the user's usage, rejecting it
+    # before any bytes are sent if it would exceed their quota
+    if not await record_storage_usage(
+        session,
+        INPUTS_FOLDER,
+        user.id,
+        object_count=1,
+        size_bytes=size_in_bytes or 0,
+        limit_bytes=get_storage_quota(user),
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Storage quota exceeded",
+        )
+
     object = InputObject(
         filename=filename,
         size_bytes=size_in_bytes,
@@ -44,6 +64,14 @@ async def pre_create(
 
     await session.commit()
     await session.refresh(object)
+    await invalidate(InputObject)
+    await publish_event(
+        EventType.INPUT_OBJECT,
+        object.id,
+        user.id,
+        processing_message=object.processing_message,
+        all_parts_received=False,
+    )
 
     s3_key = f"{config.INPUT_FOLDER_PREFIX}{str(object.id)}"
 
@@ -67,23 +95,22 @@ async def post_receive(
     size_in_bytes = payload["Event"]["Upload"]["Size"]
     offset = payload["Event"]["Upload"]["Offset"]
 
-    # Calculate the total uploaded percentage
-    uploaded_percentage = (offset / size_in_bytes) * 100
-
-    # Print the uploaded percentage
-    print(f"Upload progress: {uploaded_percentage:.2f}%")
+    # Progress is kept in the cache and written to the database in batches
+    await record_upload_progress(session, object_id, offset, size_in_bytes)
 
-    # Update the object
-    update_query = (
-        update(InputObject)
-        .where(InputObject.id == object_id)
-        .values(
-            processing_message=f"Upload progress: {uploaded_percentage:.2f}%",
-            last_part_received_utc=datetime.datetime.now(),
+    # tusd reports every chunk, clients are told at most once per interval
+    # and of the last chunk
+    if offset >= size_in_bytes or await event_due(
+        f"progress:{object_id}", config.EVENTS_PROGRESS_INTERVAL_SECONDS
+    ):
+        await publish_event(
+            EventType.INPUT_OBJECT,
+            object_id,
+            user.id,
+            processing_message=progress_message(offset, size_in_bytes),
+            offset=offset,
+            size_bytes=size_in_bytes,
         )
-    )
-    await session.exec(update_query)
-    await session.commit()
 
     # Respond with a 200 to acknowledge the request
     return JSONResponse(
@@ -114,6 +141,14 @@ async def pre_finish(
     )
     await session.exec(update_query)
     await session.commit()
+    await invalidate(InputObject)
+    await publish_event(
+        EventType.INPUT_OBJECT,
+        object_id,
+        user.id,
+        processing_message="Upload completed",
+        all_parts_received=True,
+    )
 
     # Respond with a 200 to acknowledge the request
     return JSONResponse(
@@ -125,8 +160,6 @@ async def post_create(
     session: Session,
     user: User,
     payload: dict,
-    s3: S3Session,
-    background_tasks: BackgroundTasks,
 ) -> JSONResponse:
     upload_id = payload["Event"]["Upload"]["ID"]
 
@@ -134,18 +167,31 @@ async def post_create(
     # Also the + separator between UUID and TUSd upload ID
     object_id = upload_id.split(config.INPUT_FOLDER_PREFIX)[1].split("+")[0]
 
-    # Update the object
+    # Keep the multipart upload ID so an abandoned upload can be aborted
+    multipart_upload_id = upload_id.split("+")[1] if "+" in upload_id else None
+
+    # Update the object. Stalled and abandoned uploads are handled by the
+    # sweep_incomplete_objects periodic task
     update_query = (
         update(InputObject)
         .where(InputObject.id == object_id)
         .values(
             processing_message="Upload started",
             last_part_received_utc=datetime.datetime.now(),
+            upload_id=multipart_upload_id,
         )
     )
     await session.exec(update_query)
     await session.commit()
-    background_tasks.add_task(delete_incomplete_object, object_id, s3, session)
+    await invalidate(InputObject)
+    await publish_event(
+        EventType.INPUT_OBJECT,
+        object_id,
+        user.id,
+        processing_message="Upload started",
+        all_parts_received=False,
+    )
+
     # Respond with a 200 to acknowledge the request
     return JSONResponse(status_code=200, content={"message": "Upload started"})
 
@@ -154,8 +200,6 @@ async def post_finish(
     session: Session,
     user: User,
     payload: dict,
-    s3: S3Session,
-    background_tasks: BackgroundTasks,
 ) -> JSONResponse:
     upload_id = payload["Event"]["Upload"]["ID"]
 
@@ -170,8 +214,19 @@ async def post_finish(
         query = select(InputObject).where(InputObject.id == object_id)
         res = await session.exec(query)
         obj = res.one_or_none()
-        await session.delete(obj)
+        await record_storage_usage(
+            session,
+            INPUTS_FOLDER,
+            obj.owner,
+            object_count=-1,
+            size_bytes=-(obj.size_bytes or 0),
+        )
+        await session.exec(delete(InputObject).where(InputObject.id == obj.id))
         await session.commit()
+        await invalidate(InputObject)
+        await publish_event(
+            EventType.INPUT_OBJECT, object_id, user.id, deleted=True
+        )
 
         # Respond with a 200 to acknowledge the request
         return JSONResponse(
@@ -190,9 +245,19 @@ async def post_finish(
     )
     await session.exec(update_query)
     await session.commit()
+    await invalidate(InputObject)
+    await publish_event(
+        EventType.INPUT_OBJECT,
+        object_id,
+        user.id,
+        processing_message="Upload completed",
+        all_parts_received=True,
+    )
 
-    background_tasks.add_task(
-        generate_video_statistics, object_id, s3, session
+    await enqueue(
+        session,
+        "generate_video_statistics",
+        {"input_object_id": object_id},
     )
     # Respond with a 200 to acknowledge the request
     return JSONResponse(
@@ -9,3 +9,9 @@ from .links import (  # noqa
     InputObjectAssociationsRead,
     InputObjectAssociationsUpdate,
 )
+
+# InputObject is only imported for type checking in .links, so resolve it
+# here for the read models that nest the associations (eg. SubmissionRead)
+InputObjectAssociationsRead.model_rebuild(
+    _types_namespace={"InputObject": InputObject}
+)
@@ -7,13 +7,15 @@ from sqlmodel import (
     Column,
     JSON,
     BigInteger,
+    Index,
+    text,
 )
 from uuid import uuid4, UUID
 from typing import Any, TYPE_CHECKING
 from app.objects.models.links import InputObjectAssociations
 from pydantic import model_validator
+from app.transects.geometry import geom_mapping
 from geoalchemy2 import WKBElement
-import shapely
 
 if TYPE_CHECKING:
     from app.submissions.models import Submission
@@ -26,7 +28,14 @@ class InputObjectBase(SQLModel):
     size_bytes: int | None = Field(
         default=None, sa_column=Column(BigInteger())
     )
-    hash_md5sum: str | None = Field(default=None)
+    hash_md5sum: str | None = Field(
+        default=None,
+        description=(
+            "MD5 of the video, set once its statistics are generated. "
+            "Empty if the video was uploaded in parts, unless "
+            "config.VIDEO_STATISTICS_FULL_MD5 is enabled"
+        ),
+    )
     notes: str | None = Field(default=None)
     upload_id: str | None = Field(default=None)
     fps: float | None = Field(default=None)
@@ -41,7 +50,29 @@ class InputObjectBase(SQLModel):
 
 
 class InputObject(InputObjectBase, table=True):
-    __table_args__ = (UniqueConstraint("id"),)
+    __table_args__ = (
+        UniqueConstraint("id"),
+        # Incomplete uploads are swept periodically by time of the last part
+        Index(
+            "ix_inputobject_incomplete_last_part_received_utc",
+            "last_part_received_utc",
+            postgresql_where=text("NOT all_parts_received"),
+        ),
+        # Keyset pagination of a user's objects by time added
+        Index(
+            "ix_inputobject_owner_time_added_utc_iterator",
+            "owner",
+            "time_added_utc",
+            "iterator",
+        ),
+        # Substring (ILIKE) filters and search, with pg_trgm
+        Index(
+            "ix_inputobject_filename_trgm",
+            "filename",
+            postgresql_using="gin",
+            postgresql_ops={"filename": "gin_trgm_ops"},
+        ),
+    )
     iterator: int = Field(
         default=None,
         nullable=False,
@@ -58,19 +89,21 @@ class InputObject(InputObjectBase, table=True):
         nullable=False,
         index=True,
     )
+    # Set when deletion is requested, until the deletion task removes the row
+    deleted_utc: datetime.datetime | None = Field(default=None, index=True)
 
     input_associations: list[InputObjectAssociations] = Relationship(
         back_populates="input_object",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
     submissions: list["Submission"] = Relationship(
         back_populates="inputs",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
         link_model=InputObjectAssociations,
     )
     transect: "Transect" = Relationship(
-        back_populates="inputs", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="inputs", sa_relationship_kwargs={"lazy": "raise"}
     )
 
     parts: list[dict[str, Any]] = Field(default=[], sa_column=Column(JSON))
@@ -100,9 +133,8 @@ class TransectRead(SQLModel):
 
         if isinstance(values.geom, WKBElement):
             if values.geom is not None:
-                shapely_obj = shapely.wkb.loads(str(values.geom))
-                if shapely_obj is not None:
-                    mapping = shapely.geometry.mapping(shapely_obj)
+                mapping = geom_mapping(values.geom)
+                if mapping is not None:
                     values.latitude_start = mapping["coordinates"][0][1]
                     values.longitude_start = mapping["coordinates"][0][0]
                     values.latitude_end = mapping["coordinates"][-1][1]
@@ -47,12 +47,12 @@ class InputObjectAssociations(InputObjectAssociationsBase, table=True):
 
     submission: "Submission" = Relationship(
         back_populates="input_associations",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
     input_object: "InputObject" = Relationship(
         back_populates="input_associations",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
 
@@ -0,0 +1,217 @@
+"""Header-only probing of MP4 videos stored in S3
+
+Rather than downloading a whole video to read its statistics, only the
+`moov` box is fetched with ranged GET requests. The top-level boxes are
+walked by reading their headers, so the `moov` box is found whether it is
+at the start (faststart) or at the end of the file.
+"""
+
+from app.config import config
+from typing import Any, Iterator
+import struct
+
+
+# Upper bound of top-level boxes to walk before giving up on a file
+MAX_TOP_LEVEL_BOXES = 64
+
+
+class ProbeError(Exception):
+    """Raised when a file cannot be probed from its headers alone"""
+
+
+def iter_boxes(
+    data: bytes,
+    start: int = 0,
+    end: int | None = None,
+) -> Iterator[tuple[bytes, int, int]]:
+    """Yield (type, payload start, box end) for each box in data[start:end]"""
+
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[offset : offset + 8])
+        header_size = 8
+        if size == 1:  # 64-bit size follows the type
+            if offset + 16 > end:
+                raise ProbeError(f"Truncated header for box {box_type!r}")
+            size = struct.unpack(">Q", data[offset + 8 : offset + 16])[0]
+            header_size = 16
+        elif size == 0:  # Box extends to the end of its container
+            size = end - offset
+
+        if size < header_size or offset + size > end:
+            raise ProbeError(f"Invalid size for box {box_type!r}")
+
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def find_box(
+    data: bytes,
+    path: list[bytes],
+    start: int = 0,
+    end: int | None = None,
+) -> tuple[int, int] | None:
+    """Find the payload bounds of the first box following the path of types
+
+    eg. [b"mdia", b"minf", b"stbl"] from the payload of a trak box
+    """
+
+    for box_type, payload_start, box_end in iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload_start, box_end
+            return find_box(data, path[1:], payload_start, box_end)
+
+    return None
+
+
+def parse_moov(moov: bytes) -> tuple[float, int, float]:
+    """Get the (fps, frame count, duration) of the video track in a moov box
+
+    The payload of the moov box is expected, without its header. Frame count
+    comes from the sample-to-time table (stts), falling back to the sample
+    size table (stsz), and fps from the media header (mdhd) duration.
+    """
+
+    for box_type, trak_start, trak_end in iter_boxes(moov):
+        if box_type != b"trak":
+            continue
+
+        hdlr = find_box(moov, [b"mdia", b"hdlr"], trak_start, trak_end)
+        if not hdlr or moov[hdlr[0] + 8 : hdlr[0] + 12] != b"vide":
+            continue
+
+        mdhd = find_box(moov, [b"mdia", b"mdhd"], trak_start, trak_end)
+        if not mdhd:
+            raise ProbeError("Video track has no media header")
+        mdhd_start = mdhd[0]
+        if moov[mdhd_start] == 1:
+            timescale, duration = struct.unpack(
+                ">IQ", moov[mdhd_start + 20 : mdhd_start + 32]
+            )
+        else:
+            timescale, duration = struct.unpack(
+                ">II", moov[mdhd_start + 12 : mdhd_start + 20]
+            )
+
+        stbl = find_box(
+            moov, [b"mdia", b"minf", b"stbl"], trak_start, trak_end
+        )
+        if not stbl:
+            raise ProbeError("Video track has no sample table")
+
+        frame_count = 0
+        stts = find_box(moov, [b"stts"], *stbl)
+        stsz = find_box(moov, [b"stsz"], *stbl)
+        if stts:
+            (entry_count,) = struct.unpack(
+                ">I", moov[stts[0] + 4 : stts[0] + 8]
+            )
+            entries = moov[stts[0] + 8 : stts[0] + 8 + entry_count * 8]
+            frame_count = sum(
+                sample_count
+                for sample_count, _ in struct.iter_unpack(">II", entries)
+            )
+        elif stsz:
+            (frame_count,) = struct.unpack(
+                ">I", moov[stsz[0] + 8 : stsz[0] + 12]
+            )
+
+        # Fragmented files keep their samples outside of the moov box
+        if not frame_count or not timescale or not duration:
+            raise ProbeError("Video track has no samples in the moov box")
+
+        fps = round(frame_count * timescale / duration, 2)
+        duration_seconds = round(frame_count / fps, 2)
+
+        return fps, frame_count, duration_seconds
+
+    raise ProbeError("No video track found")
+
+
+async def read_range(
+    s3: Any,
+    key: str,
+    start: int,
+    end: int,
+) -> tuple[bytes, int]:
+    """Read the inclusive byte range of an S3 object
+
+    Returns the bytes read and the total size of the object
+    """
+
+    response = await s3.get_object(
+        Bucket=config.S3_BUCKET_ID,
+        Key=key,
+        Range=f"bytes={start}-{end}",
+    )
+    data = await response["Body"].read()
+
+    if response.get("ContentRange"):
+        total_size = int(response["ContentRange"].split("/")[-1])
+    else:  # Range was ignored and the whole object returned
+        total_size = len(data)
+
+    return data, total_size
+
+
+async def probe_s3_mp4(
+    s3: Any,
+    key: str,
+) -> tuple[float, int, float]:
+    """Get the (fps, frame count, duration) of an MP4 in S3 from its moov box
+
+    Raises ProbeError if the file is not an MP4 that can be read this way,
+    in which case the caller should fall back to the full file.
+    """
+
+    head, total_size = await read_range(
+        s3, key, 0, config.VIDEO_PROBE_HEAD_BYTES - 1
+    )
+
+    offset = 0
+    for _ in range(MAX_TOP_LEVEL_BOXES):
+        if offset + 8 > total_size:
+            break
+
+        # Use the bytes we already have, otherwise fetch just the header
+        if offset + 16 <= len(head):
+            header = head[offset : offset + 16]
+        else:
+            header, _ = await read_range(
+                s3, key, offset, min(offset + 15, total_size - 1)
+            )
+
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if box_size == 1:
+            if len(header) < 16:
+                raise ProbeError(f"Truncated header for box {box_type!r}")
+            box_size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = total_size - offset
+
+        if offset == 0 and box_type != b"ftyp":
+            raise ProbeError("File does not start with an ftyp box")
+        if box_size < header_size:
+            raise ProbeError(f"Invalid size for box {box_type!r}")
+
+        if box_type == b"moov":
+            if box_size > config.VIDEO_PROBE_MAX_MOOV_BYTES:
+                raise ProbeError("moov box is too large to probe")
+            if offset + box_size <= len(head):
+                moov = head[offset : offset + box_size]
+            else:
+                moov, _ = await read_range(
+                    s3, key, offset, offset + box_size - 1
+                )
+            if len(moov) < box_size:
+                raise ProbeError("Truncated moov box")
+
+            return parse_moov(moov[header_size:])
+
+        offset += box_size
+
+    raise ProbeError("No moov box found")
@@ -0,0 +1,142 @@
+"""Write-behind of tus upload progress
+
+tusd reports progress for every chunk it receives. Rather than updating the
+object row each time, the latest progress of each upload is kept in the
+Redis cache and written to the database periodically by the workers, all
+uploads in a single UPDATE. Reads merge in any progress not yet written.
+
+If the cache is disabled, progress is written straight to the database.
+"""
+
+from app.config import config
+from app.db import AsyncSession
+from app.objects.models import InputObject, InputObjectRead
+from app.query_cache import invalidate
+from app.tasks.service import register_periodic
+from cashews import cache
+from sqlalchemy import DateTime, String, Uuid, column, values
+from sqlmodel import update
+from typing import Any
+from uuid import UUID
+import datetime
+
+PROGRESS_KEY_PREFIX = "upload:progress:"
+
+
+def progress_message(offset: int, size_bytes: int) -> str:
+    uploaded_percentage = (offset / size_bytes) * 100 if size_bytes else 0
+
+    return f"Upload progress: {uploaded_percentage:.2f}%"
+
+
+async def record_upload_progress(
+    session: AsyncSession,
+    object_id: UUID | str,
+    offset: int,
+    size_bytes: int,
+) -> None:
+    """Keep the latest progress of an upload until the next flush"""
+
+    progress = {
+        "processing_message": progress_message(offset, size_bytes),
+        "last_part_received_utc": datetime.datetime.now(),
+    }
+
+    if cache.is_enable():
+        # Expire well after the next flush, in case no worker is running
+        await cache.set(
+            f"{PROGRESS_KEY_PREFIX}{object_id}",
+            progress,
+            expire=max(60, 10 * config.UPLOAD_PROGRESS_FLUSH_INTERVAL_SECONDS),
+        )
+        return
+
+    await session.exec(
+        update(InputObject)
+        .where(InputObject.id == object_id)
+        .values(**progress)
+    )
+    await session.commit()
+    await invalidate(InputObject)
+
+
+async def merge_upload_progress(
+    objects: list[InputObjectRead],
+) -> list[InputObjectRead]:
+    """Apply unflushed progress to incomplete uploads being read
+
+    Objects of sparse fieldsets without the progress (see app.fieldsets)
+    have no all_parts_received, and are left as they are.
+    """
+
+    incomplete = [obj for obj in objects if obj.all_parts_received is False]
+    if not incomplete or not cache.is_enable():
+        return objects
+
+    progress = await cache.get_many(
+        *[f"{PROGRESS_KEY_PREFIX}{obj.id}" for obj in incomplete]
+    )
+    for obj, obj_progress in zip(incomplete, progress):
+        if obj_progress and (
+            obj.last_part_received_utc is None
+            or obj_progress["last_part_received_utc"]
+            > obj.last_part_received_utc
+        ):
+            obj.processing_message = obj_progress["processing_message"]
+            obj.last_part_received_utc = obj_progress["last_part_received_utc"]
+
+    return objects
+
+
+@register_periodic(
+    "flush_upload_progress", config.UPLOAD_PROGRESS_FLUSH_INTERVAL_SECONDS
+)
+async def flush_upload_progress(
+    session: AsyncSession,
+    s3: Any,
+) -> None:
+    """Write the progress of all uploads in the cache in one UPDATE"""
+
+    if not cache.is_enable():
+        return
+
+    rows = []
+    async for key, progress in cache.get_match(f"{PROGRESS_KEY_PREFIX}*"):
+        if progress:
+            rows.append(
+                (
+                    UUID(key.split(PROGRESS_KEY_PREFIX)[-1]),
+                    progress["processing_message"],
+                    progress["last_part_received_utc"],
+                )
+            )
+
+    if not rows:
+        return
+
+    progress_values = values(
+        column("id", Uuid),
+        column("processing_message", String),
+        column("last_part_received_utc", DateTime),
+        name="progress",
+    ).data(rows)
+
+    # Only move forward, and never overwrite the state of finished uploads
+    await session.exec(
+        update(InputObject)
+        .where(InputObject.id == progress_values.c.id)
+        .where(InputObject.all_parts_received.is_(False))
+        .where(
+            (InputObject.last_part_received_utc.is_(None))
+            | (
+                InputObject.last_part_received_utc
+                < progress_values.c.last_part_received_utc
+            )
+        )
+        .values(
+            processing_message=progress_values.c.processing_message,
+            last_part_received_utc=progress_values.c.last_part_received_utc,
+        )
+    )
+    await session.commit()
+    await invalidate(InputObject)
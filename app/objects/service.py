@@ -1,72 +1,193 @@
 from app.config import config
 import aioboto3
+import asyncio
+import hashlib
+import os
+from aiobotocore.config import AioConfig
 from typing import Any, AsyncGenerator
+from uuid import UUID
 from app.objects.models import S3Object
-from app.status.models import StatusRead, S3Status
-from cashews import cache
+import tempfile
+from contextlib import asynccontextmanager, AsyncExitStack
 
+# Maximum number of keys accepted by a single DeleteObjects request
+S3_DELETE_BATCH_SIZE = 1000
 
-async def get_s3() -> AsyncGenerator[aioboto3.Session, None]:
-    session = aioboto3.Session()
-    async with session.client(
-        "s3",
-        aws_access_key_id=config.S3_ACCESS_KEY,
-        aws_secret_access_key=config.S3_SECRET_KEY,
-        endpoint_url=f"https://{config.S3_URL}",
-    ) as client:
-        yield client
-
-
-@cache.early(ttl="30s", early_ttl="10s", key="s3:status")
-async def get_s3_status():
-    s3_status = False
-    s3_local = S3Status()
-
-    session = aioboto3.Session()
-    async with session.client(
-        "s3",
-        aws_access_key_id=config.S3_ACCESS_KEY,
-        aws_secret_access_key=config.S3_SECRET_KEY,
-        endpoint_url=f"https://{config.S3_URL}",
-    ) as s3:
-        print("Fetching S3 status...")
-        # Get total usage (items, size) for inputs, outputs
-        s3_local = S3Status()
+# The S3 client shared by all requests and tasks of the process. Its
+# connection pool keeps TLS connections to S3 alive between requests.
+_s3_client: Any = None
+_s3_exit_stack: AsyncExitStack | None = None
+_s3_lock = asyncio.Lock()
 
-        try:
-            # Get input usage (items, size) for all input objects
-            response = await s3.list_objects_v2(
-                Bucket=config.S3_BUCKET_ID,
-                Prefix=f"{config.S3_PREFIX}/inputs/",
-            )
 
-            if response.get("Contents"):
-                s3_local.input_object_count = len(response.get("Contents"))
-                for obj in response.get("Contents"):
-                    s3_local.input_size += obj.get("Size")
+async def open_s3_client() -> Any:
+    """Create the shared S3 client, if it does not exist yet
 
-            # Get total usage (items, size) for outputs
-            response = await s3.list_objects_v2(
-                Bucket=config.S3_BUCKET_ID,
-                Prefix=f"{config.S3_PREFIX}/outputs/",
-            )
-            if response.get("Contents"):
-                s3_local.output_object_count = len(response.get("Contents"))
-                for obj in response.get("Contents"):
-                    s3_local.output_size += obj.get("Size")
-
-            # Get total usage (items, size) for all objects
-            response = await s3.list_objects_v2(
-                Bucket=config.S3_BUCKET_ID,
-                Prefix=f"{config.S3_PREFIX}/",
+    Called from the application lifespan at startup. Safe to call again,
+    in which case the existing client is returned.
+    """
+
+    global _s3_client, _s3_exit_stack
+
+    async with _s3_lock:
+        if _s3_client is None:
+            exit_stack = AsyncExitStack()
+            session = aioboto3.Session()
+            _s3_client = await exit_stack.enter_async_context(
+                session.client(
+                    "s3",
+                    aws_access_key_id=config.S3_ACCESS_KEY,
+                    aws_secret_access_key=config.S3_SECRET_KEY,
+                    endpoint_url=f"https://{config.S3_URL}",
+                    config=AioConfig(
+                        max_pool_connections=config.S3_MAX_POOL_CONNECTIONS,
+                        tcp_keepalive=True,
+                        connector_args={
+                            "keepalive_timeout": (
+                                config.S3_KEEPALIVE_TIMEOUT_SECONDS
+                            ),
+                        },
+                    ),
+                )
             )
-            if response.get("Contents"):
-                s3_local.total_object_count = len(response.get("Contents"))
-                for obj in response.get("Contents"):
-                    s3_local.total_size += obj.get("Size")
-            s3_status = True
+            _s3_exit_stack = exit_stack
+
+    return _s3_client
+
+
+async def close_s3_client() -> None:
+    """Close the shared S3 client and its connections, at shutdown"""
+
+    global _s3_client, _s3_exit_stack
+
+    async with _s3_lock:
+        if _s3_exit_stack is not None:
+            await _s3_exit_stack.aclose()
+        _s3_client = None
+        _s3_exit_stack = None
+
+
+@asynccontextmanager
+async def s3_client() -> AsyncGenerator[aioboto3.Session, None]:
+    """Shared S3 client for use outside of the API (eg. workers)
+
+    The client is closed when the context exits.
+    """
+
+    try:
+        yield await open_s3_client()
+    finally:
+        await close_s3_client()
+
+
+async def get_s3() -> AsyncGenerator[aioboto3.Session, None]:
+    # The client is opened in the lifespan, this only reuses it
+    yield await open_s3_client()
+
+
+def upload_keys(input_object_id: UUID | str) -> list[str]:
+    """All keys tusd may have written to S3 for an upload"""
+
+    key = f"{config.S3_PREFIX}/{config.INPUT_FOLDER_PREFIX}{input_object_id}"
 
+    return [key, f"{key}.info", f"{key}.part"]
+
+
+async def presigned_download_url(
+    s3: Any,
+    key: str,
+    filename: str,
+    expires_in: int,
+    disposition: str = "attachment",
+) -> str:
+    """Presigned GET URL of an object, served with the given disposition"""
+
+    return await s3.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": config.S3_BUCKET_ID,
+            "Key": key,
+            "ResponseContentDisposition": (
+                f'{disposition}; filename="{filename}"'
+            ),
+        },
+        ExpiresIn=expires_in,
+    )
+
+
+async def download_to_scratch(
+    s3: Any,
+    key: str,
+    suffix: str = "",
+) -> str:
+    """Stream an S3 object to a scratch file
+
+    The body is read in chunks, so memory use is bounded by the chunk size
+    and not the object size. Returns the scratch filename; the caller is
+    responsible for removing the file.
+    """
+
+    response = await s3.get_object(Bucket=config.S3_BUCKET_ID, Key=key)
+
+    with tempfile.NamedTemporaryFile(
+        suffix=suffix,
+        dir=config.SCRATCH_DIR,
+        delete=False,
+    ) as f:
+        try:
+            async for chunk in response["Body"].iter_chunks(
+                config.S3_STREAM_CHUNK_SIZE_BYTES
+            ):
+                f.write(chunk)
         except Exception:
-            s3_local = None
+            f.close()
+            os.remove(f.name)
+            raise
+
+    return f.name
+
+
+async def md5_s3_object(s3: Any, key: str) -> str:
+    """MD5 hex digest of an S3 object, hashed as its body is streamed
+
+    Nothing is written to disk, and memory use is bounded by the chunk
+    size. Chunks are hashed in a thread (hashlib releases the GIL), so that
+    hashing large objects does not block the event loop.
+    """
+
+    response = await s3.get_object(Bucket=config.S3_BUCKET_ID, Key=key)
+
+    hash_md5 = hashlib.md5()
+    async for chunk in response["Body"].iter_chunks(
+        config.S3_STREAM_CHUNK_SIZE_BYTES
+    ):
+        await asyncio.to_thread(hash_md5.update, chunk)
+
+    return hash_md5.hexdigest()
+
+
+async def delete_s3_keys(
+    s3: Any,
+    keys: list[str],
+) -> int:
+    """Delete keys from the bucket in batches with DeleteObjects
+
+    Keys that do not exist are not an error. Returns the number of keys
+    that were requested for deletion.
+    """
+
+    deleted = 0
+    for i in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+        batch = keys[i : i + S3_DELETE_BATCH_SIZE]
+        response = await s3.delete_objects(
+            Bucket=config.S3_BUCKET_ID,
+            Delete={
+                "Objects": [{"Key": key} for key in batch],
+                "Quiet": True,
+            },
+        )
+        for error in response.get("Errors", []):
+            print(f"Failed to delete {error.get('Key')}: {error}")
+        deleted += len(batch)
 
-    return s3_local, s3_status
+    return deleted
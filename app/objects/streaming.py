@@ -0,0 +1,208 @@
+"""Streaming of S3 objects through the API with HTTP Range support
+
+Single ranges are passed through to S3 as ranged GETs and answered with a
+206. Multiple ranges are answered with a multipart/byteranges body, with a
+ranged GET per part. An If-Range that does not match the object disables
+the Range header, as does a malformed one (RFC 9110, section 14).
+"""
+
+from app.config import config
+from botocore.exceptions import ClientError
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncGenerator
+from uuid import uuid4
+import datetime
+
+# Requests for more ranges than this are answered with the whole object
+MAX_RANGES = 16
+
+
+def parse_range_header(
+    range_header: str | None,
+    size: int,
+) -> list[tuple[int, int]] | None:
+    """Get the inclusive (start, end) byte ranges requested of an object
+
+    Returns None if the whole object should be sent, ie. there is no Range
+    header or it is malformed or unsupported. Overlapping and adjacent
+    ranges are coalesced. Raises a 416 if none of the ranges can be
+    satisfied.
+    """
+
+    if not range_header:
+        return None
+
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+
+    ranges = []
+    for range_spec in range_set.split(","):
+        first, dash, last = range_spec.strip().partition("-")
+        if not dash or not (first or last):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if not first:  # Suffix range, eg. the last 500 bytes with -500
+            if int(last) == 0:
+                continue
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+
+        if start < size:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    coalesced = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], end))
+        else:
+            coalesced.append((start, end))
+
+    if len(coalesced) > MAX_RANGES:
+        return None
+
+    return coalesced
+
+
+def if_range_matches(
+    if_range: str | None,
+    etag: str | None,
+    last_modified: datetime.datetime | None,
+) -> bool:
+    """Whether the Range header applies given the If-Range precondition"""
+
+    if not if_range:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Only a strong ETag comparison is allowed
+        return etag is not None and if_range == etag
+
+    try:
+        date = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+
+    return last_modified is not None and date == last_modified.replace(
+        microsecond=0
+    )
+
+
+async def iter_s3_body(
+    s3: Any,
+    key: str,
+    start: int | None = None,
+    end: int | None = None,
+) -> AsyncGenerator[bytes, None]:
+    """Stream the body, or an inclusive byte range, of an S3 object"""
+
+    kwargs = {"Range": f"bytes={start}-{end}"} if start is not None else {}
+    response = await s3.get_object(
+        Bucket=config.S3_BUCKET_ID, Key=key, **kwargs
+    )
+    async for chunk in response["Body"].iter_chunks(
+        config.S3_STREAM_CHUNK_SIZE_BYTES
+    ):
+        yield chunk
+
+
+async def stream_s3_object(
+    s3: Any,
+    key: str,
+    request: Request,
+    filename: str,
+    media_type: str = "application/octet-stream",
+    disposition: str = "attachment",
+) -> Response:
+    """Respond with an S3 object, honouring the Range of the request"""
+
+    try:
+        head = await s3.head_object(Bucket=config.S3_BUCKET_ID, Key=key)
+    except ClientError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    size = head["ContentLength"]
+    etag = head.get("ETag")
+    last_modified = head.get("LastModified")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'{disposition}; filename="{filename}"',
+    }
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    ranges = parse_range_header(request.headers.get("range"), size)
+    if ranges and not if_range_matches(
+        request.headers.get("if-range"), etag, last_modified
+    ):
+        ranges = None
+
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            content=iter_s3_body(s3, key),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            content=iter_s3_body(s3, key, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    # Each part is preceded by its headers, and all but the first by a CRLF
+    boundary = uuid4().hex
+    part_headers = [
+        (
+            ("\r\n" if i else "")
+            + f"--{boundary}\r\n"
+            + f"Content-Type: {media_type}\r\n"
+            + f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for i, (start, end) in enumerate(ranges)
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+
+    async def multipart_body() -> AsyncGenerator[bytes, None]:
+        for part_header, (start, end) in zip(part_headers, ranges):
+            yield part_header
+            async for chunk in iter_s3_body(s3, key, start, end):
+                yield chunk
+        yield closing
+
+    headers["Content-Length"] = str(
+        sum(len(part_header) for part_header in part_headers)
+        + sum(end - start + 1 for start, end in ranges)
+        + len(closing)
+    )
+    return StreamingResponse(
+        content=multipart_body(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
@@ -1,5 +1,5 @@
 from uuid import UUID
-import cv2
+from collections import defaultdict
 import aioboto3
 from app.config import config
 import os
@@ -7,57 +7,107 @@ from app.db import AsyncSession
 from sqlmodel import update, select, delete
 from app.objects.models import InputObject
 import datetime
-import hashlib
-import asyncio
-import math
+from botocore.exceptions import ClientError
+from sqlalchemy import Integer, cast, func, literal
+from app.objects.probe import probe_s3_mp4, ProbeError
+from app.objects.service import (
+    download_to_scratch,
+    delete_s3_keys,
+    md5_s3_object,
+    upload_keys,
+)
+from app.objects.video import probe_video_file, md5_file
+from app.processing import run_in_process
+from app.query_cache import invalidate
+from app.tasks.service import register_task, register_periodic
+from app.events.service import publish_event
+from app.events.models import EventType
+from app.status.service import record_storage_usage, INPUTS_FOLDER
 
 
+def md5_from_etag(etag: str | None) -> str | None:
+    """Return the MD5 hash held in an ETag, if it is one
+
+    ETags of multipart uploads are not the MD5 of the object (they end in
+    -<number of parts>) so None is returned for those.
+    """
+
+    if not etag:
+        return None
+
+    etag = etag.replace('"', "")
+    if "-" in etag or len(etag) != 32:
+        return None
+
+    return etag
+
+
+@register_task("generate_video_statistics")
 async def generate_video_statistics(
     input_object_id: UUID,
     s3: aioboto3.Session,
-    db: AsyncSession,
+    session: AsyncSession,
 ) -> float:
     # Background task to generate statistics on uploaded video files
 
     # Get video file from S3 with the given input_object_id
-    filename = f"{input_object_id}.mp4"
+    filename = None
+    owner = None
     try:
+        processing_message = (
+            f"Started processing at {datetime.datetime.now()} (UTC)"
+        )
         update_query = (
             update(InputObject)
             .where(InputObject.id == input_object_id)
             .values(
                 processing_has_started=True,
-                processing_message=(
-                    f"Started processing at {datetime.datetime.now()} (UTC)"
-                ),
+                processing_message=processing_message,
             )
+            .returning(InputObject.owner)
         )
-        await db.exec(update_query)
-        await db.commit()
-
-        response = await s3.get_object(
-            Bucket=config.S3_BUCKET_ID,
-            Key=f"{config.S3_PREFIX}/inputs/{input_object_id}",
+        res = await session.exec(update_query)
+        owner = res.scalar_one_or_none()
+        await session.commit()
+        await invalidate(InputObject)
+        await publish_event(
+            EventType.INPUT_OBJECT,
+            input_object_id,
+            owner,
+            processing_has_started=True,
+            processing_message=processing_message,
         )
-        video_file = await response["Body"].read()
-
-        # Save to temporary file
 
-        with open(filename, "wb") as f:
-            f.write(video_file)
+        key = f"{config.S3_PREFIX}/inputs/{input_object_id}"
+        try:
+            # Read the statistics from the MP4 headers with ranged requests
+            fps, frame_count, duration_seconds = await probe_s3_mp4(s3, key)
 
-        # Generate FPS, duration
-        cap = cv2.VideoCapture(filename)
-        fps = round(cap.get(cv2.CAP_PROP_FPS), 2)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration_seconds = round(frame_count / fps, 2)
-        cap.release()
-
-        # Generate MD5 hash
-        hash_md5sum = hashlib.md5(video_file).hexdigest()
+            # tusd uploads to S3 in parts, so the ETag is rarely the MD5.
+            # Streaming the video through the hash instead is opt-in, as it
+            # reads the whole file.
+            head = await s3.head_object(Bucket=config.S3_BUCKET_ID, Key=key)
+            hash_md5sum = md5_from_etag(head.get("ETag"))
+            if hash_md5sum is None and config.VIDEO_STATISTICS_FULL_MD5:
+                hash_md5sum = await md5_s3_object(s3, key)
+        except ProbeError as e:
+            # Non-faststart or unusual files need the whole video
+            print(
+                f"Could not probe headers of {input_object_id} ({e}), "
+                "falling back to the full download"
+            )
+            filename = await download_to_scratch(s3, key, suffix=".mp4")
 
-        os.remove(filename)
+            # Decoding and hashing are CPU-bound, keep them off the loop
+            fps, frame_count, duration_seconds = await run_in_process(
+                probe_video_file, filename
+            )
+            hash_md5sum = await run_in_process(md5_file, filename)
 
+        processing_message = (
+            "Video statistics generated successfully at "
+            f"{datetime.datetime.now()} (UTC)"
+        )
         update_query = (
             update(InputObject)
             .where(InputObject.id == input_object_id)
@@ -68,86 +118,149 @@ async def generate_video_statistics(
                 hash_md5sum=hash_md5sum,
                 frame_count=frame_count,
                 all_parts_received=True,
-                processing_message=(
-                    "Video statistics generated successfully at "
-                    f"{datetime.datetime.now()} (UTC)"
-                ),
+                processing_message=processing_message,
             )
         )
-        await db.exec(update_query)
-        await db.commit()
+        await session.exec(update_query)
+        await session.commit()
+        await invalidate(InputObject)
+        await publish_event(
+            EventType.INPUT_OBJECT,
+            input_object_id,
+            owner,
+            fps=fps,
+            time_seconds=duration_seconds,
+            frame_count=frame_count,
+            hash_md5sum=hash_md5sum,
+            processing_completed_successfully=True,
+            processing_message=processing_message,
+        )
     except Exception as e:
+        processing_message = f"Error generating video statistics: {str(e)}"
         update_query = (
             update(InputObject)
             .where(InputObject.id == input_object_id)
             .values(
                 processing_completed_successfully=False,
-                processing_message=(
-                    f"Error generating video statistics: {str(e)}"
-                ),
+                processing_message=processing_message,
             )
         )
-        await db.exec(update_query)
-        await db.commit()
+        await session.exec(update_query)
+        await session.commit()
+        await invalidate(InputObject)
+        await publish_event(
+            EventType.INPUT_OBJECT,
+            input_object_id,
+            owner,
+            processing_completed_successfully=False,
+            processing_message=processing_message,
+        )
+    finally:
+        # Always clean up the scratch file, even if processing failed
+        if filename and os.path.exists(filename):
+            os.remove(filename)
 
     return
 
 
-async def delete_incomplete_object(
-    input_object_id: UUID,
+@register_periodic(
+    "sweep_incomplete_objects", config.INCOMPLETE_OBJECT_CHECK_INTERVAL
+)
+async def sweep_incomplete_objects(
     s3: aioboto3.Session,
-    db: AsyncSession,
-) -> float:
-    # Monitor the time of the last updated part and delete if under threshold
+    session: AsyncSession,
+) -> None:
+    """Update the message of stalled uploads and delete abandoned ones
 
-    query = select(InputObject).where(InputObject.id == input_object_id)
-    res = await db.exec(query)
-    obj = res.one_or_none()
+    Uploads with no part received for INCOMPLETE_OBJECT_CONSIDER_ABANDONED
+    seconds have their message updated in one statement, and those past
+    INCOMPLETE_OBJECT_TIMEOUT_SECONDS are removed from S3 and the database
+    in batches.
+    """
 
-    time_since_last_part = (
-        datetime.datetime.now() - obj.last_part_received_utc
-    ).total_seconds()
-
-    while time_since_last_part < config.INCOMPLETE_OBJECT_TIMEOUT_SECONDS:
-        if obj.all_parts_received:
-            return
+    now = datetime.datetime.now()
+    stalled_before = now - datetime.timedelta(
+        seconds=config.INCOMPLETE_OBJECT_CONSIDER_ABANDONED
+    )
+    abandoned_before = now - datetime.timedelta(
+        seconds=config.INCOMPLETE_OBJECT_TIMEOUT_SECONDS
+    )
 
-        if time_since_last_part > config.INCOMPLETE_OBJECT_CONSIDER_ABANDONED:
-            message = (
-                "Uploading... Last part received "
-                f"{math.ceil(time_since_last_part)} seconds ago. "
-            )
+    res = await session.exec(
+        select(
+            InputObject.iterator,
+            InputObject.id,
+            InputObject.upload_id,
+            InputObject.owner,
+            InputObject.size_bytes,
+        )
+        .where(InputObject.all_parts_received.is_(False))
+        .where(InputObject.last_part_received_utc < abandoned_before)
+        # Tombstoned uploads are removed by their cascade_delete task
+        .where(InputObject.deleted_utc.is_(None))
+    )
+    abandoned = res.all()
 
-            update_query = (
-                update(InputObject)
-                .where(InputObject.id == input_object_id)
-                .values(processing_message=message)
-            )
-            await db.exec(update_query)
-            await db.commit()
+    if abandoned:
+        print(f"Deleting {len(abandoned)} abandoned uploads")
+        for obj in abandoned:
+            if obj.upload_id:
+                # Free the parts of the unfinished multipart upload
+                try:
+                    await s3.abort_multipart_upload(
+                        Bucket=config.S3_BUCKET_ID,
+                        Key=upload_keys(obj.id)[0],
+                        UploadId=obj.upload_id,
+                    )
+                except ClientError:
+                    pass
 
-        # Recheck the object
-        await asyncio.sleep(config.INCOMPLETE_OBJECT_CHECK_INTERVAL)
-        await db.refresh(obj)
+        await delete_s3_keys(
+            s3,
+            [key for obj in abandoned for key in upload_keys(obj.id)],
+        )
 
-        time_since_last_part = (
-            datetime.datetime.now() - obj.last_part_received_utc
-        ).total_seconds()
+        # Release the usage reserved by the uploads
+        released: dict[UUID, list[int]] = defaultdict(lambda: [0, 0])
+        for obj in abandoned:
+            released[obj.owner][0] -= 1
+            released[obj.owner][1] -= obj.size_bytes or 0
+        for owner, (object_count, size_bytes) in released.items():
+            await record_storage_usage(
+                session, INPUTS_FOLDER, owner, object_count, size_bytes
+            )
+        await session.exec(
+            delete(InputObject).where(
+                InputObject.iterator.in_([obj.iterator for obj in abandoned])
+            )
+        )
 
-    # Delete the object from S3
-    await s3.delete_object(
-        Bucket=config.S3_BUCKET_ID,
-        Key=f"{config.S3_PREFIX}/inputs/{input_object_id}",
+    seconds_since_last_part = cast(
+        func.ceil(
+            func.extract(
+                "epoch", literal(now) - InputObject.last_part_received_utc
+            )
+        ),
+        Integer,
     )
+    stalled = await session.exec(
+        update(InputObject)
+        .where(InputObject.all_parts_received.is_(False))
+        .where(InputObject.last_part_received_utc < stalled_before)
+        .where(InputObject.deleted_utc.is_(None))
+        .values(
+            processing_message=func.concat(
+                "Uploading... Last part received ",
+                seconds_since_last_part,
+                " seconds ago. ",
+            )
+        )
+    )
+    await session.commit()
+    if abandoned or stalled.rowcount:
+        await invalidate(InputObject)
 
-    # # Delete chunked object from S3
-    # await s3.abort_multipart_upload(
-    #     Bucket=config.S3_BUCKET_ID,
-    #     Key=f"{config.S3_PREFIX}/inputs/{obj.id}",
-    #     UploadId=obj.upload_id,
-    # )
-
-    # Delete the object from the database
-    delete_query = delete(InputObject).where(InputObject.id == input_object_id)
-    await db.exec(delete_query)
-    await db.commit()
+    for obj in abandoned:
+        await publish_event(
+            EventType.INPUT_OBJECT, obj.id, obj.owner, deleted=True
+        )
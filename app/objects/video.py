@@ -0,0 +1,31 @@
+"""CPU-bound video functions, run in the process pool
+
+Kept free of database and S3 imports so that they are cheap to load in the
+pool's worker processes.
+"""
+
+import cv2
+import hashlib
+
+
+def probe_video_file(filename: str) -> tuple[float, int, float]:
+    """Get the (fps, frame count, duration) of a local video file"""
+
+    cap = cv2.VideoCapture(filename)
+    fps = round(cap.get(cv2.CAP_PROP_FPS), 2)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    duration_seconds = round(frame_count / fps, 2)
+    cap.release()
+
+    return fps, frame_count, duration_seconds
+
+
+def md5_file(filename: str, chunk_size: int = 1024 * 1024) -> str:
+    """Get the MD5 hex digest of a local file, reading it in chunks"""
+
+    hash_md5 = hashlib.md5()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hash_md5.update(chunk)
+
+    return hash_md5.hexdigest()
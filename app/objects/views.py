@@ -2,27 +2,60 @@ from fastapi import (
     Depends,
     APIRouter,
     Query,
-    BackgroundTasks,
+    Request,
     Response,
     HTTPException,
 )
+from fastapi.responses import StreamingResponse, RedirectResponse
 from app.db import get_session, AsyncSession
 from app.objects.models import InputObject, InputObjectRead, InputObjectUpdate
-from app.objects.service import get_s3
+from app.objects.service import get_s3, presigned_download_url
+from app.objects.streaming import stream_s3_object
 from app.config import config
 from uuid import UUID
 from sqlmodel import select, update
 from sqlalchemy import func
 from typing import Any
 from aioboto3 import Session as S3Session
-from app.objects.utils import generate_video_statistics
+from app.tasks.service import enqueue
+from app.objects.progress import merge_upload_progress
+from app.responses import read_model_response
+from app.deletion import request_deletion, DeletionResource
+from app.loaders import (
+    INPUT_OBJECT_FIELDSET,
+    INPUT_OBJECT_READ,
+    INPUT_OBJECT_READ_RESOURCES,
+)
+from app.query_cache import (
+    invalidate,
+    query_key,
+    get_query_result,
+    set_query_result,
+    result_headers,
+)
+from app.crud import list_plan
+from app.pagination import (
+    fetch_page,
+    list_count_key,
+    paginate_by_cursor,
+    next_cursor,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+)
 import json
 from app.users.models import User
 from app.auth.services import get_user_info
+from app.auth.models import DownloadToken
+import datetime
+import jwt
+import mimetypes
 
 
 router = APIRouter()
 
+# Sort of the objects when paginating by cursor without a sort
+DEFAULT_SORT = ["time_added_utc", "DESC"]
+
 
 @router.get("/{object_id}", response_model=InputObjectRead)
 async def get_object(
@@ -31,38 +64,171 @@ async def get_object(
     s3: S3Session = Depends(get_s3),
     *,
     object_id: UUID,
-) -> InputObjectRead:
-    """Get an object by id"""
+    fields: str = Query(None),
+) -> Response:
+    """Get an object by id
+
+    With fields, ie. "id,filename", only those fields (see app.fieldsets)
+    """
+
+    fields = INPUT_OBJECT_FIELDSET.parse(fields)
+
+    key = await query_key(
+        "object",
+        INPUT_OBJECT_READ_RESOURCES,
+        user,
+        {"id": object_id, "fields": sorted(fields or [])},
+    )
+    obj = await get_query_result(key)
+    if obj is None:
+        query = (
+            select(InputObject)
+            .where(
+                InputObject.id == object_id, InputObject.deleted_utc.is_(None)
+            )
+            .options(*INPUT_OBJECT_FIELDSET.load_options(fields))
+        )
+        if not user.is_admin:
+            query = query.where(InputObject.owner == user.id)
+        res = await session.exec(query)
+        obj = res.one_or_none()
+
+        if not obj:
+            raise HTTPException(status_code=404, detail="Object not found")
+
+        obj = INPUT_OBJECT_FIELDSET.validate(obj, fields)
+        await set_query_result(key, obj)
+
+    (obj,) = await merge_upload_progress([obj])
+
+    return read_model_response(obj, INPUT_OBJECT_FIELDSET.model(fields))
+
+
+@router.get("/download/{token}", response_class=StreamingResponse)
+async def get_object_file(
+    token: str,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    s3: S3Session = Depends(get_s3),
+) -> Response:
+    """With the given token, returns the input video from S3
+
+    Served inline with support for Range requests, so that videos can be
+    played and scrubbed without downloading them first. If
+    config.S3_PRESIGNED_DOWNLOADS is set, redirects to a presigned S3 URL
+    instead, which supports Range requests itself.
+    """
+
+    decoded = jwt.decode(
+        token, config.SERIALIZER_SECRET_KEY, algorithms=["HS256"]
+    )
+    if "input_object_id" not in decoded:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    object_id, exp = decoded["input_object_id"], decoded["exp"]
+
+    if datetime.datetime.fromtimestamp(
+        exp, tz=datetime.timezone.utc
+    ) < datetime.datetime.now(datetime.UTC):
+        raise HTTPException(
+            status_code=401,
+            detail="Token has expired",
+        )
+
+    res = await session.exec(
+        select(InputObject).where(
+            InputObject.id == object_id, InputObject.deleted_utc.is_(None)
+        )
+    )
+    obj = res.one_or_none()
+
+    if not obj:
+        raise HTTPException(status_code=404, detail="Object not found")
+
+    key = f"{config.S3_PREFIX}/{config.INPUT_FOLDER_PREFIX}{obj.id}"
+    filename = obj.filename or str(obj.id)
+
+    if config.S3_PRESIGNED_DOWNLOADS:
+        # The URL must not remain valid after the token has expired
+        expires_in = min(
+            config.S3_PRESIGNED_URL_EXPIRY_SECONDS,
+            int(exp - datetime.datetime.now().timestamp()),
+        )
+        url = await presigned_download_url(
+            s3,
+            key,
+            filename,
+            expires_in=max(1, expires_in),
+            disposition="inline",
+        )
+
+        return RedirectResponse(url=url, status_code=307)
+
+    return await stream_s3_object(
+        s3,
+        key,
+        request,
+        filename,
+        media_type=(
+            mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        ),
+        disposition="inline",
+    )
 
-    query = select(InputObject).where(InputObject.id == object_id)
+
+@router.get("/{object_id}/token", response_model=DownloadToken)
+async def get_object_file_token(
+    object_id: UUID,
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+) -> DownloadToken:
+    """Returns a token to stream the video of an object by id
+
+    Token expires at a set time defined by config.SERIALIZER_EXPIRY_HOURS
+    """
+
+    query = select(InputObject).where(
+        InputObject.id == object_id, InputObject.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(InputObject.owner == user.id)
     res = await session.exec(query)
-    obj = res.one_or_none()
 
-    if not obj:
+    if res.one_or_none() is None:
         raise HTTPException(status_code=404, detail="Object not found")
 
-    return obj
+    payload = {
+        "input_object_id": str(object_id),
+        "exp": datetime.datetime.now(datetime.UTC)
+        + datetime.timedelta(hours=config.SERIALIZER_EXPIRY_HOURS),
+    }
+    token = jwt.encode(
+        payload, config.SERIALIZER_SECRET_KEY, algorithm="HS256"
+    )
+
+    return DownloadToken(token=token)
 
 
 @router.post("/{object_id}", response_model=Any)
 async def regenerate_statistics(
     user: User = Depends(get_user_info),
     session: AsyncSession = Depends(get_session),
-    s3: S3Session = Depends(get_s3),
     *,
     object_id: UUID,
-    background_tasks: BackgroundTasks,
 ) -> InputObjectRead:
-    """Get an object by id"""
+    """Regenerate the video statistics of an object by id"""
 
-    query = select(InputObject).where(InputObject.id == str(object_id))
+    query = select(InputObject).where(
+        InputObject.id == str(object_id), InputObject.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(InputObject.owner == user.id)
     res = await session.exec(query)
     obj = res.one_or_none()
 
+    if not obj:
+        raise HTTPException(status_code=404, detail="Object not found")
+
     # Remove fields from vid statistics and set completed to false
 
     update_query = (
@@ -77,11 +243,14 @@ async def regenerate_statistics(
     )
     await session.exec(update_query)
     await session.commit()
-    if not obj:
-        raise HTTPException(status_code=404, detail="Object not found")
+    await invalidate(InputObject)
 
-    # Create background task to generate video statistics
-    background_tasks.add_task(generate_video_statistics, obj.id, s3, session)
+    # Queue a task to generate video statistics
+    await enqueue(
+        session,
+        "generate_video_statistics",
+        {"input_object_id": str(object_id)},
+    )
 
     return True
 
@@ -95,85 +264,112 @@ async def get_objects(
     filter: str = Query(None),
     sort: str = Query(None),
     range: str = Query(None),
-) -> list[InputObjectRead]:
-    """Get all objects"""
+    cursor: str = Query(None),
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = Query(None),
+) -> Response:
+    """Get all objects
+
+    Paginated by range, or by cursor if one is given (see app.pagination).
+    With fields, ie. "id,filename", only those fields (see app.fieldsets)
+    """
 
     sort = json.loads(sort) if sort else []
     range = json.loads(range) if range else []
     filter = json.loads(filter) if filter else {}
+    fields = INPUT_OBJECT_FIELDSET.parse(fields)
+    plan = list_plan(InputObject)
+    read_model = INPUT_OBJECT_FIELDSET.model(fields)
+
+    key = await query_key(
+        "objects",
+        INPUT_OBJECT_READ_RESOURCES,
+        user,
+        dict(
+            filter=filter,
+            sort=sort,
+            range=range,
+            cursor=cursor,
+            page_size=page_size,
+            fields=sorted(fields or []),
+        ),
+    )
+    cached = await get_query_result(key)
+    if cached is not None:
+        object_objs, headers = cached
+        response.headers.update(headers)
+        return read_model_response(
+            await merge_upload_progress(object_objs), read_model, response
+        )
 
-    # Do a query to satisfy total count for "Content-Range" header
-    count_query = select(func.count(InputObject.iterator))
+    # Count for the "Content-Range" header, when the page cannot be counted
+    # in the same query (see fetch_page)
+    count_query = select(func.count(InputObject.iterator)).where(
+        InputObject.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         count_query = count_query.where(InputObject.owner == user.id)
+    count_query = plan.filter(count_query, filter)
 
-    # Apply filters to the count query
-    if len(filter):
-        for field, value in filter.items():
-            if field in ["id", "object_id", "transect_id"]:
-                if isinstance(value, list):
-                    count_query = count_query.where(
-                        getattr(InputObject, field).in_(value)
-                    )
-                else:
-                    count_query = count_query.where(
-                        getattr(InputObject, field) == value
-                    )
-            elif isinstance(value, bool):
-                count_query = count_query.where(
-                    getattr(InputObject, field) == value
-                )
-            else:
-                count_query = count_query.where(
-                    getattr(InputObject, field).like(f"%{str(value)}%")
-                )
-    total_count = await session.execute(count_query)
-    total_count = total_count.scalar_one()
-
-    # Query for the actual records
-    query = select(InputObject)
+    # Query for the actual records, with the columns of the cursor
+    query = select(InputObject).where(InputObject.deleted_utc.is_(None))
     if not user.is_admin:
         query = query.where(InputObject.owner == user.id)
 
-    # Apply sorting
-    if len(sort) == 2:
-        sort_field, sort_order = sort
-        if sort_order == "ASC":
-            query = query.order_by(getattr(InputObject, sort_field))
-        else:
-            query = query.order_by(getattr(InputObject, sort_field).desc())
+    # Apply sorting, and the cursor if paginating by cursor
+    if cursor is not None:
+        sort_field, sort_order = sort if len(sort) == 2 else DEFAULT_SORT
+        # A 400 for unknown fields, before they are loaded
+        list_plan(InputObject).sort_column(sort_field)
+        query = query.options(
+            *INPUT_OBJECT_FIELDSET.load_options(
+                fields, (sort_field, "iterator")
+            )
+        )
+        query = paginate_by_cursor(
+            query, InputObject, sort_field, sort_order, cursor, page_size
+        )
+    else:
+        query = query.options(*INPUT_OBJECT_FIELDSET.load_options(fields))
+        query = plan.sort(query, sort)
 
     # Apply filters to the main query
-    if len(filter):
-        for field, value in filter.items():
-            if field in ["id", "object_id", "transect_id"]:
-                if isinstance(value, list):
-                    query = query.where(getattr(InputObject, field).in_(value))
-                else:
-                    query = query.where(getattr(InputObject, field) == value)
-            elif isinstance(value, bool):
-                query = query.where(getattr(InputObject, field) == value)
-            else:
-                query = query.where(
-                    getattr(InputObject, field).like(f"%{str(value)}%")
-                )
+    query = plan.filter(query, filter)
 
     # Apply range for pagination
-    if len(range) == 2:
+    if len(range) == 2 and cursor is None:
+        query = query.offset(range[0]).limit(range[1] - range[0] + 1)
+
+    # Execute query, counting in the same statement unless paginating by
+    # cursor, and with the cached count for the unfiltered listing
+    objects, total_count = await fetch_page(
+        session,
+        query,
+        count_query,
+        window=cursor is None,
+        count_key=(
+            list_count_key(InputObject)
+            if user.is_admin and not len(filter)
+            else None
+        ),
+    )
+    if len(range) == 2 and cursor is None:
         start, end = range
-        query = query.offset(start).limit(end - start + 1)
     else:
         start, end = [0, total_count]  # For content-range header
+    if cursor is not None:
+        objects = next_cursor(
+            objects, sort_field, sort_order, page_size, response
+        )
 
-    # Execute query
-    results = await session.execute(query)
-    objects = results.scalars().all()
-
-    object_objs = [InputObjectRead.model_validate(x) for x in objects]
+    object_objs = [INPUT_OBJECT_FIELDSET.validate(x, fields) for x in objects]
 
     response.headers["Content-Range"] = f"objects {start}-{end}/{total_count}"
+    await set_query_result(key, (object_objs, result_headers(response)))
 
-    return object_objs
+    return read_model_response(
+        await merge_upload_progress(object_objs), read_model, response
+    )
 
 
 @router.put("/{input_object_id}", response_model=InputObjectRead)
@@ -184,7 +380,14 @@ async def update_input_object(
     session: AsyncSession = Depends(get_session),
 ) -> InputObjectRead:
 
-    query = select(InputObject).where(InputObject.id == input_object_id)
+    query = (
+        select(InputObject)
+        .where(
+            InputObject.id == input_object_id,
+            InputObject.deleted_utc.is_(None),
+        )
+        .options(*INPUT_OBJECT_READ)
+    )
     if not user.is_admin:
         query = query.where(InputObject.owner == user.id)
 
@@ -202,6 +405,7 @@ async def update_input_object(
     session.add(obj)
     await session.commit()
     await session.refresh(obj)
+    await invalidate(InputObject)
 
     return obj
 
@@ -212,11 +416,12 @@ async def delete_object(
     user: User = Depends(get_user_info),
     session: AsyncSession = Depends(get_session),
     filter: dict[str, str] | None = None,
-    s3: S3Session = Depends(get_s3),
 ) -> None:
     """Delete an object by id"""
 
-    query = select(InputObject).where(InputObject.id == object_id)
+    query = select(InputObject).where(
+        InputObject.id == object_id, InputObject.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(InputObject.owner == user.id)
     res = await session.exec(query)
@@ -227,18 +432,6 @@ async def delete_object(
             status_code=404,
             detail="Object not found",
         )
-    if object:
-        # Delete object from S3
-        try:
-            res = await s3.delete_object(
-                Bucket=config.S3_BUCKET_ID,
-                Key=f"{config.S3_PREFIX}/{object.id}/inputs/{object.filename}",
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to delete object from S3: {e}",
-            )
 
-        await session.delete(object)
-        await session.commit()
+    # Files and rows are removed by the cascade_delete task
+    await request_deletion(session, DeletionResource.INPUT_OBJECT, object.id)
@@ -0,0 +1,131 @@
+"""Streaming ZIP64 archives built on the fly
+
+Entries are stored without compression and written as their bodies are
+read, so nothing is buffered beyond the chunk being written. As the CRC and
+sizes of an entry are only known once it has been written, they follow it
+in a data descriptor (general purpose flag bit 3). ZIP64 fields are always
+used, so there is no limit on the size or number of entries.
+"""
+
+from typing import AsyncIterable, AsyncIterator
+import datetime
+import struct
+import zlib
+
+ZIP64_VERSION = 45  # 4.5, the version which introduced ZIP64
+FLAGS = 0x0808  # Data descriptor follows the data, UTF-8 names
+STORED = 0
+EXTERNAL_ATTRIBUTES = 0o100644 << 16  # Regular file, rw-r--r--
+
+ZipEntry = tuple[str, datetime.datetime, AsyncIterable[bytes]]
+
+
+def dos_datetime(value: datetime.datetime) -> tuple[int, int]:
+    """MS-DOS (time, date) of a datetime, clamped to the range of DOS dates"""
+
+    value = max(value, datetime.datetime(1980, 1, 1, tzinfo=value.tzinfo))
+    return (
+        value.hour << 11 | value.minute << 5 | value.second // 2,
+        (value.year - 1980) << 9 | value.month << 5 | value.day,
+    )
+
+
+async def stream_zip(entries: AsyncIterable[ZipEntry]) -> AsyncIterator[bytes]:
+    """Yield a ZIP64 archive of the (name, modified, body) entries"""
+
+    offset = 0
+    central_directory = []
+
+    async for name, modified, body in entries:
+        encoded_name = name.encode()
+        time, date = dos_datetime(modified)
+        header_offset = offset
+
+        # Sizes are set to 0xFFFFFFFF, with the real ones (zero for now) in
+        # the ZIP64 extra field and the data descriptor
+        local_header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50,
+            ZIP64_VERSION,
+            FLAGS,
+            STORED,
+            time,
+            date,
+            0,
+            0xFFFFFFFF,
+            0xFFFFFFFF,
+            len(encoded_name),
+            20,
+        )
+        zip64_extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        yield local_header + encoded_name + zip64_extra
+        offset += len(local_header) + len(encoded_name) + len(zip64_extra)
+
+        crc = 0
+        size = 0
+        async for chunk in body:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            yield chunk
+        offset += size
+
+        data_descriptor = struct.pack("<IIQQ", 0x08074B50, crc, size, size)
+        yield data_descriptor
+        offset += len(data_descriptor)
+
+        central_directory.append(
+            struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50,
+                3 << 8 | ZIP64_VERSION,  # Made by Unix, for the attributes
+                ZIP64_VERSION,
+                FLAGS,
+                STORED,
+                time,
+                date,
+                crc,
+                0xFFFFFFFF,
+                0xFFFFFFFF,
+                len(encoded_name),
+                28,
+                0,
+                0,
+                0,
+                EXTERNAL_ATTRIBUTES,
+                0xFFFFFFFF,
+            )
+            + encoded_name
+            + struct.pack("<HHQQQ", 0x0001, 24, size, size, header_offset)
+        )
+
+    central_directory_offset = offset
+    central_directory_size = sum(len(entry) for entry in central_directory)
+    for entry in central_directory:
+        yield entry
+    offset += central_directory_size
+
+    yield struct.pack(
+        "<IQHHIIQQQQ",
+        0x06064B50,
+        44,  # Size of the rest of this record
+        3 << 8 | ZIP64_VERSION,
+        ZIP64_VERSION,
+        0,
+        0,
+        len(central_directory),
+        len(central_directory),
+        central_directory_size,
+        central_directory_offset,
+    )
+    yield struct.pack("<IIQI", 0x07064B50, 0, offset, 1)
+    yield struct.pack(
+        "<IHHHHIIH",
+        0x06054B50,
+        0,
+        0,
+        0xFFFF,
+        0xFFFF,
+        0xFFFFFFFF,
+        0xFFFFFFFF,
+        0,
+    )
@@ -0,0 +1,235 @@
+"""Keyset (cursor) pagination of the list endpoints
+
+Instead of an OFFSET, which makes the database read and discard every row
+before the page, the next page starts after the last row of the previous
+one: rows are ordered by (sort column, iterator) and filtered to those that
+come after that key. With an index on the ordering, every page costs the
+same as the first.
+
+Cursors are opaque to clients. They encode the sort of the listing along
+with the key, so a cursor cannot be used with another sort. The first page
+is requested with an empty cursor, and the cursor of the next page is
+returned in the X-Next-Cursor header, which is absent on the last page.
+
+The total count of a listing, for the Content-Range header, is taken in
+the same statement as its page with count(*) OVER (). Unfiltered listings
+of all rows, as seen by admins, cache their count instead, which is
+invalidated whenever rows are added or removed.
+"""
+
+from app.config import config
+from app.db import AsyncSession
+from cashews import cache
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, func, or_, tuple_
+from typing import Any
+from uuid import UUID
+import base64
+import binascii
+import datetime
+import json
+
+# Header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+LIST_COUNT_KEY_PREFIX = "list:count:"
+
+
+def encode_cursor(
+    sort_field: str,
+    sort_order: str,
+    value: Any,
+    iterator: int,
+) -> str:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    elif isinstance(value, UUID):
+        value = str(value)
+
+    return (
+        base64.urlsafe_b64encode(
+            json.dumps([sort_field, sort_order, value, iterator]).encode()
+        )
+        .decode()
+        .rstrip("=")
+    )
+
+
+def decode_cursor(
+    cursor: str,
+    sort_field: str,
+    sort_order: str,
+    column: Any,
+) -> tuple[Any, int]:
+    """Get the (sort value, iterator) key of a cursor for the given sort"""
+
+    try:
+        field, order, value, iterator = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if (field, order) != (sort_field, sort_order):
+        raise HTTPException(
+            status_code=400, detail="Cursor does not match the sort order"
+        )
+
+    if value is not None:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = None
+        if python_type in (datetime.datetime, datetime.date):
+            value = python_type.fromisoformat(value)
+        elif python_type is UUID:
+            value = UUID(value)
+
+    return value, iterator
+
+
+def paginate_by_cursor(
+    query: Any,
+    model: Any,
+    sort_field: str,
+    sort_order: str,
+    cursor: str,
+    page_size: int,
+) -> Any:
+    """Order a query by (sort column, iterator) and start it after a cursor
+
+    One more row than the page size is selected, so that next_cursor can
+    tell whether there is a further page. NULLs sort last in ascending
+    order and first in descending order, as they do in PostgreSQL.
+    """
+
+    column = getattr(model, sort_field, None)
+    if column is None or not hasattr(column, "type"):
+        raise HTTPException(
+            status_code=400, detail=f"{sort_field} is not a valid field"
+        )
+    iterator = model.iterator
+
+    if sort_order == "ASC":
+        query = query.order_by(column, iterator)
+    else:
+        query = query.order_by(column.desc(), iterator.desc())
+
+    if cursor:
+        value, last_iterator = decode_cursor(
+            cursor, sort_field, sort_order, column
+        )
+        if sort_order == "ASC":
+            if value is None:
+                after = and_(column.is_(None), iterator > last_iterator)
+            else:
+                after = or_(
+                    tuple_(column, iterator) > (value, last_iterator),
+                    column.is_(None),
+                )
+        else:
+            if value is None:
+                after = or_(
+                    and_(column.is_(None), iterator < last_iterator),
+                    column.is_not(None),
+                )
+            else:
+                after = tuple_(column, iterator) < (value, last_iterator)
+        query = query.where(after)
+
+    return query.limit(page_size + 1)
+
+
+def next_cursor(
+    rows: list[Any],
+    sort_field: str,
+    sort_order: str,
+    page_size: int,
+    response: Response,
+) -> list[Any]:
+    """Trim the extra row of a page and set the cursor of the next page"""
+
+    if len(rows) <= page_size:
+        return rows
+
+    rows = rows[:page_size]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+        sort_field,
+        sort_order,
+        getattr(rows[-1], sort_field),
+        rows[-1].iterator,
+    )
+
+    return rows
+
+
+def list_count_key(model: Any) -> str:
+    return f"{LIST_COUNT_KEY_PREFIX}{model.__tablename__}"
+
+
+async def invalidate_list_count(*models: Any) -> None:
+    """Drop the cached counts of models after rows are added or removed
+
+    Best effort, as the cached counts expire anyway.
+    """
+
+    try:
+        for model in models:
+            await cache.delete(list_count_key(model))
+    except Exception as e:
+        print(f"Failed to invalidate list counts: {e}")
+
+
+async def fetch_page(
+    session: AsyncSession,
+    query: Any,
+    count_query: Any,
+    *,
+    window: bool = True,
+    count_key: str | None = None,
+) -> tuple[list[Any], int]:
+    """Get the rows of a page and the total count of the listing
+
+    With count_key, the count is read from the cache, and otherwise
+    counted and cached. With window, the count is selected along with the
+    rows, which is only correct when the query is not filtered beyond
+    count_query (eg. not by a cursor). count_query is executed if neither
+    gives the count, including when the page is empty.
+    """
+
+    total_count = None
+    if count_key is not None:
+        try:
+            total_count = await cache.get(count_key)
+        except Exception as e:
+            print(f"Failed to read list count: {e}")
+    cached = total_count is not None
+
+    if total_count is None and window:
+        res = await session.execute(query.add_columns(func.count().over()))
+        rows = res.all()
+        items = [row[0] for row in rows]
+        if rows:
+            total_count = rows[0][1]
+    else:
+        res = await session.execute(query)
+        items = res.scalars().all()
+
+    if total_count is None:
+        res = await session.execute(count_query)
+        total_count = res.scalar_one()
+
+    if count_key is not None and not cached:
+        try:
+            await cache.set(
+                count_key,
+                total_count,
+                expire=config.LIST_COUNT_CACHE_SECONDS,
+            )
+        except Exception as e:
+            print(f"Failed to cache list count: {e}")
+
+    return items, total_count
@@ -0,0 +1,60 @@
+"""Process pool for CPU-bound work
+
+Work such as decoding videos or hashing files is run in a small pool of
+worker processes, so that it does not block the event loop serving API
+requests. The number of jobs submitted to the pool at once is bounded;
+further callers wait their turn without holding a process.
+"""
+
+from app.config import config
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+import asyncio
+import functools
+import multiprocessing
+
+_executor: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        # Spawn rather than fork, the parent holds an event loop and
+        # connection pools that should not be copied into the children
+        _executor = ProcessPoolExecutor(
+            max_workers=config.PROCESS_POOL_MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    return _executor
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(
+            config.PROCESS_POOL_MAX_WORKERS + config.PROCESS_POOL_MAX_QUEUE
+        )
+
+    return _slots
+
+
+async def run_in_process(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a picklable function in the process pool and await its result"""
+
+    async with _get_slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_process_pool(), functools.partial(func, *args, **kwargs)
+        )
+
+
+def shutdown_process_pool() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,118 @@
+"""Versioned cache of the results of the list and detail endpoints
+
+The UI polls the same listings over and over. Their results are cached in
+Redis, keyed by the scope of the user (admins share one scope), the
+endpoint and its normalised params, and the generations of the resources
+the result was read from.
+
+Each resource has a generation counter that every write path bumps with
+invalidate(). A write thus makes every cached result that read the
+resource unreachable at once, without finding and deleting keys, and
+those results expire on their own. The generations are read before the
+database, so a result read concurrently with a write is stored under the
+old generation and never served.
+
+Results are only cached when the cache is enabled, and any failure of the
+cache falls back to the database.
+"""
+
+from app.config import config
+from app.pagination import invalidate_list_count, NEXT_CURSOR_HEADER
+from app.users.models import User
+from cashews import cache
+from fastapi import Response
+from typing import Any
+import hashlib
+import json
+
+GENERATION_KEY_PREFIX = "generation:"
+QUERY_KEY_PREFIX = "query:"
+
+# Headers of list results, cached along with them
+RESULT_HEADERS = ("Content-Range", NEXT_CURSOR_HEADER)
+
+
+def generation_key(model: Any) -> str:
+    return f"{GENERATION_KEY_PREFIX}{model.__tablename__}"
+
+
+async def invalidate(*models: Any) -> None:
+    """Bump the generations of the resources of models after a write
+
+    Also drops their cached list counts (see app.pagination).
+    """
+
+    if not cache.is_enable():
+        return
+
+    try:
+        for model in models:
+            await cache.incr(generation_key(model))
+    except Exception as e:
+        print(f"Failed to bump query cache generations: {e}")
+
+    await invalidate_list_count(*models)
+
+
+async def query_key(
+    name: str,
+    models: tuple,
+    user: User,
+    params: dict[str, Any],
+) -> str | None:
+    """Key of the result of an endpoint at the current generations
+
+    models are those the result is read from (see app.loaders). Returns
+    None if results cannot be cached.
+    """
+
+    if not cache.is_enable():
+        return None
+
+    try:
+        generations = await cache.get_many(
+            *[generation_key(model) for model in models]
+        )
+    except Exception as e:
+        print(f"Failed to read query cache generations: {e}")
+        return None
+
+    scope = "admin" if user.is_admin else str(user.id)
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    return (
+        f"{QUERY_KEY_PREFIX}{name}:{scope}:"
+        f"{'.'.join(str(generation or 0) for generation in generations)}:"
+        f"{digest}"
+    )
+
+
+def result_headers(response: Response) -> dict[str, str]:
+    return {
+        header: response.headers[header]
+        for header in RESULT_HEADERS
+        if header in response.headers
+    }
+
+
+async def get_query_result(key: str | None) -> Any:
+    if key is None:
+        return None
+
+    try:
+        return await cache.get(key)
+    except Exception as e:
+        print(f"Failed to read query cache: {e}")
+        return None
+
+
+async def set_query_result(key: str | None, result: Any) -> None:
+    if key is None:
+        return
+
+    try:
+        await cache.set(key, result, expire=config.QUERY_CACHE_SECONDS)
+    except Exception as e:
+        print(f"Failed to write query cache: {e}")
@@ -0,0 +1,49 @@
+"""Responses serialized straight from the read models
+
+For what an endpoint returns, FastAPI validates it against the
+response_model again, converts it to plain Python with jsonable_encoder and
+encodes that with the json module. The list endpoints validate their rows
+into read models already, so they return read_model_response() instead,
+which serializes the models to JSON in one pass with pydantic-core and
+skips the rest. Endpoints keep their response_model for the OpenAPI
+schema.
+"""
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from typing import Any
+import functools
+
+
+@functools.cache
+def json_adapter(model: Any) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def read_model_response(
+    content: Any,
+    model: Any,
+    response: Response | None = None,
+) -> Response:
+    """Respond with a read model, or a list of them, as JSON
+
+    The headers set on response (the endpoint's Response parameter, which
+    FastAPI ignores once a Response is returned) are carried over.
+    """
+
+    if isinstance(content, list):
+        model = list[model]
+
+    headers = None
+    if response is not None:
+        headers = {
+            header: value
+            for header, value in response.headers.items()
+            if header != "content-length"
+        }
+
+    return Response(
+        content=json_adapter(model).dump_json(content),
+        media_type="application/json",
+        headers=headers,
+    )
@@ -3,21 +3,18 @@ from sqlalchemy.sql import text
 from app.submissions.k8s import get_kubernetes_status
 from app.auth.models import KeycloakConfig
 from app.config import config
-from app.objects.service import get_s3_status
+from app.status.service import get_s3_available
 from fastapi import (
     status,
     Depends,
     HTTPException,
     APIRouter,
     Request,
-    BackgroundTasks,
 )
 from fastapi.responses import JSONResponse
 from app.root.models import HealthCheck
 from app.objects import hooks
 from app.auth.services import get_user_info, get_payload
-from app.objects.service import get_s3
-from aioboto3 import Session as S3Session
 
 router = APIRouter()
 
@@ -52,7 +49,7 @@ async def get_health(
 
     # Query kubernetes API to check RCP:RunAI connection
     _, k8s = await get_kubernetes_status(session)
-    _, s3 = await get_s3_status()
+    s3 = await get_s3_available()
 
     if not k8s or not s3:
         raise HTTPException(
@@ -66,9 +63,6 @@ async def get_health(
 async def handle_file_upload(
     request: Request,
     session: AsyncSession = Depends(get_session),
-    s3: S3Session = Depends(get_s3),
-    *,
-    background: BackgroundTasks,
 ):
     # Read the JSON payload from the request
     payload = await request.json()
@@ -92,13 +86,13 @@ async def handle_file_upload(
         return await hooks.post_receive(session, user, payload)
 
     if payload["Type"] == "post-create":
-        return await hooks.post_create(session, user, payload, s3, background)
+        return await hooks.post_create(session, user, payload)
 
     if payload["Type"] == "pre-finish":
         return await hooks.pre_finish(session, user, payload)
 
     if payload["Type"] == "post-finish":
-        return await hooks.post_finish(session, user, payload, s3, background)
+        return await hooks.post_finish(session, user, payload)
 
     return JSONResponse(
         content={"message": "No hook found for this event type"},
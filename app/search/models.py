@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from uuid import UUID
+from enum import Enum
+import datetime
+
+
+class SearchResultType(str, Enum):
+    INPUT_OBJECT = "input_object"
+    SUBMISSION = "submission"
+    TRANSECT = "transect"
+
+
+class SearchResult(BaseModel):
+    """An object, submission or transect whose name matches a search"""
+
+    type: SearchResultType
+    id: UUID
+    name: str | None = None  # Filename of objects
+    owner: UUID
+    created: datetime.datetime | None = None
+    score: float  # Trigram similarity of the name or description to the query
@@ -0,0 +1,100 @@
+from fastapi import Depends, APIRouter, Query
+from app.db import get_session, AsyncSession
+from app.objects.models import InputObject
+from app.submissions.models import Submission
+from app.transects.models import Transect
+from app.search.models import SearchResult, SearchResultType
+from app.users.models import User
+from app.auth.services import get_user_info
+from app.matching import contains
+from sqlalchemy import func, literal, or_, union_all
+from sqlmodel import select
+from typing import Any
+
+router = APIRouter()
+
+# Shorter queries have no trigram to look up in the indexes
+MIN_QUERY_LENGTH = 3
+MAX_RESULTS = 100
+
+
+def search_query(
+    model: Any,
+    type: SearchResultType,
+    created: Any,
+    columns: list[Any],
+    q: str,
+    user: User,
+) -> Any:
+    """Select the rows of a model with any of columns matching q
+
+    Each column has a trigram index, so the ILIKEs are index scans.
+    """
+
+    query = select(
+        literal(type.value).label("type"),
+        model.id.label("id"),
+        columns[0].label("name"),
+        model.owner.label("owner"),
+        created.label("created"),
+        func.greatest(
+            *[func.similarity(func.coalesce(c, ""), q) for c in columns], 0
+        ).label("score"),
+    ).where(
+        or_(*[contains(column, q) for column in columns]),
+        model.deleted_utc.is_(None),
+    )
+    if not user.is_admin:
+        query = query.where(model.owner == user.id)
+
+    return query
+
+
+@router.get("", response_model=list[SearchResult])
+async def search(
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+    *,
+    q: str = Query(..., min_length=MIN_QUERY_LENGTH),
+    type: list[SearchResultType] | None = Query(None),
+    limit: int = Query(20, ge=1, le=MAX_RESULTS),
+) -> list[SearchResult]:
+    """Search objects, submissions and transects by name in one query
+
+    Names (filenames of objects) and descriptions are matched anywhere,
+    case-insensitively, and the best matches by trigram similarity are
+    returned first.
+    """
+
+    queries = {
+        SearchResultType.INPUT_OBJECT: (
+            InputObject,
+            InputObject.time_added_utc,
+            [InputObject.filename],
+        ),
+        SearchResultType.SUBMISSION: (
+            Submission,
+            Submission.time_added_utc,
+            [Submission.name, Submission.description],
+        ),
+        SearchResultType.TRANSECT: (
+            Transect,
+            Transect.created_on,
+            [Transect.name, Transect.description],
+        ),
+    }
+    matches = union_all(
+        *[
+            search_query(model, result_type, created, columns, q, user)
+            for result_type, (model, created, columns) in queries.items()
+            if not type or result_type in type
+        ]
+    ).subquery()
+
+    res = await session.execute(
+        select(matches)
+        .order_by(matches.c.score.desc(), matches.c.created.desc())
+        .limit(limit)
+    )
+
+    return [SearchResult.model_validate(row._mapping) for row in res.all()]
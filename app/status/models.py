@@ -1,5 +1,31 @@
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, Field
+from sqlalchemy import BigInteger
+from sqlalchemy.sql import func
 from typing import Any
+from uuid import UUID
+import datetime
+
+
+class StorageUsage(SQLModel, table=True):
+    """Running object and byte counts of the bucket by folder and owner
+
+    Updated as objects are uploaded, generated and deleted, and corrected
+    periodically against a listing of the bucket.
+    """
+
+    folder: str = Field(primary_key=True)  # inputs, outputs or other
+    owner: UUID = Field(primary_key=True)
+    object_count: int = Field(default=0, sa_type=BigInteger)
+    size_bytes: int = Field(default=0, sa_type=BigInteger)
+    last_updated: datetime.datetime = Field(
+        default_factory=datetime.datetime.now,
+        title="Last Updated",
+        description="Date and time when the record was last updated",
+        sa_column_kwargs={
+            "onupdate": func.now(),
+            "server_default": func.now(),
+        },
+    )
 
 
 class S3Status(SQLModel):
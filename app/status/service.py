@@ -0,0 +1,279 @@
+"""Storage usage ledger of the bucket
+
+Rather than listing the bucket to report its usage, object and byte counts
+are kept per folder and owner in the storageusage table. They are updated
+by the upload hooks, deletions and the ingestion of job outputs, and a
+periodic reconciliation corrects any drift (eg. writes outside of the API).
+
+Inputs are counted by the declared size of their input object from the
+moment the upload is created, so that storage quotas are enforced against
+uploads in progress too.
+"""
+
+from app.config import config
+from app.db import AsyncSession
+from app.objects.models import InputObject
+from app.objects.service import open_s3_client
+from app.submissions.models import Submission
+from app.status.models import StorageUsage, S3Status
+from app.tasks.service import register_periodic
+from app.users.models import User
+from cashews import cache
+from collections import defaultdict
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select, delete
+from typing import Any
+from uuid import UUID
+
+INPUTS_FOLDER = "inputs"
+OUTPUTS_FOLDER = "outputs"
+OTHER_FOLDER = "other"
+
+# Owner of keys that cannot be attributed to an input object or submission
+UNATTRIBUTED_OWNER = UUID(int=0)
+
+# Number of IDs per query when attributing keys to their owners
+OWNER_LOOKUP_BATCH_SIZE = 1000
+
+
+async def record_storage_usage(
+    session: AsyncSession,
+    folder: str,
+    owner: UUID | str,
+    object_count: int,
+    size_bytes: int,
+    limit_bytes: int | None = None,
+) -> bool:
+    """Add to (or with negative values, remove from) the usage of an owner
+
+    With a limit, nothing is recorded if the owner's usage of the folder
+    would exceed it. The check and the update are a single statement, so
+    concurrent uploads cannot overshoot the limit together.
+
+    Returns whether the usage was recorded. Not committed, so that it is
+    part of the caller's transaction.
+    """
+
+    if limit_bytes is not None and size_bytes > limit_bytes:
+        return False
+
+    query = insert(StorageUsage).values(
+        folder=folder,
+        owner=owner,
+        object_count=object_count,
+        size_bytes=size_bytes,
+    )
+    query = query.on_conflict_do_update(
+        index_elements=[StorageUsage.folder, StorageUsage.owner],
+        set_={
+            "object_count": StorageUsage.object_count + object_count,
+            "size_bytes": StorageUsage.size_bytes + size_bytes,
+            "last_updated": func.now(),
+        },
+        where=(
+            StorageUsage.size_bytes + size_bytes <= limit_bytes
+            if limit_bytes is not None
+            else None
+        ),
+    ).returning(StorageUsage.owner)
+    res = await session.exec(query)
+
+    return res.first() is not None
+
+
+def get_storage_quota(user: User) -> int | None:
+    """Bytes of inputs the user may store, None if unlimited
+
+    A quota set for the user takes precedence over those of their roles,
+    of which the most generous applies.
+    """
+
+    if user.id in config.STORAGE_QUOTA_BYTES_BY_USER:
+        return config.STORAGE_QUOTA_BYTES_BY_USER[user.id]
+
+    quotas = [
+        config.STORAGE_QUOTA_BYTES_BY_ROLE[role]
+        for role in user.realm_roles
+        if role in config.STORAGE_QUOTA_BYTES_BY_ROLE
+    ]
+    if not quotas or None in quotas:
+        return None
+
+    return max(quotas)
+
+
+async def get_storage_usage(
+    session: AsyncSession,
+    owner: UUID | str | None = None,
+) -> S3Status:
+    """Usage of the bucket, or of one owner, summed from the ledger"""
+
+    query = select(
+        StorageUsage.folder,
+        func.sum(StorageUsage.object_count),
+        func.sum(StorageUsage.size_bytes),
+    ).group_by(StorageUsage.folder)
+    if owner is not None:
+        query = query.where(StorageUsage.owner == owner)
+    res = await session.exec(query)
+
+    usage = S3Status()
+    for folder, object_count, size_bytes in res.all():
+        if folder == INPUTS_FOLDER:
+            usage.input_object_count = object_count
+            usage.input_size = size_bytes
+        elif folder == OUTPUTS_FOLDER:
+            usage.output_object_count = object_count
+            usage.output_size = size_bytes
+        usage.total_object_count += object_count
+        usage.total_size += size_bytes
+
+    return usage
+
+
+@cache.early(ttl="30s", early_ttl="10s", key="s3:available")
+async def get_s3_available() -> bool:
+    try:
+        s3 = await open_s3_client()
+        await s3.head_bucket(Bucket=config.S3_BUCKET_ID)
+    except Exception as e:
+        print(f"S3 is not available: {e}")
+        return False
+
+    return True
+
+
+async def get_s3_status(
+    session: AsyncSession,
+    owner: UUID | str | None = None,
+) -> tuple[S3Status, bool]:
+    """Usage of the bucket from the ledger and whether S3 is reachable"""
+
+    return await get_storage_usage(session, owner), await get_s3_available()
+
+
+def resource_of_key(key: str) -> tuple[str, str | None]:
+    """Get the folder of a key and the ID of the resource it belongs to
+
+    eg. ("inputs", "<object id>") for <prefix>/inputs/<object id>.info and
+    ("outputs", "<submission id>") for <prefix>/outputs/<submission id>/...
+    """
+
+    parts = key[len(config.S3_PREFIX) + 1 :].split("/")
+    if len(parts) < 2 or parts[0] not in (INPUTS_FOLDER, OUTPUTS_FOLDER):
+        return OTHER_FOLDER, None
+
+    # tusd appends .info/.part and +<multipart upload ID> to input keys
+    resource_id = parts[1].split("+")[0].split(".")[0]
+
+    return parts[0], resource_id
+
+
+async def get_owners(
+    session: AsyncSession,
+    model: type[InputObject] | type[Submission],
+    ids: list[str],
+) -> dict[str, UUID]:
+    owners = {}
+    valid_ids = []
+    for resource_id in ids:
+        try:
+            valid_ids.append(UUID(resource_id))
+        except ValueError:
+            continue
+
+    for i in range(0, len(valid_ids), OWNER_LOOKUP_BATCH_SIZE):
+        batch = valid_ids[i : i + OWNER_LOOKUP_BATCH_SIZE]
+        res = await session.exec(
+            select(model.id, model.owner).where(model.id.in_(batch))
+        )
+        owners.update({str(id): owner for id, owner in res.all()})
+
+    return owners
+
+
+@register_periodic(
+    "reconcile_storage_usage", config.STORAGE_USAGE_RECONCILE_INTERVAL
+)
+async def reconcile_storage_usage(
+    s3: Any,
+    session: AsyncSession,
+) -> None:
+    """Rebuild the storage usage ledger
+
+    Inputs are counted from their input objects and everything else from a
+    listing of the bucket, including input keys without an input object.
+    Changes recorded while the bucket is being listed may be counted twice
+    or not at all, and are corrected by the next reconciliation.
+    """
+
+    # (folder, resource ID) -> [object count, size]
+    resources: dict[tuple[str, str | None], list[int]] = defaultdict(
+        lambda: [0, 0]
+    )
+    paginator = s3.get_paginator("list_objects_v2")
+    async for page in paginator.paginate(
+        Bucket=config.S3_BUCKET_ID, Prefix=f"{config.S3_PREFIX}/"
+    ):
+        for obj in page.get("Contents", []):
+            counts = resources[resource_of_key(obj["Key"])]
+            counts[0] += 1
+            counts[1] += obj["Size"]
+
+    owners = {
+        INPUTS_FOLDER: await get_owners(
+            session,
+            InputObject,
+            [id for folder, id in resources if folder == INPUTS_FOLDER],
+        ),
+        OUTPUTS_FOLDER: await get_owners(
+            session,
+            Submission,
+            [id for folder, id in resources if folder == OUTPUTS_FOLDER],
+        ),
+    }
+
+    # (folder, owner) -> [object count, size]
+    usage: dict[tuple[str, UUID], list[int]] = defaultdict(lambda: [0, 0])
+    for (folder, resource_id), (object_count, size_bytes) in resources.items():
+        if folder == INPUTS_FOLDER and resource_id in owners[INPUTS_FOLDER]:
+            continue  # Counted from the input object below
+        owner = owners.get(folder, {}).get(resource_id, UNATTRIBUTED_OWNER)
+        usage[(folder, owner)][0] += object_count
+        usage[(folder, owner)][1] += size_bytes
+
+    res = await session.exec(
+        select(
+            InputObject.owner,
+            func.count(),
+            func.coalesce(func.sum(InputObject.size_bytes), 0),
+        ).group_by(InputObject.owner)
+    )
+    for owner, object_count, size_bytes in res.all():
+        usage[(INPUTS_FOLDER, owner)][0] += object_count
+        usage[(INPUTS_FOLDER, owner)][1] += size_bytes
+
+    await session.exec(delete(StorageUsage))
+    if usage:
+        await session.exec(
+            insert(StorageUsage).values(
+                [
+                    dict(
+                        folder=folder,
+                        owner=owner,
+                        object_count=object_count,
+                        size_bytes=size_bytes,
+                    )
+                    for (folder, owner), (object_count, size_bytes) in (
+                        usage.items()
+                    )
+                ]
+            )
+        )
+    await session.commit()
+
+    print(
+        f"Reconciled storage usage of {len(resources)} resources "
+        f"({sum(count for count, _ in usage.values())} objects)"
+    )
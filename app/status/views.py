@@ -3,7 +3,7 @@ from typing import Any
 from app.submissions.k8s import get_kubernetes_status
 from fastapi import Depends
 from app.status.models import StatusRead, S3Status
-from app.objects.service import get_s3_status
+from app.status.service import get_s3_status
 from app.users.models import User
 from app.auth.services import get_user_info
 from app.db import get_session, AsyncSession
@@ -18,7 +18,7 @@ async def get_jobs(
 ) -> Any:
     """Get all kubernetes jobs in the namespace"""
     k8s_jobs, kubernetes_status = await get_kubernetes_status(session)
-    s3_local, s3_status = await get_s3_status()
+    s3_local, s3_status = await get_s3_status(session)
 
     obj = StatusRead(
         kubernetes=k8s_jobs if user.is_admin else [],
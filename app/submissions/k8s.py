@@ -1,7 +1,7 @@
 from kubernetes import client, config as k8s_config
 from app.config import config
 from uuid import UUID
-from app.submissions.models import KubernetesExecutionStatus
+from app.submissions.models import KubernetesExecutionStatus, Submission
 from typing import Any
 from kubernetes.client import CoreV1Api, ApiClient, CustomObjectsApi
 from cashews import cache
@@ -9,6 +9,7 @@ from fastapi.concurrency import run_in_threadpool
 from app.db import AsyncSession
 from app.submissions.status.models import RunStatus
 from sqlmodel import update, select
+from app.query_cache import invalidate
 import os
 import json
 import yaml
@@ -190,7 +191,7 @@ async def get_kubernetes_status(session: AsyncSession) -> Any:
     # and update their kubernetes status to False
     jobs = [strip_pod_name(job["name"]) for job in k8s_jobs]
 
-    await session.exec(
+    deleted = await session.exec(
         update(RunStatus)
         .where(RunStatus.kubernetes_pod_name.notin_(jobs))
         .where(RunStatus.is_still_kubernetes_resource)
@@ -201,6 +202,8 @@ async def get_kubernetes_status(session: AsyncSession) -> Any:
         )
     )
     await session.commit()
+    if deleted.rowcount:
+        await invalidate(Submission)
 
     return k8s_jobs, k8s
 
@@ -5,6 +5,7 @@ from sqlmodel import (
     JSON,
     Column,
     UniqueConstraint,
+    Index,
 )
 from uuid import uuid4, UUID
 import datetime
@@ -18,7 +19,7 @@ from typing import Any, TYPE_CHECKING
 from typing_extensions import Self
 from pydantic import model_validator
 from geoalchemy2 import WKBElement
-import shapely
+from app.transects.geometry import geom_mapping
 from app.submissions.status.models import RunStatus
 
 if TYPE_CHECKING:
@@ -59,7 +60,29 @@ class SubmissionBase(SQLModel):
 
 
 class Submission(SubmissionBase, table=True):
-    __table_args__ = (UniqueConstraint("id"),)
+    __table_args__ = (
+        UniqueConstraint("id"),
+        # Keyset pagination of a user's submissions by time added
+        Index(
+            "ix_submission_owner_time_added_utc_iterator",
+            "owner",
+            "time_added_utc",
+            "iterator",
+        ),
+        # Substring (ILIKE) filters and search, with pg_trgm
+        Index(
+            "ix_submission_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_submission_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
+    )
     iterator: int = Field(
         default=None,
         nullable=False,
@@ -77,26 +100,30 @@ class Submission(SubmissionBase, table=True):
         index=True,
     )
     owner: UUID = Field(nullable=False, index=True)
+    # Set when deletion is requested, until the deletion task removes the row
+    deleted_utc: datetime.datetime | None = Field(default=None, index=True)
+    # Set when the outputs of the run are first listed into the manifest
+    outputs_listed_utc: datetime.datetime | None = Field(default=None)
 
     inputs: list[InputObject] = Relationship(
         back_populates="submissions",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
         link_model=InputObjectAssociations,
     )
 
     input_associations: list[InputObjectAssociations] = Relationship(
         back_populates="submission",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
     transect: "Transect" = Relationship(
         back_populates="submissions",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
     run_status: list[RunStatus] = Relationship(
         back_populates="submission",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
 
@@ -119,6 +146,7 @@ class SubmissionFileOutputs(SQLModel):
     filename: str
     size_bytes: int
     last_modified: datetime.datetime
+    content_type: str | None = None
     url: str
 
 
@@ -144,9 +172,8 @@ class TransectRead(SQLModel):
 
         if isinstance(values.geom, WKBElement):
             if values.geom is not None:
-                shapely_obj = shapely.wkb.loads(str(values.geom))
-                if shapely_obj is not None:
-                    mapping = shapely.geometry.mapping(shapely_obj)
+                mapping = geom_mapping(values.geom)
+                if mapping is not None:
                     values.latitude_start = mapping["coordinates"][0][1]
                     values.longitude_start = mapping["coordinates"][0][0]
                     values.latitude_end = mapping["coordinates"][-1][1]
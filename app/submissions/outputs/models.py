@@ -0,0 +1,40 @@
+from sqlmodel import SQLModel, Field, Column, ForeignKey
+from sqlalchemy import BigInteger
+from uuid import uuid4, UUID
+import datetime
+
+
+class SubmissionOutputBase(SQLModel):
+    submission_id: UUID = Field(
+        sa_column=Column(
+            ForeignKey("submission.id", ondelete="CASCADE"),
+            index=True,
+            nullable=False,
+        )
+    )
+    key: str = Field(unique=True)
+    filename: str
+    size_bytes: int = Field(sa_type=BigInteger)
+    etag: str | None = Field(default=None)
+    last_modified: datetime.datetime
+    content_type: str | None = Field(default=None)
+
+
+class SubmissionOutput(SubmissionOutputBase, table=True):
+    # Manifest of the files a run wrote to outputs/{submission_id}/ in S3
+    id: UUID = Field(
+        default_factory=uuid4,
+        index=True,
+        nullable=False,
+        primary_key=True,
+    )
+
+
+class TilePyramid(SQLModel):
+    # A tile pyramid of a raster output, and the token to read its tiles
+    # from /download/tiles/{token}/{z}/{x}/{y}.png
+    token: str
+    width: int
+    height: int
+    tile_size: int
+    max_zoom: int
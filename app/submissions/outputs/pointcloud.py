@@ -0,0 +1,293 @@
+"""Levels of detail of point cloud outputs, run in the process pool
+
+A PLY point cloud is voxel-downsampled into levels on nested grids, from
+level 0 with POINT_CLOUD_BASE_GRID_CELLS cells along its longest axis, each
+level doubling the cells of the one before. Each point of a level is the
+centroid (and mean colour) of the points in its voxel. The levels are
+built from the finest down, weighting each voxel by the number of points
+it holds, so that the coarser levels are exact without rereading the cloud.
+
+Levels are encoded in a compact little-endian format for the browser:
+
+    header  magic b"PCLD", flags (uint32, bit 0: has colours),
+            point count (uint32), bounds min x, y, z and max x, y, z
+            (float32)
+    points  x, y, z (uint16 each), quantized within the bounds
+    colours r, g, b (uint8 each), if flagged
+
+Kept free of database and S3 imports so that it is cheap to load in the
+pool's worker processes.
+"""
+
+import numpy as np
+import struct
+
+MAGIC = b"PCLD"
+HEADER = struct.Struct("<4sII6f")
+FLAG_COLOURS = 1
+QUANTIZATION_STEPS = 65535
+
+PLY_TYPES = {
+    "char": "i1",
+    "int8": "i1",
+    "uchar": "u1",
+    "uint8": "u1",
+    "short": "i2",
+    "int16": "i2",
+    "ushort": "u2",
+    "uint16": "u2",
+    "int": "i4",
+    "int32": "i4",
+    "uint": "u4",
+    "uint32": "u4",
+    "float": "f4",
+    "float32": "f4",
+    "double": "f8",
+    "float64": "f8",
+}
+PLY_FORMATS = {
+    "ascii": None,
+    "binary_little_endian": "<",
+    "binary_big_endian": ">",
+}
+
+
+class PointCloudError(Exception):
+    """Raised when a point cloud cannot be read"""
+
+
+def read_ply(filename: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Read the vertex positions, and colours if any, of a PLY file
+
+    Returns an (N, 3) float64 array of positions and an (N, 3) uint8 array
+    of colours or None. Elements before the vertices must have fixed size
+    properties (ie. no lists) in binary files, and the vertices must be the
+    first element of ASCII files.
+    """
+
+    with open(filename, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise PointCloudError("Not a PLY file")
+
+        file_format = None
+        elements: list[tuple[str, int, list[tuple[str, str]]]] = []
+        while True:
+            line = f.readline()
+            if not line:
+                raise PointCloudError("PLY header has no end_header")
+            words = line.decode("ascii", errors="replace").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                file_format = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property" and elements:
+                if words[1] == "list":
+                    elements[-1][2].append(("list", words[-1]))
+                else:
+                    elements[-1][2].append((words[1], words[2]))
+
+        if file_format not in PLY_FORMATS:
+            raise PointCloudError(f"Unsupported PLY format {file_format}")
+        byte_order = PLY_FORMATS[file_format]
+
+        offset = 0
+        for name, count, properties in elements:
+            if any(
+                ply_type == "list" or ply_type not in PLY_TYPES
+                for ply_type, _ in properties
+            ):
+                if name == "vertex":
+                    raise PointCloudError("Unsupported vertex properties")
+                raise PointCloudError(f"Cannot skip PLY element {name}")
+
+            if name == "vertex":
+                break
+            if byte_order is None:
+                raise PointCloudError("Vertices must come first in ASCII")
+            offset += (
+                count
+                * np.dtype([(p, PLY_TYPES[t]) for t, p in properties]).itemsize
+            )
+        else:
+            raise PointCloudError("PLY file has no vertices")
+
+        names = [property_name for _, property_name in properties]
+        if not {"x", "y", "z"} <= set(names):
+            raise PointCloudError("PLY vertices have no x, y, z")
+
+        if byte_order is None:
+            data = np.loadtxt(f, dtype=np.float64, max_rows=count, ndmin=2)
+            columns = {name: data[:, i] for i, name in enumerate(names)}
+        else:
+            dtype = np.dtype(
+                [(p, byte_order + PLY_TYPES[t]) for t, p in properties]
+            )
+            f.seek(offset, 1)
+            data = np.fromfile(f, dtype=dtype, count=count)
+            columns = {name: data[name] for name in names}
+
+    if len(columns["x"]) != count:
+        raise PointCloudError("PLY file is truncated")
+
+    positions = np.stack(
+        [columns["x"], columns["y"], columns["z"]], axis=1
+    ).astype(np.float64)
+
+    colours = None
+    if {"red", "green", "blue"} <= set(columns):
+        colours = np.stack(
+            [columns["red"], columns["green"], columns["blue"]], axis=1
+        )
+        if colours.dtype.kind == "f":  # Floats are in the range [0, 1]
+            colours = colours * 255
+        colours = np.clip(colours, 0, 255).astype(np.uint8)
+
+    return positions, colours
+
+
+def voxel_downsample(
+    positions: np.ndarray,
+    colours: np.ndarray | None,
+    weights: np.ndarray,
+    origin: np.ndarray,
+    voxel_size: float,
+) -> tuple[np.ndarray, np.ndarray | None, np.ndarray]:
+    """Merge the points in each voxel of a grid into their centroid
+
+    Points are weighted by the number of original points they stand for.
+    Returns the positions, colours and weights of the merged points.
+    """
+
+    cells = np.floor((positions - origin) / voxel_size).astype(np.int64)
+    cells = np.maximum(cells, 0)
+    dims = cells.max(axis=0) + 1
+    keys = np.ravel_multi_index(cells.T, dims)
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+
+    merged_weights = np.bincount(inverse, weights=weights)
+    merged_positions = (
+        np.stack(
+            [
+                np.bincount(inverse, weights=positions[:, i] * weights)
+                for i in range(3)
+            ],
+            axis=1,
+        )
+        / merged_weights[:, None]
+    )
+
+    merged_colours = None
+    if colours is not None:
+        merged_colours = (
+            np.stack(
+                [
+                    np.bincount(inverse, weights=colours[:, i] * weights)
+                    for i in range(3)
+                ],
+                axis=1,
+            )
+            / merged_weights[:, None]
+        )
+        merged_colours = np.rint(merged_colours).astype(np.uint8)
+
+    return merged_positions, merged_colours, merged_weights
+
+
+def encode_point_cloud(
+    positions: np.ndarray,
+    colours: np.ndarray | None,
+    bounds_min: np.ndarray,
+    bounds_max: np.ndarray,
+) -> bytes:
+    """Encode points in the compact format described above"""
+
+    extent = np.where(bounds_max > bounds_min, bounds_max - bounds_min, 1)
+    quantized = np.rint((positions - bounds_min) / extent * QUANTIZATION_STEPS)
+    quantized = np.clip(quantized, 0, QUANTIZATION_STEPS).astype("<u2")
+
+    header = HEADER.pack(
+        MAGIC,
+        FLAG_COLOURS if colours is not None else 0,
+        len(positions),
+        *bounds_min.astype(np.float32),
+        *bounds_max.astype(np.float32),
+    )
+    body = header + quantized.tobytes()
+    if colours is not None:
+        body += colours.astype(np.uint8).tobytes()
+
+    return body
+
+
+def decode_point_cloud(
+    data: bytes,
+) -> tuple[np.ndarray, np.ndarray | None]:
+    """Decode the (positions, colours) of a level"""
+
+    magic, flags, count, *bounds = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise PointCloudError("Not an encoded point cloud")
+    bounds_min = np.array(bounds[:3], dtype=np.float64)
+    bounds_max = np.array(bounds[3:], dtype=np.float64)
+
+    quantized = np.frombuffer(
+        data, dtype="<u2", count=count * 3, offset=HEADER.size
+    ).reshape(-1, 3)
+    extent = np.where(bounds_max > bounds_min, bounds_max - bounds_min, 1)
+    positions = quantized / QUANTIZATION_STEPS * extent + bounds_min
+
+    colours = None
+    if flags & FLAG_COLOURS:
+        colours = np.frombuffer(
+            data,
+            dtype=np.uint8,
+            count=count * 3,
+            offset=HEADER.size + quantized.nbytes,
+        ).reshape(-1, 3)
+
+    return positions, colours
+
+
+def point_count(data: bytes) -> int:
+    """Number of points of an encoded level, read from its header"""
+
+    return HEADER.unpack_from(data)[2]
+
+
+def build_levels(
+    filename: str,
+    level_count: int,
+    base_grid_cells: int,
+) -> list[bytes]:
+    """Read a PLY file and encode its levels of detail, coarsest first"""
+
+    positions, colours = read_ply(filename)
+    if not len(positions):
+        raise PointCloudError("PLY file has no points")
+
+    bounds_min = positions.min(axis=0)
+    bounds_max = positions.max(axis=0)
+    # Widened a little, so that points on the far bounds fall in the last
+    # cell rather than one past it
+    longest = float((bounds_max - bounds_min).max()) * (1 + 1e-9) or 1.0
+    weights = np.ones(len(positions))
+
+    levels = []
+    for level in reversed(range(level_count)):
+        positions, colours, weights = voxel_downsample(
+            positions,
+            colours,
+            weights,
+            bounds_min,
+            longest / (base_grid_cells * 2**level),
+        )
+        levels.append(
+            encode_point_cloud(positions, colours, bounds_min, bounds_max)
+        )
+
+    return levels[::-1]
@@ -0,0 +1,100 @@
+"""Tile pyramids of raster outputs, run in the process pool
+
+A raster (eg. an orthomosaic or a segmentation overlay) is cut into square
+PNG tiles at every zoom level, for XYZ tile viewers. At the maximum zoom
+the raster is at full resolution; each lower zoom halves it, down to zoom 0
+where it fits in a single tile. Tiles are numbered {z}/{x}/{y} from the top
+left, and those on the right and bottom edges are padded with transparency
+so that every tile has the same size.
+
+Kept free of database and S3 imports so that it is cheap to load in the
+pool's worker processes.
+"""
+
+import cv2
+import math
+import numpy as np
+import os
+
+RASTER_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+
+class TileError(Exception):
+    """Raised when a raster cannot be tiled"""
+
+
+def max_zoom(width: int, height: int, tile_size: int) -> int:
+    """Zoom at which the raster is at full resolution"""
+
+    return max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+
+
+def to_bgra(image: np.ndarray) -> np.ndarray:
+    """Convert a decoded image to 8-bit BGRA, for transparent padding"""
+
+    if image.dtype != np.uint8:
+        # eg. 16-bit TIFFs, scaled to their own range
+        image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX)
+        image = image.astype(np.uint8)
+
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+    if image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+
+    return image
+
+
+def build_pyramid(
+    filename: str,
+    directory: str,
+    tile_size: int,
+) -> tuple[int, int, int]:
+    """Write the tiles of a raster to {directory}/{z}/{x}/{y}.png
+
+    Each zoom is resampled from the one above it with area interpolation.
+    Returns the (width, height, max zoom) of the raster.
+    """
+
+    image = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise TileError("Cannot decode the raster")
+    image = to_bgra(image)
+
+    height, width = image.shape[:2]
+    top_zoom = max_zoom(width, height, tile_size)
+
+    for zoom in reversed(range(top_zoom + 1)):
+        if zoom < top_zoom:
+            image = cv2.resize(
+                image,
+                (
+                    max(1, math.ceil(image.shape[1] / 2)),
+                    max(1, math.ceil(image.shape[0] / 2)),
+                ),
+                interpolation=cv2.INTER_AREA,
+            )
+
+        for x in range(math.ceil(image.shape[1] / tile_size)):
+            os.makedirs(os.path.join(directory, str(zoom), str(x)))
+            for y in range(math.ceil(image.shape[0] / tile_size)):
+                tile = image[
+                    y * tile_size : (y + 1) * tile_size,
+                    x * tile_size : (x + 1) * tile_size,
+                ]
+                if tile.shape[:2] != (tile_size, tile_size):
+                    tile = cv2.copyMakeBorder(
+                        tile,
+                        0,
+                        tile_size - tile.shape[0],
+                        0,
+                        tile_size - tile.shape[1],
+                        cv2.BORDER_CONSTANT,
+                        value=(0, 0, 0, 0),
+                    )
+                cv2.imwrite(
+                    os.path.join(directory, str(zoom), str(x), f"{y}.png"),
+                    tile,
+                )
+
+    return width, height, top_zoom
@@ -47,7 +47,10 @@ class RunStatus(RunStatusBase, table=True):
         primary_key=True,
     )
 
-    submission: "Submission" = Relationship(back_populates="run_status")
+    submission: "Submission" = Relationship(
+        back_populates="run_status",
+        sa_relationship_kwargs={"lazy": "raise"},
+    )
 
 
 class RunStatusCreate(RunStatusBase):
@@ -63,6 +66,16 @@ class RunStatusUpdate(RunStatusBase):
     pass
 
 
+class RunStatusReadSimple(SQLModel):
+    # A run status without its logs, for listings of submissions
+    id: UUID
+    status: str | None = None
+    is_running: bool = False
+    is_successful: bool = False
+    time_started: str | None = None
+    last_updated: datetime.datetime
+
+
 class RunStatusLogRead(SQLModel):
     id: str
     message: str
@@ -5,11 +5,34 @@ from app.db import AsyncSession
 from uuid import UUID
 from aioboto3 import Session as S3Session
 from botocore.exceptions import ClientError
-from sqlmodel import select, update
+from sqlmodel import select, update, delete
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 from app.submissions.k8s import get_cached_submission_jobs, get_cached_job_log
+from app.tasks.service import register_task, enqueue, enqueue_unique
+from app.events.service import publish_event
+from app.events.models import EventType
+from app.status.service import record_storage_usage, OUTPUTS_FOLDER
+from app.submissions.outputs.models import SubmissionOutput
+from app.submissions.outputs.pointcloud import (
+    PointCloudError,
+    build_levels,
+    point_count,
+)
+from app.submissions.outputs.tiles import TileError, build_pyramid
+from app.objects.service import download_to_scratch
+from app.processing import run_in_process
+from app.query_cache import invalidate
+import asyncio
 import json
 import datetime
-import asyncio
+import mimetypes
+import os
+import shutil
+import tempfile
+
+# Tiles uploaded to S3 at once when a pyramid is built
+TILE_UPLOAD_CONCURRENCY = 16
 
 
 async def populate_percentage_covers(
@@ -68,6 +91,7 @@ async def populate_percentage_covers(
         )
         await session.exec(update_query)
         await session.commit()
+        await invalidate(Submission)
     except ClientError:
         return submission
 
@@ -80,54 +104,459 @@ async def populate_percentage_covers(
     return submission
 
 
-async def iteratively_check_status(
+async def refresh_output_manifest(
+    submission_id: UUID,
+    owner: UUID,
     session: AsyncSession,
     s3: S3Session,
-    submission_id: UUID,
-    job_id: str,
-    timeout: int = config.SUBMISSION_JOB_CHECK_TIMEOUT,
+) -> list[SubmissionOutput]:
+    """Replace the output manifest of a submission with a listing of S3
+
+    Lists all pages of outputs/{submission_id}/ and records the difference
+    with the previous manifest in the owner's storage usage. The submission
+    row is locked until the manifest is committed, so that concurrent
+    refreshes are applied one after the other.
+    """
+
+    await session.exec(
+        select(Submission.id)
+        .where(Submission.id == submission_id)
+        .with_for_update()
+    )
+    res = await session.exec(
+        select(
+            func.count(),
+            func.coalesce(func.sum(SubmissionOutput.size_bytes), 0),
+        ).where(SubmissionOutput.submission_id == submission_id)
+    )
+    previous_count, previous_size = res.one()
+
+    outputs = []
+    paginator = s3.get_paginator("list_objects_v2")
+    async for page in paginator.paginate(
+        Bucket=config.S3_BUCKET_ID,
+        Prefix=f"{config.S3_PREFIX}/outputs/{str(submission_id)}/",
+    ):
+        for obj in page.get("Contents", []):
+            filename = obj["Key"].split("/")[-1]
+            outputs.append(
+                SubmissionOutput(
+                    submission_id=submission_id,
+                    key=obj["Key"],
+                    filename=filename,
+                    size_bytes=obj["Size"],
+                    etag=obj.get("ETag"),
+                    last_modified=obj["LastModified"]
+                    .astimezone(datetime.timezone.utc)
+                    .replace(tzinfo=None),
+                    content_type=mimetypes.guess_type(filename)[0],
+                )
+            )
+
+    await session.exec(
+        delete(SubmissionOutput).where(
+            SubmissionOutput.submission_id == submission_id
+        )
+    )
+    if outputs:
+        res = await session.exec(
+            insert(SubmissionOutput)
+            .values([output.model_dump() for output in outputs])
+            .on_conflict_do_nothing(index_elements=[SubmissionOutput.key])
+            .returning(SubmissionOutput.id)
+        )
+        inserted = set(res.scalars().all())
+        outputs = [output for output in outputs if output.id in inserted]
+    await session.exec(
+        update(Submission)
+        .where(Submission.id == submission_id)
+        .values(outputs_listed_utc=datetime.datetime.now())
+    )
+    await record_storage_usage(
+        session,
+        OUTPUTS_FOLDER,
+        owner,
+        object_count=len(outputs) - previous_count,
+        size_bytes=sum(output.size_bytes for output in outputs)
+        - previous_size,
+    )
+    await session.commit()
+    await invalidate(Submission)
+
+    return outputs
+
+
+async def get_output_manifest(
+    submission: Submission,
+    session: AsyncSession,
+    s3: S3Session,
+) -> list[SubmissionOutput]:
+    """Output files of a submission, ordered by filename
+
+    Runs that finished before outputs were recorded in the manifest are
+    listed from S3 once, the first time their outputs are requested.
+    """
+
+    res = await session.exec(
+        select(SubmissionOutput)
+        .where(SubmissionOutput.submission_id == submission.id)
+        .order_by(SubmissionOutput.filename)
+    )
+    outputs = res.all()
+
+    if not outputs and submission.outputs_listed_utc is None:
+        res = await session.exec(
+            select(RunStatus.id)
+            .where(
+                RunStatus.submission_id == submission.id,
+                RunStatus.is_successful,
+            )
+            .limit(1)
+        )
+        if res.first() is None:
+            return outputs
+
+        outputs = await refresh_output_manifest(
+            submission.id, submission.owner, session, s3
+        )
+        outputs.sort(key=lambda output: output.filename)
+
+    return outputs
+
+
+def preview_cache_prefix(output: SubmissionOutput) -> str:
+    """Prefix of the cached previews of an output, eg. levels of detail
+
+    Includes the ETag of the output, so that levels built from a previous
+    version of the file are not served.
+    """
+
+    etag = (output.etag or "").strip('"')
+    return (
+        f"{config.S3_PREFIX}/previews/{str(output.submission_id)}/"
+        f"{str(output.id)}/{etag}"
+    )
+
+
+async def read_preview_index(s3: S3Session, key: str) -> dict | None:
+    """The JSON index of a cached preview, or None if it is not built"""
+
+    try:
+        response = await s3.get_object(Bucket=config.S3_BUCKET_ID, Key=key)
+    except ClientError:
+        return None
+
+    return json.loads(await response["Body"].read())
+
+
+async def get_point_cloud_levels(
+    output: SubmissionOutput,
+    s3: S3Session,
+) -> list[int] | None:
+    """Point counts of the levels of detail of a PLY output, coarsest first
+
+    Returns None until the levels are built by the build_point_cloud_levels
+    task, see request_point_cloud_levels. Raises PointCloudError if the
+    output could not be read.
+    """
+
+    index = await read_preview_index(
+        s3, f"{preview_cache_prefix(output)}/index.json"
+    )
+    if index is None:
+        return None
+    if "error" in index:
+        raise PointCloudError(index["error"])
+
+    return index["point_counts"]
+
+
+async def request_point_cloud_levels(
+    output: SubmissionOutput,
+    session: AsyncSession,
+) -> None:
+    """Queue the build of the levels of detail of a PLY output
+
+    Concurrent requests for the same version of the output share one task.
+    """
+
+    await enqueue_unique(
+        session,
+        "build_point_cloud_levels",
+        {"output_id": str(output.id), "prefix": preview_cache_prefix(output)},
+        unique_on="prefix",
+    )
+
+
+@register_task("build_point_cloud_levels")
+async def build_point_cloud_levels(
+    output_id: str,
+    prefix: str,
+    session: AsyncSession,
+    s3: S3Session,
+) -> None:
+    """Task to build the levels of detail of a PLY output
+
+    The levels are built in the process pool and cached in S3 as
+    {prefix}/{level}.bin with an index.json written last. Outputs that
+    cannot be read get an index.json of the error instead, so that the
+    build is not retried. Outputs that changed since the task was queued
+    are skipped, as their prefix changed too.
+    """
+
+    res = await session.exec(
+        select(SubmissionOutput).where(SubmissionOutput.id == output_id)
+    )
+    output = res.one_or_none()
+    if output is None or preview_cache_prefix(output) != prefix:
+        return
+    if await read_preview_index(s3, f"{prefix}/index.json") is not None:
+        return
+
+    filename = await download_to_scratch(s3, output.key, suffix=".ply")
+    try:
+        levels = await run_in_process(
+            build_levels,
+            filename,
+            config.POINT_CLOUD_LOD_LEVELS,
+            config.POINT_CLOUD_BASE_GRID_CELLS,
+        )
+    except PointCloudError as e:
+        await s3.put_object(
+            Bucket=config.S3_BUCKET_ID,
+            Key=f"{prefix}/index.json",
+            Body=json.dumps({"error": str(e)}),
+            ContentType="application/json",
+        )
+        return
+    finally:
+        os.remove(filename)
+
+    for level, body in enumerate(levels):
+        await s3.put_object(
+            Bucket=config.S3_BUCKET_ID,
+            Key=f"{prefix}/{level}.bin",
+            Body=body,
+            ContentType="application/octet-stream",
+        )
+    point_counts = [point_count(body) for body in levels]
+    await s3.put_object(
+        Bucket=config.S3_BUCKET_ID,
+        Key=f"{prefix}/index.json",
+        Body=json.dumps({"point_counts": point_counts}),
+        ContentType="application/json",
+    )
+
+    print(
+        f"Built {len(levels)} levels of detail of {output.key} "
+        f"({point_counts[-1]} points at the finest)"
+    )
+
+
+async def get_tile_pyramid(
+    output: SubmissionOutput,
+    s3: S3Session,
+) -> dict[str, int] | None:
+    """Size and zoom levels of the tile pyramid of a raster output
+
+    Returns None until the pyramid is built by the build_tile_pyramid task,
+    see request_tile_pyramid. Raises TileError if the output could not be
+    tiled.
+    """
+
+    pyramid = await read_preview_index(
+        s3, f"{preview_cache_prefix(output)}/tiles.json"
+    )
+    if pyramid is not None and "error" in pyramid:
+        raise TileError(pyramid["error"])
+
+    return pyramid
+
+
+async def request_tile_pyramid(
+    output: SubmissionOutput,
+    session: AsyncSession,
 ) -> None:
-    """Used as a background task to poll for the status of the submission run
+    """Queue the build of the tile pyramid of a raster output
+
+    Concurrent requests for the same version of the output share one task.
+    """
 
-    Initiated when a job submission is created. The function will continue to
-    check the status of the submission run until it is "Completed" or "Failed".
+    await enqueue_unique(
+        session,
+        "build_tile_pyramid",
+        {"output_id": str(output.id), "prefix": preview_cache_prefix(output)},
+        unique_on="prefix",
+    )
+
+
+@register_task("build_tile_pyramid")
+async def build_tile_pyramid(
+    output_id: str,
+    prefix: str,
+    session: AsyncSession,
+    s3: S3Session,
+) -> None:
+    """Task to build the tile pyramid of a raster output
 
-    If the submission is "Running", the function will sleep for 5 seconds
-    before checking the status again. It will also update the log.
+    The pyramid is built in the process pool and its tiles cached in S3 as
+    {prefix}/tiles/{z}/{x}/{y}.png with a tiles.json written last. Outputs
+    that cannot be tiled get a tiles.json of the error instead, so that the
+    build is not retried. Outputs that changed since the task was queued
+    are skipped, as their prefix changed too.
     """
 
+    res = await session.exec(
+        select(SubmissionOutput).where(SubmissionOutput.id == output_id)
+    )
+    output = res.one_or_none()
+    if output is None or preview_cache_prefix(output) != prefix:
+        return
+    if await read_preview_index(s3, f"{prefix}/tiles.json") is not None:
+        return
+
+    filename = await download_to_scratch(
+        s3, output.key, suffix=os.path.splitext(output.filename)[1]
+    )
+    directory = tempfile.mkdtemp(dir=config.SCRATCH_DIR)
+    try:
+        try:
+            width, height, max_zoom = await run_in_process(
+                build_pyramid, filename, directory, config.TILE_SIZE
+            )
+        except TileError as e:
+            await s3.put_object(
+                Bucket=config.S3_BUCKET_ID,
+                Key=f"{prefix}/tiles.json",
+                Body=json.dumps({"error": str(e)}),
+                ContentType="application/json",
+            )
+            return
+
+        slots = asyncio.Semaphore(TILE_UPLOAD_CONCURRENCY)
+
+        async def upload(path: str) -> None:
+            async with slots:
+                with open(path, "rb") as f:
+                    await s3.put_object(
+                        Bucket=config.S3_BUCKET_ID,
+                        Key=f"{prefix}/tiles/"
+                        + os.path.relpath(path, directory),
+                        Body=f.read(),
+                        ContentType="image/png",
+                    )
+
+        await asyncio.gather(
+            *[
+                upload(os.path.join(root, name))
+                for root, _, names in os.walk(directory)
+                for name in names
+            ]
+        )
+    finally:
+        os.remove(filename)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    pyramid = {
+        "width": width,
+        "height": height,
+        "tile_size": config.TILE_SIZE,
+        "max_zoom": max_zoom,
+    }
+    await s3.put_object(
+        Bucket=config.S3_BUCKET_ID,
+        Key=f"{prefix}/tiles.json",
+        Body=json.dumps(pyramid),
+        ContentType="application/json",
+    )
+
     print(
-        f"Spooling up submission status check for {submission_id} - {job_id}"
+        f"Built tile pyramid of {output.key} ({width}x{height}, "
+        f"{max_zoom + 1} zoom levels)"
     )
+
+
+@register_task("check_submission_status")
+async def check_submission_status(
+    submission_id: UUID,
+    job_id: str,
+    session: AsyncSession,
+    s3: S3Session,
+    time_queued: str | None = None,
+) -> None:
+    """Task to check the status of the submission run once
+
+    Queued when a job submission is created. While the job is not yet known
+    to Kubernetes, or is "Pending" or "Running", the run status and log are
+    updated and the task queues itself again after the polling interval,
+    until the run finishes or the job never appears within the timeout.
+    """
+
     job = await get_submission_job_by_name(submission_id, job_id)
-    time_started = datetime.datetime.now()
-
-    while job is None:
-        print(f"Job {job_id} is not ready yet")
-        await asyncio.sleep(config.SUBMISSION_JOB_CHECK_POLLING_INTERVAL)
-        job = await get_submission_job_by_name(submission_id, job_id)
-        if (datetime.datetime.now() - time_started).seconds > timeout:
-            print(
-                f"Submission {submission_id} has timed out waiting for update."
-                f" Cancelling job {job_id}"
+
+    res = await session.exec(
+        select(RunStatus).where(RunStatus.kubernetes_pod_name == job_id)
+    )
+    run_status = res.one_or_none()
+
+    res = await session.exec(
+        select(Submission.owner).where(Submission.id == submission_id)
+    )
+    owner = res.one_or_none()
+
+    if run_status is None:
+        if job is None:
+            time_queued = (
+                datetime.datetime.fromisoformat(time_queued)
+                if time_queued
+                else datetime.datetime.now()
+            )
+            waited = (datetime.datetime.now() - time_queued).total_seconds()
+            if waited > config.SUBMISSION_JOB_CHECK_TIMEOUT:
+                print(
+                    f"Submission {submission_id} has timed out waiting for "
+                    f"update. Cancelling job {job_id}"
+                )
+                return
+
+            print(f"Job {job_id} is not ready yet")
+            await enqueue(
+                session,
+                "check_submission_status",
+                {
+                    "submission_id": str(submission_id),
+                    "job_id": job_id,
+                    "time_queued": time_queued.isoformat(),
+                },
+                delay_seconds=config.SUBMISSION_JOB_CHECK_POLLING_INTERVAL,
             )
             return
 
-    # Create Runstatus object and add to DB
-    run_status = RunStatus(
-        kubernetes_pod_name=job_id,
-        submission_id=submission_id,
-        status="Pending",
-        is_still_kubernetes_resource=True,  # This gets updated on status reqs
-    )
-    session.add(run_status)
-    await session.commit()
+        # Create Runstatus object and add to DB
+        run_status = RunStatus(
+            kubernetes_pod_name=job_id,
+            submission_id=submission_id,
+            status="Pending",
+            is_still_kubernetes_resource=True,  # Updated on status reqs
+        )
+        session.add(run_status)
+        await session.commit()
+        await invalidate(Submission)
+        await publish_event(
+            EventType.RUN_STATUS,
+            submission_id,
+            owner,
+            kubernetes_pod_name=job_id,
+            status="Pending",
+        )
 
-    # Hold this for the final update in case it's deleted during the run
-    while job and job.status in ["Pending", "Running"]:
-        print("In loop")
-        print(f"Job: {job}")
+    if job and job.status in ["Pending", "Running"]:
         logs = await get_cached_job_log(f"{job_id}-0-0")
+        changed = (
+            run_status.status,
+            run_status.is_running,
+            run_status.is_successful,
+        ) != (job.status, True, False)
 
         await session.exec(
             update(RunStatus)
@@ -142,41 +571,70 @@ async def iteratively_check_status(
             )
         )
         await session.commit()
+        await invalidate(Submission)
+        if changed:
+            # Only the logs change between most polls
+            await publish_event(
+                EventType.RUN_STATUS,
+                submission_id,
+                owner,
+                kubernetes_pod_name=job_id,
+                status=job.status,
+                is_running=True,
+                is_successful=False,
+            )
 
         print(f"Submission ID: {submission_id}: Job {job_id} is running")
 
-        # Sleep before checking again
-        await asyncio.sleep(config.SUBMISSION_JOB_CHECK_POLLING_INTERVAL)
-
-        # Get the updated list of running jobs
-        job = await get_submission_job_by_name(submission_id, job_id)
-
-    print("Loop finished")
+        # Check again after the polling interval
+        await enqueue(
+            session,
+            "check_submission_status",
+            {"submission_id": str(submission_id), "job_id": job_id},
+            delay_seconds=config.SUBMISSION_JOB_CHECK_POLLING_INTERVAL,
+        )
+        return
 
-    # Do a final update of all the job
+    # Do a final update of the job. The UPDATE below is synchronised into
+    # the loaded run_status, so read whether it had succeeded before
+    was_successful = run_status.is_successful
     is_k8s_resource = True if job is not None else False
 
     final_status = False
     if job and is_k8s_resource and job.status == "Succeeded":
         final_status = True
 
+    values = dict(
+        is_running=False,
+        is_successful=final_status,
+        is_still_kubernetes_resource=is_k8s_resource,
+        last_updated=datetime.datetime.now(),
+        status=job.status if is_k8s_resource else "Deleted",
+    )
     if is_k8s_resource:
-        logs = await get_cached_job_log(f"{job_id}-0-0")
+        values["logs"] = await get_cached_job_log(f"{job_id}-0-0")
         await populate_percentage_covers(submission_id, session, s3)
 
     await session.exec(
         update(RunStatus)
         .where(RunStatus.kubernetes_pod_name == job_id)
-        .values(
-            is_running=False,
-            is_successful=final_status,
-            is_still_kubernetes_resource=is_k8s_resource,
-            last_updated=datetime.datetime.now(),
-            status=job.status if is_k8s_resource else "Deleted",
-            logs=logs,
-        )
+        .values(**values)
     )
     await session.commit()
+    await invalidate(Submission)
+
+    if final_status and not was_successful and owner:
+        # Record the files the run wrote, so they are not listed on reads
+        await refresh_output_manifest(submission_id, owner, session, s3)
+    await publish_event(
+        EventType.RUN_STATUS,
+        submission_id,
+        owner,
+        kubernetes_pod_name=job_id,
+        status=values["status"],
+        is_running=False,
+        is_successful=final_status,
+    )
 
     print(f"Submission ID: {submission_id} has finished running.")
 
@@ -2,9 +2,9 @@ from fastapi import (
     Depends,
     APIRouter,
     Query,
+    Request,
     Response,
     HTTPException,
-    BackgroundTasks,
 )
 from sqlmodel import select
 from app.db import get_session, AsyncSession
@@ -19,17 +19,55 @@ from app.submissions.models import (
 )
 from app.submissions.utils import (
     populate_percentage_covers,
-    iteratively_check_status,
+    get_output_manifest,
+    refresh_output_manifest,
+    get_point_cloud_levels,
+    request_point_cloud_levels,
+    get_tile_pyramid,
+    request_tile_pyramid,
+    preview_cache_prefix,
 )
-from fastapi.responses import StreamingResponse
+from app.submissions.outputs.pointcloud import PointCloudError
+from app.submissions.outputs.tiles import TileError, RASTER_EXTENSIONS
+from app.objects.zipstream import stream_zip
+from app.objects.streaming import iter_s3_body
+from app.submissions.outputs.models import SubmissionOutput, TilePyramid
+from app.tasks.service import enqueue
+from app.deletion import request_deletion, DeletionResource
+from app.loaders import (
+    SUBMISSION_FIELDSET,
+    SUBMISSION_READ,
+    SUBMISSION_READ_RESOURCES,
+)
+from app.responses import read_model_response
+from app.query_cache import (
+    invalidate,
+    query_key,
+    get_query_result,
+    set_query_result,
+    result_headers,
+)
+from app.crud import list_plan
+from app.pagination import (
+    fetch_page,
+    list_count_key,
+    paginate_by_cursor,
+    next_cursor,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+)
+from fastapi.responses import StreamingResponse, RedirectResponse
 from app.objects.models import InputObject, InputObjectAssociations
 from app.submissions.status.models import RunStatus
+from app.transects.models import Transect
 from uuid import UUID
 from sqlalchemy import func
 import json
 from typing import Any
-from app.objects.service import get_s3
+from app.objects.service import get_s3, presigned_download_url
+from app.objects.streaming import stream_s3_object
 from aioboto3 import Session as S3Session
+from botocore.exceptions import ClientError
 from app.config import config
 from kubernetes.client import CoreV1Api, ApiClient, CustomObjectsApi
 from app.submissions.k8s import (
@@ -43,12 +81,16 @@ import random
 from app.users.models import User
 from app.auth.services import get_user_info
 import datetime
+import fnmatch
 import jwt
 from app.auth.models import DownloadToken
 
 job_log_router = APIRouter()
 router = APIRouter()
 
+# Sort of the submissions when paginating by cursor without a sort
+DEFAULT_SORT = ["time_added_utc", "DESC"]
+
 
 @job_log_router.get("/{job_id}", response_model=SubmissionJobLogRead)
 async def get_job_log(
@@ -96,6 +138,16 @@ async def delete_job_from_k8s(
         )
 
 
+def file_output(output: SubmissionOutput) -> SubmissionFileOutputs:
+    return SubmissionFileOutputs(
+        filename=output.filename,
+        size_bytes=output.size_bytes,
+        last_modified=output.last_modified,
+        content_type=output.content_type,
+        url=f"/api/submissions/{output.submission_id}/{output.filename}",
+    )
+
+
 @router.get("/{submission_id}", response_model=SubmissionRead)
 async def get_submission(
     session: AsyncSession = Depends(get_session),
@@ -104,11 +156,36 @@ async def get_submission(
     user: User = Depends(get_user_info),
     *,
     submission_id: UUID,
-) -> SubmissionRead:
-    """Get a submission by id"""
+    fields: str = Query(None),
+) -> Response:
+    """Get a submission by id
+
+    With fields, ie. "id,name", only those fields (see app.fieldsets). The
+    file outputs are only read if they or the percentage covers are asked
+    for.
+    """
+
+    fields = SUBMISSION_FIELDSET.parse(fields)
+    read_model = SUBMISSION_FIELDSET.model(fields)
+
+    key = await query_key(
+        "submission",
+        SUBMISSION_READ_RESOURCES,
+        user,
+        {"id": submission_id, "fields": sorted(fields or [])},
+    )
+    model_obj = await get_query_result(key)
+    if model_obj is not None:
+        return read_model_response(model_obj, read_model)
 
     # Fetch submission from database
-    query = select(Submission).where(Submission.id == submission_id)
+    query = (
+        select(Submission)
+        .where(
+            Submission.id == submission_id, Submission.deleted_utc.is_(None)
+        )
+        .options(*SUBMISSION_FIELDSET.load_options(fields))
+    )
     if not user.is_admin:
         query = query.where(Submission.owner == user.id)
 
@@ -118,64 +195,383 @@ async def get_submission(
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    # Sort the job_status by time_started
-    job_status = sorted(
-        submission.run_status,
-        key=lambda x: (
-            x.time_started if x.time_started else "9999-00-00T00:00:00Z"
-        ),
-        reverse=True,
-    )
-    # Fetch the file outputs in the S3 bucket
-    response = await s3.list_objects_v2(
-        Bucket=config.S3_BUCKET_ID,
-        Prefix=f"{config.S3_PREFIX}/outputs/{str(submission_id)}/",
-    )
-    outputs = response.get("Contents", [])
-
-    output_files = [
-        SubmissionFileOutputs(
-            filename=output["Key"].split("/")[-1],
-            size_bytes=output["Size"],
-            last_modified=output["LastModified"],
-            url=(
-                "/api/submissions/"
-                f"{submission_id}/{output['Key'].split('/')[-1]}"
+    output_files = []
+    if fields is None or {"file_outputs", "percentage_covers"} & fields:
+        # Read the file outputs from the manifest, rather than listing S3
+        outputs = await get_output_manifest(submission, session, s3)
+        output_files = [file_output(output) for output in outputs]
+
+        # If there are file outputs and no percentage covers, generate them
+        if output_files and not submission.percentage_covers:
+            # Make sure we have the file we need
+            files = [output.filename for output in output_files]
+            if ("percentage_covers.json" in files) and (
+                "class_to_color.json" in files
+            ):
+                print("Generating percentage covers")
+                await populate_percentage_covers(submission_id, session, s3)
+
+    model_obj = SUBMISSION_FIELDSET.validate(submission, fields)
+    if fields is None or "run_status" in fields:
+        # Sort the job_status by time_started
+        model_obj.run_status = sorted(
+            submission.run_status,
+            key=lambda x: (
+                x.time_started if x.time_started else "9999-00-00T00:00:00Z"
             ),
+            reverse=True,
         )
-        for output in outputs
+    model_obj.file_outputs = output_files
+    await set_query_result(key, model_obj)
+
+    return read_model_response(model_obj, read_model)
+
+
+@router.post(
+    "/{submission_id}/outputs", response_model=list[SubmissionFileOutputs]
+)
+async def refresh_submission_outputs(
+    submission_id: UUID,
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+    s3: S3Session = Depends(get_s3),
+) -> list[SubmissionFileOutputs]:
+    """Refresh the output files of a submission from the S3 bucket
+
+    Outputs are recorded when a run finishes, this picks up any changes to
+    the bucket since then.
+    """
+
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
+    if not user.is_admin:
+        query = query.where(Submission.owner == user.id)
+    res = await session.exec(query)
+    submission = res.one_or_none()
+
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    outputs = await refresh_output_manifest(
+        submission_id, submission.owner, session, s3
+    )
+
+    return [
+        file_output(output)
+        for output in sorted(outputs, key=lambda output: output.filename)
     ]
 
-    # If there are file outputs and no percentage covers, generate them
-    if output_files and not submission.percentage_covers:
-        # Make sure we have the file we need
-        files = [output.filename for output in output_files]
-        if ("percentage_covers.json" in files) and (
-            "class_to_color.json" in files
-        ):
-            print("Generating percentage covers")
-            await populate_percentage_covers(submission_id, session, s3)
-
-    model_obj = SubmissionRead.model_validate(submission)
-    model_obj.run_status = job_status
-    model_obj.file_outputs = output_files
 
-    return model_obj
+@router.get("/download/bundle/{token}", response_class=StreamingResponse)
+async def get_submission_output_bundle(
+    token: str,
+    session: AsyncSession = Depends(get_session),
+    s3: S3Session = Depends(get_s3),
+) -> StreamingResponse:
+    """With the given token, returns a ZIP of the outputs of a submission
+
+    The archive is built as it is sent, from the S3 bodies of the files
+    matching the glob pattern of the token.
+    """
+
+    decoded = jwt.decode(
+        token, config.SERIALIZER_SECRET_KEY, algorithms=["HS256"]
+    )
+    if not decoded.get("bundle"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    submission_id, pattern = decoded["submission_id"], decoded["pattern"]
+
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
+    res = await session.exec(query)
+    submission = res.one_or_none()
+
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    prefix = f"{config.S3_PREFIX}/outputs/{str(submission_id)}/"
+    outputs = [
+        output
+        for output in await get_output_manifest(submission, session, s3)
+        if fnmatch.fnmatch(output.filename, pattern)
+    ]
+
+    if not outputs:
+        raise HTTPException(status_code=404, detail="No matching outputs")
+
+    async def entries():
+        for output in outputs:
+            yield (
+                output.key.removeprefix(prefix),
+                output.last_modified,
+                iter_s3_body(s3, output.key),
+            )
+
+    return StreamingResponse(
+        content=stream_zip(entries()),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{str(submission_id)}.zip"'
+            )
+        },
+    )
+
+
+@router.get("/{submission_id}/bundle/token", response_model=DownloadToken)
+async def get_submission_output_bundle_token(
+    submission_id: UUID,
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+    *,
+    pattern: str = Query("*"),
+) -> DownloadToken:
+    """Returns a token to download the outputs of a submission as a ZIP
+
+    Only files with a filename matching the glob pattern are included, eg.
+    "*.ply". Token expires at a set time defined by
+    config.SERIALIZER_EXPIRY_HOURS
+    """
+
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
+    if not user.is_admin:
+        query = query.where(Submission.owner == user.id)
+    res = await session.exec(query)
+
+    if res.one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    payload = {
+        "submission_id": str(submission_id),
+        "pattern": pattern,
+        "bundle": True,
+        "exp": datetime.datetime.now(datetime.UTC)
+        + datetime.timedelta(hours=config.SERIALIZER_EXPIRY_HOURS),
+    }
+    token = jwt.encode(
+        payload, config.SERIALIZER_SECRET_KEY, algorithm="HS256"
+    )
+
+    return DownloadToken(token=token)
+
+
+@router.get(
+    "/{submission_id}/pointcloud/{filename}",
+    response_class=StreamingResponse,
+    responses={202: {"description": "The levels of detail are being built"}},
+)
+async def get_submission_point_cloud(
+    submission_id: UUID,
+    filename: str,
+    request: Request,
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+    s3: S3Session = Depends(get_s3),
+    *,
+    level: int | None = Query(None, ge=0),
+    max_points: int | None = Query(None, ge=1),
+) -> Response:
+    """Returns a voxel-downsampled level of detail of a PLY output
+
+    Sends the given level, or the finest level of at most max_points
+    points, or otherwise the coarsest level. The X-Point-Cloud-Level,
+    X-Point-Cloud-Levels and X-Point-Cloud-Points headers describe the
+    level that was sent, so that a viewer can show a preview quickly and
+    refine it a level at a time. See app.submissions.outputs.pointcloud
+    for the format.
+
+    The levels are built by a worker the first time they are requested.
+    Until then, responds with 202 and a Retry-After header.
+    """
+
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
+    if not user.is_admin:
+        query = query.where(Submission.owner == user.id)
+    res = await session.exec(query)
+    submission = res.one_or_none()
+
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    outputs = await get_output_manifest(submission, session, s3)
+    output = next(
+        (output for output in outputs if output.filename == filename), None
+    )
+    if not output or not filename.lower().endswith(".ply"):
+        raise HTTPException(status_code=404, detail="Point cloud not found")
+
+    try:
+        point_counts = await get_point_cloud_levels(output, s3)
+    except PointCloudError as e:
+        raise HTTPException(
+            status_code=422, detail=f"Cannot read point cloud: {e}"
+        )
+    if point_counts is None:
+        await request_point_cloud_levels(output, session)
+        return Response(
+            status_code=202,
+            headers={"Retry-After": str(config.PREVIEW_RETRY_AFTER_SECONDS)},
+        )
+
+    if level is None:
+        level = 0
+        if max_points is not None:
+            for i, count in enumerate(point_counts):
+                if count <= max_points:
+                    level = i
+    elif level >= len(point_counts):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Level must be less than {len(point_counts)}",
+        )
+
+    response = await stream_s3_object(
+        s3,
+        f"{preview_cache_prefix(output)}/{level}.bin",
+        request,
+        f"{filename.rsplit('.', 1)[0]}.lod{level}.bin",
+        disposition="inline",
+    )
+    response.headers["X-Point-Cloud-Level"] = str(level)
+    response.headers["X-Point-Cloud-Levels"] = str(len(point_counts))
+    response.headers["X-Point-Cloud-Points"] = str(point_counts[level])
+
+    return response
+
+
+@router.get("/download/tiles/{token}/{z}/{x}/{y}.png", response_class=Response)
+async def get_submission_output_tile(
+    token: str,
+    z: int,
+    x: int,
+    y: int,
+    s3: S3Session = Depends(get_s3),
+) -> Response:
+    """With the given token, returns a tile of the pyramid of an output
+
+    Tiles are cached in S3 under a prefix that changes with the output, so
+    browsers may keep them for config.TILE_CACHE_MAX_AGE_SECONDS.
+    """
+
+    decoded = jwt.decode(
+        token, config.SERIALIZER_SECRET_KEY, algorithms=["HS256"]
+    )
+    if "tiles" not in decoded:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    try:
+        response = await s3.get_object(
+            Bucket=config.S3_BUCKET_ID,
+            Key=f"{decoded['tiles']}/tiles/{z}/{x}/{y}.png",
+        )
+    except ClientError:
+        raise HTTPException(status_code=404, detail="Tile not found")
+
+    return Response(
+        content=await response["Body"].read(),
+        media_type="image/png",
+        headers={
+            "Cache-Control": (
+                f"private, max-age={config.TILE_CACHE_MAX_AGE_SECONDS}, "
+                "immutable"
+            ),
+            "ETag": response["ETag"],
+        },
+    )
+
+
+@router.get(
+    "/{submission_id}/tiles/{filename}",
+    response_model=TilePyramid,
+    responses={202: {"description": "The tile pyramid is being built"}},
+)
+async def get_submission_output_tiles(
+    submission_id: UUID,
+    filename: str,
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+    s3: S3Session = Depends(get_s3),
+) -> TilePyramid | Response:
+    """Returns the tile pyramid of a raster output and a token to read it
+
+    The pyramid is built by a worker the first time it is requested. Until
+    then, responds with 202 and a Retry-After header. Tiles are read
+    from /download/tiles/{token}/{z}/{x}/{y}.png, so that they can be
+    loaded by image tags. Token expires at a set time defined by
+    config.SERIALIZER_EXPIRY_HOURS
+    """
+
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
+    if not user.is_admin:
+        query = query.where(Submission.owner == user.id)
+    res = await session.exec(query)
+    submission = res.one_or_none()
+
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    outputs = await get_output_manifest(submission, session, s3)
+    output = next(
+        (output for output in outputs if output.filename == filename), None
+    )
+    if not output or not filename.lower().endswith(RASTER_EXTENSIONS):
+        raise HTTPException(status_code=404, detail="Raster not found")
+
+    try:
+        pyramid = await get_tile_pyramid(output, s3)
+    except TileError as e:
+        raise HTTPException(status_code=422, detail=f"Cannot tile: {e}")
+    if pyramid is None:
+        await request_tile_pyramid(output, session)
+        return Response(
+            status_code=202,
+            headers={"Retry-After": str(config.PREVIEW_RETRY_AFTER_SECONDS)},
+        )
+
+    payload = {
+        "submission_id": str(submission_id),
+        "tiles": preview_cache_prefix(output),
+        "exp": datetime.datetime.now(datetime.UTC)
+        + datetime.timedelta(hours=config.SERIALIZER_EXPIRY_HOURS),
+    }
+    token = jwt.encode(
+        payload, config.SERIALIZER_SECRET_KEY, algorithm="HS256"
+    )
+
+    return TilePyramid(token=token, **pyramid)
 
 
 @router.get("/download/{token}", response_class=StreamingResponse)
 async def get_submission_output_file(
     token: str,
+    request: Request,
     session: AsyncSession = Depends(get_session),
     s3: S3Session = Depends(get_s3),
-) -> StreamingResponse:
-    """With the given submission ID and filename, returns the file from S3"""
+) -> Response:
+    """With the given submission ID and filename, returns the file from S3
+
+    If config.S3_PRESIGNED_DOWNLOADS is set, redirects to a short-lived
+    presigned S3 URL instead, so the file does not pass through the API.
+    Otherwise the file is streamed with support for Range requests.
+    """
 
     # Decode the token from the user
     decoded = jwt.decode(
         token, config.SERIALIZER_SECRET_KEY, algorithms=["HS256"]
     )
 
+    if "filename" not in decoded:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
     submission_id, filename, exp = decoded.values()
 
     if datetime.datetime.fromtimestamp(
@@ -187,24 +583,31 @@ async def get_submission_output_file(
         )
 
     # Make sure the user has access to the submission
-    query = select(Submission).where(Submission.id == submission_id)
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
     res = await session.exec(query)
     submission = res.one_or_none()
 
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    # Get the file from the S3 bucket
-    response = await s3.get_object(
-        Bucket=config.S3_BUCKET_ID,
-        Key=f"{config.S3_PREFIX}/outputs/{str(submission_id)}/{filename}",
-    )
+    key = f"{config.S3_PREFIX}/outputs/{str(submission_id)}/{filename}"
 
-    return StreamingResponse(
-        content=response["Body"].iter_chunks(),
-        media_type="application/octet-stream",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+    if config.S3_PRESIGNED_DOWNLOADS:
+        # The URL must not remain valid after the token has expired
+        expires_in = min(
+            config.S3_PRESIGNED_URL_EXPIRY_SECONDS,
+            int(exp - datetime.datetime.now().timestamp()),
+        )
+        url = await presigned_download_url(
+            s3, key, filename, expires_in=max(1, expires_in)
+        )
+
+        return RedirectResponse(url=url, status_code=307)
+
+    # Stream the file (or the requested ranges of it) from the S3 bucket
+    return await stream_s3_object(s3, key, request, filename)
 
 
 @router.get("/{submission_id}/{filename}", response_model=DownloadToken)
@@ -223,7 +626,9 @@ async def get_submission_output_file_token(
     Token expires at a set time defined by config.SERIALIZER_EXPIRY_HOURS
     """
 
-    query = select(Submission).where(Submission.id == submission_id)
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(Submission.owner == user.id)
     res = await session.exec(query)
@@ -251,15 +656,14 @@ async def execute_submission(
     user: User = Depends(get_user_info),
     session: AsyncSession = Depends(get_session),
     k8s: CustomObjectsApi | None = Depends(get_k8s_custom_objects),
-    *,
-    background_task: BackgroundTasks,
-    s3: S3Session = Depends(get_s3),
 ) -> Any:
 
     # Set name to be submission_id + random number five digits long
     name = f"deepreef-{submission_id}-{str(random.randint(10000, 99999))}"
 
-    query = select(Submission).where(Submission.id == submission_id)
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(Submission.owner == user.id)
     submission_res = await session.exec(query)
@@ -306,12 +710,14 @@ async def execute_submission(
             detail="GPU unavailable",
         )
 
-    background_task.add_task(
-        iteratively_check_status,
+    await enqueue(
         session,
-        s3,
-        submission_id,
-        job_id=name,
+        "check_submission_status",
+        {
+            "submission_id": str(submission_id),
+            "job_id": name,
+            "time_queued": datetime.datetime.now().isoformat(),
+        },
     )
     return api_response
 
@@ -327,84 +733,109 @@ async def get_submissions(
     filter: str = Query(None),
     sort: str = Query(None),
     range: str = Query(None),
-) -> list[SubmissionRead]:
-    """Get all submissions"""
+    cursor: str = Query(None),
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = Query(None),
+) -> Response:
+    """Get all submissions
+
+    Paginated by range, or by cursor if one is given (see app.pagination).
+    With fields, ie. "id,name", only those fields (see app.fieldsets)
+    """
 
     sort = json.loads(sort) if sort else []
     range = json.loads(range) if range else []
     filter = json.loads(filter) if filter else {}
-
-    # Do a query to satisfy total count for "Content-Range" header
-    count_query = select(func.count(Submission.iterator))
+    fields = SUBMISSION_FIELDSET.parse(fields)
+    plan = list_plan(Submission)
+    read_model = SUBMISSION_FIELDSET.model(fields)
+
+    key = await query_key(
+        "submissions",
+        SUBMISSION_READ_RESOURCES,
+        user,
+        dict(
+            filter=filter,
+            sort=sort,
+            range=range,
+            cursor=cursor,
+            page_size=page_size,
+            fields=sorted(fields or []),
+        ),
+    )
+    cached = await get_query_result(key)
+    if cached is not None:
+        submissions, headers = cached
+        response.headers.update(headers)
+        return read_model_response(submissions, read_model, response)
+
+    # Count for the "Content-Range" header, when the page cannot be counted
+    # in the same query (see fetch_page)
+    count_query = select(func.count(Submission.iterator)).where(
+        Submission.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         count_query = count_query.where(Submission.owner == user.id)
-
-    if len(filter):  # Have to filter twice for some reason? SQLModel state?
-        for field, value in filter.items():
-            if field == "id" or field == "submission_id":
-                if isinstance(value, list):
-                    for v in value:
-                        count_query = count_query.filter(
-                            getattr(Submission, field) == v
-                        )
-                else:
-                    count_query = count_query.filter(
-                        getattr(Submission, field) == value
-                    )
-            else:
-                count_query = count_query.filter(
-                    getattr(Submission, field).like(f"%{str(value)}%")
-                )
-    total_count = await session.exec(count_query)
-    total_count = total_count.one()
+    count_query = plan.filter(count_query, filter)
 
     # Query for the quantity of records in SensorInventoryData that match the
     # sensor as well as the min and max of the time column
-    query = select(Submission)
+    query = select(Submission).where(Submission.deleted_utc.is_(None))
     if not user.is_admin:
         query = query.where(Submission.owner == user.id)
 
-    # Order by sort field params ie. ["name","ASC"]
-    if len(sort) == 2:
-        sort_field, sort_order = sort
-        if sort_order == "ASC":
-            query = query.order_by(getattr(Submission, sort_field))
-        else:
-            query = query.order_by(getattr(Submission, sort_field).desc())
+    # Order by sort field params ie. ["name","ASC"], after the cursor if
+    # paginating by cursor, whose columns are loaded with the fields
+    if cursor is not None:
+        sort_field, sort_order = sort if len(sort) == 2 else DEFAULT_SORT
+        # A 400 for unknown fields, before they are loaded
+        list_plan(Submission).sort_column(sort_field)
+        query = query.options(
+            *SUBMISSION_FIELDSET.load_options(fields, (sort_field, "iterator"))
+        )
+        query = paginate_by_cursor(
+            query, Submission, sort_field, sort_order, cursor, page_size
+        )
+    else:
+        query = query.options(*SUBMISSION_FIELDSET.load_options(fields))
+        query = plan.sort(query, sort)
 
     # Filter by filter field params ie. {"name":"bar"}
-    if len(filter):
-        for field, value in filter.items():
-            if field == "id" or field == "submission_id":
-                if isinstance(value, list):
-                    for v in value:
-                        count_query = count_query.filter(
-                            getattr(Submission, field) == v
-                        )
-                else:
-                    count_query = count_query.filter(
-                        getattr(Submission, field) == value
-                    )
-            else:
-                query = query.filter(
-                    getattr(Submission, field).like(f"%{str(value)}%")
-                )
+    query = plan.filter(query, filter)
 
-    if len(range) == 2:
+    if len(range) == 2 and cursor is None:
+        query = query.offset(range[0]).limit(range[1] - range[0] + 1)
+
+    # Execute query, counting in the same statement unless paginating by
+    # cursor, and with the cached count for the unfiltered listing
+    submissions, total_count = await fetch_page(
+        session,
+        query,
+        count_query,
+        window=cursor is None,
+        count_key=(
+            list_count_key(Submission)
+            if user.is_admin and not len(filter)
+            else None
+        ),
+    )
+    if len(range) == 2 and cursor is None:
         start, end = range
-        query = query.offset(start).limit(end - start + 1)
     else:
         start, end = [0, total_count]  # For content-range header
-
-    # Execute query
-    results = await session.exec(query)
-    submissions = results.all()
+    if cursor is not None:
+        submissions = next_cursor(
+            submissions, sort_field, sort_order, page_size, response
+        )
 
     submissions = [
-        SubmissionRead.model_validate(submission) for submission in submissions
+        SUBMISSION_FIELDSET.validate(submission, fields)
+        for submission in submissions
     ]
 
     for submission in submissions:
+        if fields is not None and "run_status" not in fields:
+            continue
         job_status = sorted(
             submission.run_status,
             key=lambda x: (
@@ -419,8 +850,9 @@ async def get_submissions(
     response.headers["Content-Range"] = (
         f"submissions {start}-{end}/{total_count}"
     )
+    await set_query_result(key, (submissions, result_headers(response)))
 
-    return submissions
+    return read_model_response(submissions, read_model, response)
 
 
 @router.post("", response_model=SubmissionRead)
@@ -437,11 +869,27 @@ async def create_submission(
             detail="At least one file must be provided",
         )
 
+    # Tombstoned transects and objects are being deleted, so they can't be
+    # part of a new submission
+    if submission.transect_id is not None:
+        res = await session.exec(
+            select(Transect.id).where(
+                Transect.id == submission.transect_id,
+                Transect.deleted_utc.is_(None),
+            )
+        )
+        if res.one_or_none() is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Transect not found ({submission.transect_id})",
+            )
+
     # Check that the input associations belong to the transect
     # that the submission to be created is associated with
     for input_file in submission.input_associations:
         query = select(InputObject).where(
-            InputObject.id == input_file.input_object_id
+            InputObject.id == input_file.input_object_id,
+            InputObject.deleted_utc.is_(None),
         )
         res = await session.exec(query)
         input_object_obj = res.one_or_none()
@@ -474,13 +922,15 @@ async def create_submission(
     session.add(obj)
     await session.commit()
     await session.refresh(obj)
+    await invalidate(Submission)
 
     # For each file in submission.inputs, query for the object in objects
     # table with the same ID.
     for input_file in submission.input_associations:
         # Gather all inputs first, to double check they exist before creation
         query = select(InputObject).where(
-            InputObject.id == input_file.input_object_id
+            InputObject.id == input_file.input_object_id,
+            InputObject.deleted_utc.is_(None),
         )
 
         # Don't allow non-admins to create submissions with other users objects
@@ -505,8 +955,15 @@ async def create_submission(
 
         await session.commit()
         await session.refresh(input_association_obj)
+    await invalidate(Submission, InputObject)
 
-    return obj
+    res = await session.exec(
+        select(Submission)
+        .where(Submission.id == obj.id)
+        .options(*SUBMISSION_READ)
+    )
+
+    return res.one()
 
 
 @router.put("/{submission_id}", response_model=Any)
@@ -518,7 +975,9 @@ async def update_submission(
 ) -> SubmissionRead:
     """Update an submission by id"""
 
-    query = select(Submission).where(Submission.id == submission_id)
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(Submission.owner == user.id)
 
@@ -566,6 +1025,10 @@ async def update_submission(
     session.add(obj)
     await session.commit()
     await session.refresh(obj)
+    if "input_associations" in submission_data:
+        await invalidate(Submission, InputObject)
+    else:
+        await invalidate(Submission)
 
     return obj
 
@@ -579,7 +1042,9 @@ async def delete_submission(
 ) -> None:
     """Delete an submission by id"""
 
-    query = select(Submission).where(Submission.id == submission_id)
+    query = select(Submission).where(
+        Submission.id == submission_id, Submission.deleted_utc.is_(None)
+    )
     if not user.is_admin:
         query = query.where(Submission.owner == user.id)
 
@@ -589,10 +1054,5 @@ async def delete_submission(
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    # Delete associations
-    for association in submission.input_associations:
-        await session.delete(association)
-        await session.commit()
-    if submission:
-        await session.delete(submission)
-        await session.commit()
+    # Files and rows are removed by the cascade_delete task
+    await request_deletion(session, DeletionResource.SUBMISSION, submission.id)
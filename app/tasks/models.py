@@ -0,0 +1,66 @@
+from sqlmodel import SQLModel, Field, Column, JSON, Index
+from uuid import uuid4, UUID
+from typing import Any
+from enum import Enum
+from sqlalchemy.sql import func
+import datetime
+
+
+class TaskStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class TaskBase(SQLModel):
+    name: str = Field(index=True)
+    payload: dict[str, Any] = Field(default={}, sa_column=Column(JSON))
+    status: str = Field(default=TaskStatus.QUEUED, index=True)
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=1)
+    run_after: datetime.datetime = Field(
+        default_factory=datetime.datetime.now,
+        nullable=False,
+    )
+    locked_at: datetime.datetime | None = Field(default=None)
+    locked_by: str | None = Field(default=None)
+    last_error: str | None = Field(default=None)
+    time_added_utc: datetime.datetime = Field(
+        default_factory=datetime.datetime.now,
+        nullable=False,
+        index=True,
+    )
+    last_updated: datetime.datetime = Field(
+        default_factory=datetime.datetime.now,
+        title="Last Updated",
+        description="Date and time when the record was last updated",
+        sa_column_kwargs={
+            "onupdate": func.now(),
+            "server_default": func.now(),
+        },
+    )
+
+
+class Task(TaskBase, table=True):
+    # Claiming looks up the oldest due task that is still queued
+    __table_args__ = (
+        Index("ix_task_status_run_after", "status", "run_after"),
+    )
+
+    id: UUID = Field(
+        default_factory=uuid4,
+        index=True,
+        nullable=False,
+        primary_key=True,
+    )
+
+
+class TaskRead(TaskBase):
+    id: UUID
+
+
+class PeriodicRun(SQLModel, table=True):
+    # When each periodic job last started, on any worker
+    name: str = Field(primary_key=True)
+    last_run_utc: datetime.datetime = Field(nullable=False)
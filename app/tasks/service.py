@@ -0,0 +1,332 @@
+"""Durable background tasks stored in Postgres
+
+Tasks are rows in the task table. Any number of workers (`python -m
+app.worker`) claim due tasks with SELECT ... FOR UPDATE SKIP LOCKED, so a
+task runs on exactly one worker, and survives restarts of both the API and
+the workers. Failed tasks are retried with exponential backoff.
+
+Handlers are registered by name with the `register_task` decorator and are
+called with the task payload as keyword arguments, plus a task-scoped
+`session` and the worker's `s3` client.
+
+Tasks that build a result requested by the API (eg. previews of outputs)
+are queued with `enqueue_unique`, so that concurrent requests for the same
+result share one task.
+
+Periodic jobs are registered with `register_periodic` and are run once per
+interval across all workers. Every worker checks whether a job is due, under
+a Postgres advisory lock, against the time the job last started stored in
+the periodicrun table.
+
+Running tasks hold a lock (locked_at) renewed by their worker every
+TASK_HEARTBEAT_SECONDS, so tasks can take longer than the lock timeout, and
+only tasks of workers that stopped are handed to another worker.
+
+Finished tasks are kept for a while for inspection, and then pruned by the
+periodic prune_finished_tasks job, as tasks such as status checks queue a
+new task each time they poll.
+"""
+
+from app.config import config
+from app.db import AsyncSession, async_session, engine
+from app.tasks.models import PeriodicRun, Task, TaskStatus
+from sqlmodel import and_, delete, or_, select, update
+from sqlalchemy.sql import text
+from typing import Any, Callable, Awaitable
+import asyncio
+import contextlib
+import datetime
+import traceback
+
+TaskHandler = Callable[..., Awaitable[Any]]
+
+TASK_HANDLERS: dict[str, TaskHandler] = {}
+PERIODIC_TASKS: dict[str, tuple[float, TaskHandler]] = {}
+
+
+def register_task(name: str) -> Callable[[TaskHandler], TaskHandler]:
+    """Register the decorated coroutine as the handler of tasks `name`"""
+
+    def decorator(func: TaskHandler) -> TaskHandler:
+        TASK_HANDLERS[name] = func
+        return func
+
+    return decorator
+
+
+def register_periodic(
+    name: str,
+    interval_seconds: float,
+) -> Callable[[TaskHandler], TaskHandler]:
+    """Register the decorated coroutine to be run by workers periodically
+
+    It is called with a `session` and the worker's `s3` client.
+    """
+
+    def decorator(func: TaskHandler) -> TaskHandler:
+        PERIODIC_TASKS[name] = (interval_seconds, func)
+        return func
+
+    return decorator
+
+
+async def run_periodic(name: str, s3: Any) -> bool:
+    """Run a periodic job if it is due and no other worker is running it
+
+    The job is due when it has not started on any worker within its
+    interval. Returns whether the job was run on this worker.
+    """
+
+    interval, handler = PERIODIC_TASKS[name]
+
+    # Session-level advisory lock held on a dedicated connection, as the
+    # job is free to commit (and so end transactions) as it goes
+    async with engine.connect() as conn:
+        res = await conn.execute(
+            text("SELECT pg_try_advisory_lock(hashtext(:name))"),
+            {"name": f"periodic:{name}"},
+        )
+        if not res.scalar():
+            return False
+
+        try:
+            async with async_session() as session:
+                now = datetime.datetime.now()
+                run = await session.get(PeriodicRun, name)
+                if run is not None and run.last_run_utc > now - (
+                    datetime.timedelta(seconds=interval)
+                ):
+                    return False
+
+                # Recorded before running, so that a failing job is not
+                # retried by every worker until the next interval
+                run = run or PeriodicRun(name=name, last_run_utc=now)
+                run.last_run_utc = now
+                session.add(run)
+                await session.commit()
+
+                await handler(session=session, s3=s3)
+        finally:
+            await conn.execute(
+                text("SELECT pg_advisory_unlock(hashtext(:name))"),
+                {"name": f"periodic:{name}"},
+            )
+            await conn.commit()
+
+    return True
+
+
+async def enqueue(
+    session: AsyncSession,
+    name: str,
+    payload: dict[str, Any] | None = None,
+    *,
+    delay_seconds: float = 0,
+    max_attempts: int = config.TASK_MAX_ATTEMPTS,
+) -> Task:
+    """Add a task to the queue and commit it
+
+    The payload must be JSON serialisable (eg. UUIDs as strings).
+    """
+
+    task = Task(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_after=(
+            datetime.datetime.now() + datetime.timedelta(seconds=delay_seconds)
+        ),
+    )
+    session.add(task)
+    await session.commit()
+    await session.refresh(task)
+
+    return task
+
+
+async def enqueue_unique(
+    session: AsyncSession,
+    name: str,
+    payload: dict[str, Any],
+    *,
+    unique_on: str,
+    **kwargs: Any,
+) -> Task:
+    """Add a task to the queue, unless the same one is queued or running
+
+    Tasks are the same when their payloads have the same `unique_on` value.
+    Concurrent calls are serialised by an advisory lock on the value, held
+    until the transaction is committed. Returns the new or existing task.
+    """
+
+    value = str(payload[unique_on])
+    await session.exec(
+        text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+        params={"key": f"task:{name}:{value}"},
+    )
+    res = await session.exec(
+        select(Task)
+        .where(Task.name == name)
+        .where(Task.status.in_([TaskStatus.QUEUED, TaskStatus.RUNNING]))
+        .where(Task.payload[unique_on].as_string() == value)
+        .limit(1)
+    )
+    task = res.first()
+    if task is not None:
+        await session.commit()
+        return task
+
+    return await enqueue(session, name, payload, **kwargs)
+
+
+async def claim_task(
+    session: AsyncSession,
+    worker_id: str,
+) -> Task | None:
+    """Lock the oldest due task and mark it as running on this worker"""
+
+    query = (
+        select(Task)
+        .where(Task.status == TaskStatus.QUEUED)
+        .where(Task.run_after <= datetime.datetime.now())
+        .order_by(Task.run_after)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    res = await session.exec(query)
+    task = res.one_or_none()
+
+    if not task:
+        await session.rollback()
+        return None
+
+    task.status = TaskStatus.RUNNING
+    task.attempts += 1
+    task.locked_at = datetime.datetime.now()
+    task.locked_by = worker_id
+    session.add(task)
+    await session.commit()
+    await session.refresh(task)
+
+    return task
+
+
+async def requeue_stale_tasks(session: AsyncSession) -> None:
+    """Return tasks held by workers that stopped responding to the queue"""
+
+    stale_before = datetime.datetime.now() - datetime.timedelta(
+        seconds=config.TASK_LOCK_TIMEOUT_SECONDS
+    )
+    await session.exec(
+        update(Task)
+        .where(Task.status == TaskStatus.RUNNING)
+        .where(Task.locked_at < stale_before)
+        .values(status=TaskStatus.QUEUED, locked_at=None, locked_by=None)
+    )
+    await session.commit()
+
+
+async def heartbeat(task_id: Any, worker_id: str) -> None:
+    """Renew the lock of a running task until cancelled"""
+
+    while True:
+        await asyncio.sleep(config.TASK_HEARTBEAT_SECONDS)
+        try:
+            async with async_session() as session:
+                await session.exec(
+                    update(Task)
+                    .where(Task.id == task_id)
+                    .where(Task.status == TaskStatus.RUNNING)
+                    .where(Task.locked_by == worker_id)
+                    .values(locked_at=datetime.datetime.now())
+                )
+                await session.commit()
+        except Exception as e:
+            print(f"Could not renew the lock of task {task_id}: {e}")
+
+
+def retry_delay_seconds(attempts: int) -> float:
+    """Exponential backoff from the number of attempts already made"""
+
+    return min(
+        config.TASK_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1),
+        config.TASK_RETRY_BACKOFF_MAX_SECONDS,
+    )
+
+
+async def run_task(
+    task: Task,
+    session: AsyncSession,
+    s3: Any,
+) -> None:
+    """Run a claimed task in its own session and record the outcome
+
+    The task's lock is renewed while it runs.
+    """
+
+    renew = asyncio.create_task(heartbeat(task.id, task.locked_by))
+    try:
+        handler = TASK_HANDLERS.get(task.name)
+        if handler is None:
+            raise ValueError(f"No handler registered for task {task.name}")
+
+        async with async_session() as task_session:
+            await handler(**task.payload, session=task_session, s3=s3)
+
+        task.status = TaskStatus.SUCCEEDED
+        task.last_error = None
+    except Exception as e:
+        print(f"Task {task.name} ({task.id}) failed: {e}")
+        traceback.print_exc()
+        task.last_error = str(e)
+        if task.attempts < task.max_attempts:
+            task.status = TaskStatus.QUEUED
+            task.run_after = datetime.datetime.now() + datetime.timedelta(
+                seconds=retry_delay_seconds(task.attempts)
+            )
+        else:
+            task.status = TaskStatus.FAILED
+    finally:
+        renew.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await renew
+
+    task.locked_at = None
+    task.locked_by = None
+    session.add(task)
+    await session.commit()
+
+
+@register_periodic("prune_finished_tasks", config.TASK_PRUNE_INTERVAL_SECONDS)
+async def prune_finished_tasks(
+    session: AsyncSession,
+    s3: Any,
+) -> int:
+    """Delete finished tasks past their retention, returns how many"""
+
+    now = datetime.datetime.now()
+    succeeded_before = now - datetime.timedelta(
+        seconds=config.TASK_SUCCEEDED_RETENTION_SECONDS
+    )
+    failed_before = now - datetime.timedelta(
+        seconds=config.TASK_FAILED_RETENTION_SECONDS
+    )
+    res = await session.exec(
+        delete(Task).where(
+            or_(
+                and_(
+                    Task.status == TaskStatus.SUCCEEDED,
+                    Task.last_updated < succeeded_before,
+                ),
+                and_(
+                    Task.status == TaskStatus.FAILED,
+                    Task.last_updated < failed_before,
+                ),
+            )
+        )
+    )
+    await session.commit()
+
+    if res.rowcount:
+        print(f"Pruned {res.rowcount} finished tasks")
+    return res.rowcount
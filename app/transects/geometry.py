@@ -0,0 +1,27 @@
+from geoalchemy2 import WKBElement
+import functools
+import shapely
+
+
+@functools.lru_cache(maxsize=4096)
+def decode_wkb(wkb: str) -> dict | None:
+    shapely_obj = shapely.wkb.loads(wkb)
+    if shapely_obj is None:
+        return None
+
+    return shapely.geometry.mapping(shapely_obj)
+
+
+def geom_mapping(geom: WKBElement) -> dict | None:
+    """GeoJSON-like mapping of a geometry column's value
+
+    Decoded once per distinct geometry, as a page of objects or submissions
+    repeats the geometry of their transects on every row.
+    """
+
+    mapping = decode_wkb(str(geom))
+    if mapping is None:
+        return None
+
+    # A copy, so that the cached mapping cannot be modified
+    return dict(mapping)
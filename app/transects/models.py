@@ -4,13 +4,16 @@ from sqlmodel import (
     UniqueConstraint,
     Relationship,
     Column,
+    Index,
 )
 from pydantic import model_validator
 from typing import Any, TYPE_CHECKING
 from uuid import uuid4, UUID
 import datetime
 from sqlalchemy.sql import func
+from app.transects.geometry import geom_mapping
 from geoalchemy2 import Geometry, WKBElement
+from app.submissions.status.models import RunStatusReadSimple
 import shapely
 
 if TYPE_CHECKING:
@@ -45,6 +48,26 @@ class Transect(TransectBase, table=True):
     __table_args__ = (
         UniqueConstraint("id"),
         UniqueConstraint("name"),
+        # Keyset pagination of a user's transects by creation time
+        Index(
+            "ix_transect_owner_created_on_iterator",
+            "owner",
+            "created_on",
+            "iterator",
+        ),
+        # Substring (ILIKE) filters and search, with pg_trgm
+        Index(
+            "ix_transect_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_transect_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
     )
     iterator: int = Field(
         default=None,
@@ -68,14 +91,16 @@ class Transect(TransectBase, table=True):
         nullable=False,
         index=True,
     )
+    # Set when deletion is requested, until the deletion task removes the row
+    deleted_utc: datetime.datetime | None = Field(default=None, index=True)
 
     inputs: list["InputObject"] = Relationship(
         back_populates="transect",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
     submissions: list["Submission"] = Relationship(
         back_populates="transect",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
 
 
@@ -108,7 +133,7 @@ class SubmissionReadSimple(SQLModel):
     id: UUID
     name: str | None = None
     time_added_utc: datetime.datetime
-    run_status: list[Any] = []
+    run_status: list[RunStatusReadSimple] = []
 
 
 class TransectRead(TransectBase):
@@ -133,9 +158,8 @@ class TransectRead(TransectBase):
 
         if isinstance(values.geom, WKBElement):
             if values.geom is not None:
-                shapely_obj = shapely.wkb.loads(str(values.geom))
-                if shapely_obj is not None:
-                    mapping = shapely.geometry.mapping(shapely_obj)
+                mapping = geom_mapping(values.geom)
+                if mapping is not None:
                     values.latitude_start = mapping["coordinates"][0][1]
                     values.longitude_start = mapping["coordinates"][0][0]
                     values.latitude_end = mapping["coordinates"][-1][1]
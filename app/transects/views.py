@@ -14,51 +14,80 @@ from fastapi import (
     Request,
 )
 from uuid import UUID
+import json
 from app.crud import CRUD
+from app.deletion import request_deletion, DeletionResource
+from app.loaders import TRANSECT_FIELDSET, TRANSECT_READ_RESOURCES
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.responses import read_model_response
+from app.query_cache import (
+    invalidate,
+    query_key,
+    get_query_result,
+    set_query_result,
+    result_headers,
+)
 from app.users.models import User
 from app.auth.services import get_user_info
 
-
 router = APIRouter()
-crud = CRUD(Transect, TransectRead, TransectCreate, TransectUpdate)
+crud = CRUD(
+    Transect,
+    TransectRead,
+    TransectCreate,
+    TransectUpdate,
+    fieldset=TRANSECT_FIELDSET,
+    cursor_sort=("created_on", "DESC"),
+)
 
 
-async def get_count(
+async def get_data(
     response: Response,
     filter: str = Query(None),
-    range: str = Query(None),
     sort: str = Query(None),
+    range: str = Query(None),
+    cursor: str = Query(None),
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = Query(None),
     user: User = Depends(get_user_info),
     session: AsyncSession = Depends(get_session),
 ):
-    count = await crud.get_total_count(
-        response=response,
-        sort=sort,
-        range=range,
-        filter=filter,
-        session=session,
-        user=user,
+    fields = TRANSECT_FIELDSET.parse(fields)
+
+    key = await query_key(
+        "transects",
+        TRANSECT_READ_RESOURCES,
+        user,
+        dict(
+            filter=json.loads(filter) if filter else {},
+            sort=json.loads(sort) if sort else [],
+            range=json.loads(range) if range else [],
+            cursor=cursor,
+            page_size=page_size,
+            fields=sorted(fields or []),
+        ),
     )
+    cached = await get_query_result(key)
+    if cached is not None:
+        transects, headers = cached
+        response.headers.update(headers)
+        return transects
 
-    return count
-
-
-async def get_data(
-    filter: str = Query(None),
-    sort: str = Query(None),
-    range: str = Query(None),
-    user: User = Depends(get_user_info),
-    session: AsyncSession = Depends(get_session),
-):
     res = await crud.get_model_data(
         sort=sort,
         range=range,
         filter=filter,
         session=session,
         user=user,
+        cursor=cursor,
+        page_size=page_size,
+        response=response,
+        fields=fields,
     )
+    transects = [TRANSECT_FIELDSET.validate(x, fields) for x in res]
+    await set_query_result(key, (transects, result_headers(response)))
 
-    return res
+    return transects
 
 
 async def get_one(
@@ -81,23 +110,57 @@ async def get_one(
 
 @router.get("/{transect_id}", response_model=TransectRead)
 async def get_transect(
-    obj: CRUD = Depends(get_one),
-) -> TransectRead:
-    """Get a transect by id"""
+    transect_id: UUID,
+    user: User = Depends(get_user_info),
+    session: AsyncSession = Depends(get_session),
+    fields: str = Query(None),
+) -> Response:
+    """Get a transect by id
+
+    With fields, ie. "id,name", only those fields (see app.fieldsets)
+    """
+
+    fields = TRANSECT_FIELDSET.parse(fields)
+
+    key = await query_key(
+        "transect",
+        TRANSECT_READ_RESOURCES,
+        user,
+        {"id": transect_id, "fields": sorted(fields or [])},
+    )
+    obj = await get_query_result(key)
+    if obj is None:
+        res = await crud.get_model_by_id(
+            model_id=transect_id,
+            session=session,
+            user=user,
+            fields=fields,
+        )
+        if not res:
+            raise HTTPException(
+                status_code=404, detail=f"ID: {transect_id} not found"
+            )
+        obj = TRANSECT_FIELDSET.validate(res, fields)
+        await set_query_result(key, obj)
 
-    return obj
+    return read_model_response(obj, TRANSECT_FIELDSET.model(fields))
 
 
 @router.get("", response_model=list[TransectRead])
 async def get_all_transects(
     request: Request,
     response: Response,
-    transects: CRUD = Depends(get_data),
-    total_count: int = Depends(get_count),
-) -> list[TransectRead]:
-    """Get all transect data"""
-
-    return transects
+    transects: list[TransectRead] = Depends(get_data),
+) -> Response:
+    """Get all transect data, with only the fields param if given"""
+
+    return read_model_response(
+        transects,
+        TRANSECT_FIELDSET.model(
+            TRANSECT_FIELDSET.parse(request.query_params.get("fields"))
+        ),
+        response,
+    )
 
 
 @router.post("", response_model=TransectRead)
@@ -117,9 +180,9 @@ async def create_transect(
     session.add(obj)
 
     await session.commit()
-    await session.refresh(obj)
+    await invalidate(Transect)
 
-    return obj
+    return await crud.get_model_by_id(session, user, model_id=obj.id)
 
 
 @router.put("/{transect_id}", response_model=TransectRead)
@@ -137,6 +200,7 @@ async def update_transect(
     session.add(transect)
     await session.commit()
     await session.refresh(transect)
+    await invalidate(Transect)
 
     return transect
 
@@ -148,7 +212,8 @@ async def delete_transect(
 ) -> None:
     """Delete a transect by id"""
 
-    await session.delete(transect)
-    await session.commit()
+    # The transect, its objects and submissions are removed by the
+    # cascade_delete task
+    await request_deletion(session, DeletionResource.TRANSECT, transect.id)
 
     return {"ok": True}
@@ -0,0 +1,92 @@
+"""Worker process for the durable task queue
+
+Runs the tasks queued in the database, apart from the API. Start as many
+replicas as needed with:
+
+    python -m app.worker
+"""
+
+from app.config import config
+from app.db import async_session
+from app.objects.service import s3_client
+from app.processing import shutdown_process_pool
+from app.tasks.service import (
+    PERIODIC_TASKS,
+    claim_task,
+    requeue_stale_tasks,
+    run_task,
+    run_periodic,
+)
+from typing import Any
+import app.deletion  # noqa: F401 (registers task handlers)
+import app.objects.utils  # noqa: F401 (registers task handlers)
+import app.objects.progress  # noqa: F401 (registers task handlers)
+import app.submissions.utils  # noqa: F401 (registers task handlers)
+import app.status.service  # noqa: F401 (registers task handlers)
+import asyncio
+import os
+import socket
+
+
+async def work(worker_id: str, s3: Any) -> None:
+    """Claim and run tasks one at a time, sleeping when the queue is empty"""
+
+    while True:
+        try:
+            async with async_session() as session:
+                task = await claim_task(session, worker_id)
+                if task:
+                    await run_task(task, session, s3)
+        except Exception as e:
+            print(f"Worker {worker_id} could not claim a task: {e}")
+            task = None
+
+        if not task:
+            await asyncio.sleep(config.TASK_POLL_INTERVAL_SECONDS)
+
+
+async def requeue_stale(worker_id: str) -> None:
+    while True:
+        try:
+            async with async_session() as session:
+                await requeue_stale_tasks(session)
+        except Exception as e:
+            print(f"Worker {worker_id} could not requeue stale tasks: {e}")
+
+        await asyncio.sleep(config.TASK_LOCK_TIMEOUT_SECONDS)
+
+
+async def periodic(name: str, s3: Any) -> None:
+    interval, _ = PERIODIC_TASKS[name]
+    while True:
+        try:
+            await run_periodic(name, s3)
+        except Exception as e:
+            print(f"Periodic task {name} failed: {e}")
+
+        await asyncio.sleep(min(interval, config.TASK_PERIODIC_CHECK_SECONDS))
+
+
+async def main() -> None:
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    print(
+        f"Starting worker {worker_id} with "
+        f"{config.TASK_WORKER_CONCURRENCY} concurrent tasks"
+    )
+
+    async with s3_client() as s3:
+        try:
+            await asyncio.gather(
+                requeue_stale(worker_id),
+                *[periodic(name, s3) for name in PERIODIC_TASKS],
+                *[
+                    work(f"{worker_id}-{i}", s3)
+                    for i in range(config.TASK_WORKER_CONCURRENCY)
+                ],
+            )
+        finally:
+            shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""Per-row cost of serializing 1000-row pages of the list endpoints
+
+Rows are validated into read models as the endpoints do, then serialized
+by FastAPI's response path (validation against the response_model again,
+jsonable_encoder and the json module) or by read_model_response, which
+must give the same JSON. Run with:
+
+    python -m benchmarks.serialization
+"""
+
+from app.main import app  # noqa: F401, to resolve the read models
+from app.objects.models import (
+    InputObject,
+    InputObjectAssociations,
+    InputObjectRead,
+)
+from app.responses import read_model_response
+from app.submissions.models import Submission, SubmissionRead
+from app.submissions.status.models import RunStatus
+from app.transects.models import Transect, TransectRead
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString
+import asyncio
+import datetime
+import json
+import time
+import uuid
+
+PAGE_SIZE = 1000
+REPEATS = 10
+
+
+def sample_transect(i: int) -> Transect:
+    transect = Transect(
+        id=uuid.uuid4(),
+        name=f"Transect {i}",
+        description="Reef survey",
+        length=100.0,
+        depth=12.5,
+        owner=uuid.uuid4(),
+        geom=from_shape(LineString([(6.5, 46.5), (6.6, 46.6)]), srid=4326),
+    )
+    transect.inputs = []
+    transect.submissions = []
+
+    return transect
+
+
+def sample_object(i: int) -> InputObject:
+    obj = InputObject(
+        id=uuid.uuid4(),
+        iterator=i,
+        filename=f"video_{i}.mp4",
+        owner=uuid.uuid4(),
+        size_bytes=2**30,
+        fps=29.97,
+        time_seconds=600.0,
+        frame_count=17982,
+        processing_has_started=True,
+        processing_completed_successfully=True,
+        processing_message="Done",
+        all_parts_received=True,
+        time_added_utc=datetime.datetime.now(),
+    )
+    obj.input_associations = [
+        InputObjectAssociations(
+            input_object_id=obj.id,
+            submission_id=uuid.uuid4(),
+            processing_order=0,
+        )
+    ]
+    obj.transect = sample_transect(i)
+
+    return obj
+
+
+def sample_submission(i: int) -> Submission:
+    submission = Submission(
+        id=uuid.uuid4(),
+        iterator=i,
+        name=f"Submission {i}",
+        owner=uuid.uuid4(),
+        fps=30,
+        percentage_covers=[{"class": "coral", "percentage_cover": 0.4}],
+        time_added_utc=datetime.datetime.now(),
+    )
+    submission.run_status = [
+        RunStatus(
+            id=uuid.uuid4(),
+            submission_id=submission.id,
+            status="Succeeded",
+            kubernetes_pod_name=f"job-{i}",
+            logs="log line\n" * 20,
+        )
+    ]
+    obj = sample_object(i)
+    association = InputObjectAssociations(
+        input_object_id=obj.id,
+        submission_id=submission.id,
+        processing_order=0,
+    )
+    association.input_object = obj
+    submission.input_associations = [association]
+    submission.transect = sample_transect(i)
+
+    return submission
+
+
+async def fastapi_path(models: list, read_model: type) -> bytes:
+    field = create_response_field(name="Response", type_=list[read_model])
+    content = await serialize_response(field=field, response_content=models)
+
+    return JSONResponse(content).body
+
+
+def read_model_path(models: list, read_model: type) -> bytes:
+    return read_model_response(models, read_model).body
+
+
+def per_row_us(function, rows: list) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(rows)
+        best = min(best, time.perf_counter() - start)
+
+    return best / len(rows) * 1e6
+
+
+def main() -> None:
+    for name, sample, read_model in (
+        ("objects", sample_object, InputObjectRead),
+        ("submissions", sample_submission, SubmissionRead),
+        ("transects", sample_transect, TransectRead),
+    ):
+        rows = [sample(i) for i in range(PAGE_SIZE)]
+
+        def validate(rows: list) -> list:
+            return [read_model.model_validate(row) for row in rows]
+
+        def response_model(models: list) -> bytes:
+            return asyncio.run(fastapi_path(models, read_model))
+
+        def read_model_json(models: list) -> bytes:
+            return read_model_path(models, read_model)
+
+        models = validate(rows)
+        assert json.loads(response_model(models)) == json.loads(
+            read_model_json(models)
+        )
+
+        validation = per_row_us(validate, rows)
+        before = per_row_us(response_model, models)
+        after = per_row_us(read_model_json, models)
+        print(
+            f"{name:<12} validation {validation:6.1f} us/row, then "
+            f"response_model {before:6.1f} us/row or "
+            f"read_model_response {after:6.1f} us/row"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,9 @@ from app.objects.models import (  # noqa: F401
     InputObjectAssociations,
 )
 from app.transects.models import Transect  # noqa: F401
+from app.tasks.models import Task  # noqa: F401
+from app.status.models import StorageUsage  # noqa: F401
+from app.submissions.outputs.models import SubmissionOutput  # noqa: F401
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
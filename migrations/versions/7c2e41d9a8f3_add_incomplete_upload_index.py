@@ -0,0 +1,36 @@
+"""Add partial index on incomplete uploads
+
+Revision ID: 7c2e41d9a8f3
+Revises: 3f5a9c1e7b20
+Create Date: 2026-10-17 10:41:05.873214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e41d9a8f3'
+down_revision: Union[str, None] = '3f5a9c1e7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_inputobject_incomplete_last_part_received_utc',
+        'inputobject',
+        ['last_part_received_utc'],
+        unique=False,
+        postgresql_where=sa.text('NOT all_parts_received'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_inputobject_incomplete_last_part_received_utc',
+        table_name='inputobject',
+    )
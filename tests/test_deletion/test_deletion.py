@@ -0,0 +1,310 @@
+import datetime
+import pytest
+from types import SimpleNamespace
+from uuid import uuid4
+from sqlmodel import select
+import app.deletion as deletion
+from app.config import config
+from app.deletion import DeletionResource, cascade_delete, request_deletion
+from app.loaders import INPUT_OBJECT_READ, TRANSECT_READ
+from app.objects.models import InputObject, InputObjectAssociations
+from app.objects.service import upload_keys
+from app.status.models import StorageUsage
+from app.status.service import (
+    INPUTS_FOLDER,
+    OUTPUTS_FOLDER,
+    record_storage_usage,
+)
+from app.submissions.models import Submission
+from app.submissions.outputs.models import SubmissionOutput
+from app.submissions.status.models import RunStatus
+from app.transects.models import Transect
+from app.transects.views import crud
+
+OWNER = uuid4()
+ADMIN = SimpleNamespace(is_admin=True, id=uuid4())
+NOW = datetime.datetime(2024, 5, 1, 12, 0)
+SUBMISSIONS_ROUTE = f"{config.API_PREFIX}/submissions"
+
+
+class MockPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    async def paginate(self, Bucket, Prefix, PaginationConfig):
+        keys = [key for key in self.s3.keys if key.startswith(Prefix)]
+        yield {"Contents": [{"Key": key} for key in keys]}
+
+
+class MockS3:
+    def __init__(self, keys: list[str]):
+        self.keys = keys
+        self.aborted = []
+        self.deleted = []
+
+    def get_paginator(self, name):
+        return MockPaginator(self)
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+
+    async def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.deleted.append(obj["Key"])
+            self.keys.remove(obj["Key"])
+        return {}
+
+
+@pytest.fixture
+def published(monkeypatch):
+    published = []
+
+    async def publish_event(type, id, owner, **data):
+        published.append(data)
+
+    monkeypatch.setattr(deletion, "publish_event", publish_event)
+
+    return published
+
+
+async def create_transect(session) -> SimpleNamespace:
+    """A transect with an upload, a run of it and its output"""
+
+    transect = Transect(owner=OWNER, name="Transect")
+    obj = InputObject(
+        owner=OWNER,
+        transect_id=transect.id,
+        size_bytes=100,
+        upload_id="multipart-1",
+        all_parts_received=False,
+    )
+    submission = Submission(owner=OWNER, name="Run", transect_id=transect.id)
+    other = InputObject(owner=OWNER, size_bytes=10, all_parts_received=True)
+    for row in (transect, obj, submission, other):
+        session.add(row)
+    await session.flush()
+
+    session.add(
+        InputObjectAssociations(
+            input_object_id=obj.id, submission_id=submission.id
+        )
+    )
+    session.add(RunStatus(submission_id=submission.id, is_successful=True))
+    output_key = f"{config.S3_PREFIX}/outputs/{submission.id}/a.csv"
+    session.add(
+        SubmissionOutput(
+            submission_id=submission.id,
+            key=output_key,
+            filename="a.csv",
+            size_bytes=500,
+            last_modified=NOW,
+        )
+    )
+    await record_storage_usage(session, INPUTS_FOLDER, OWNER, 2, 110)
+    await record_storage_usage(session, OUTPUTS_FOLDER, OWNER, 1, 500)
+    await session.commit()
+
+    return SimpleNamespace(
+        transect=transect,
+        obj=obj,
+        submission=submission,
+        other=other,
+        output_key=output_key,
+        preview_key=f"{config.S3_PREFIX}/previews/{submission.id}/a/0.png",
+    )
+
+
+@pytest.mark.asyncio
+async def test_request_deletion_tombstones_dependents(
+    modified_async_session,
+):
+    rows = await create_transect(modified_async_session)
+
+    task = await request_deletion(
+        modified_async_session, DeletionResource.TRANSECT, rows.transect.id
+    )
+    await modified_async_session.commit()
+
+    assert task.name == "cascade_delete"
+    assert task.payload == {
+        "resource": "transect",
+        "id": str(rows.transect.id),
+    }
+
+    modified_async_session.expire_all()
+    for model, row, tombstoned in (
+        (Transect, rows.transect, True),
+        (InputObject, rows.obj, True),
+        (Submission, rows.submission, True),
+        (InputObject, rows.other, False),
+    ):
+        res = await modified_async_session.exec(
+            select(model.deleted_utc).where(model.id == row.id)
+        )
+        assert (res.one() is not None) == tombstoned
+
+
+@pytest.mark.asyncio
+async def test_tombstoned_rows_are_hidden(modified_async_session):
+    rows = await create_transect(modified_async_session)
+    assert await crud.get_model_by_id(
+        modified_async_session, ADMIN, model_id=rows.transect.id
+    )
+
+    await request_deletion(
+        modified_async_session, DeletionResource.TRANSECT, rows.transect.id
+    )
+    await modified_async_session.commit()
+
+    assert (
+        await crud.get_model_by_id(
+            modified_async_session, ADMIN, model_id=rows.transect.id
+        )
+        is None
+    )
+    res = await modified_async_session.exec(crud.count_query(ADMIN, {}))
+    assert res.one() == 0
+
+
+@pytest.mark.asyncio
+async def test_tombstoned_rows_are_hidden_from_relationships(
+    modified_async_session,
+):
+    rows = await create_transect(modified_async_session)
+
+    async def load(model, options, id):
+        modified_async_session.expire_all()
+        res = await modified_async_session.exec(
+            select(model).where(model.id == id).options(*options)
+        )
+        return res.one()
+
+    await request_deletion(
+        modified_async_session, DeletionResource.SUBMISSION, rows.submission.id
+    )
+    await modified_async_session.commit()
+
+    transect = await load(Transect, TRANSECT_READ, rows.transect.id)
+    assert transect.submissions == []
+    assert [obj.id for obj in transect.inputs] == [rows.obj.id]
+    obj = await load(InputObject, INPUT_OBJECT_READ, rows.obj.id)
+    assert obj.input_associations == []
+
+    await request_deletion(
+        modified_async_session, DeletionResource.INPUT_OBJECT, rows.obj.id
+    )
+    await modified_async_session.commit()
+
+    transect = await load(Transect, TRANSECT_READ, rows.transect.id)
+    assert transect.inputs == []
+
+
+@pytest.mark.asyncio
+async def test_tombstoned_rows_cannot_be_added_to_a_submission(
+    modified_async_session, client_three_admin
+):
+    rows = await create_transect(modified_async_session)
+    await request_deletion(
+        modified_async_session, DeletionResource.INPUT_OBJECT, rows.obj.id
+    )
+    await modified_async_session.commit()
+
+    res = await client_three_admin.post(
+        SUBMISSIONS_ROUTE,
+        json={
+            "name": "Run",
+            "transect_id": rows.transect.id.hex,
+            "input_associations": [{"input_object_id": rows.obj.id.hex}],
+        },
+    )
+    assert res.status_code == 404, res.text
+    assert str(rows.obj.id) in res.json()["detail"]
+
+    await request_deletion(
+        modified_async_session, DeletionResource.TRANSECT, rows.transect.id
+    )
+    await modified_async_session.commit()
+
+    res = await client_three_admin.post(
+        SUBMISSIONS_ROUTE,
+        json={
+            "name": "Run",
+            "transect_id": rows.transect.id.hex,
+            "input_associations": [{"input_object_id": rows.other.id.hex}],
+        },
+    )
+    assert res.status_code == 404, res.text
+    assert res.json()["detail"].startswith("Transect not found")
+
+
+@pytest.mark.asyncio
+async def test_cascade_delete_transect(modified_async_session, published):
+    rows = await create_transect(modified_async_session)
+    s3 = MockS3(upload_keys(rows.obj.id) + [rows.output_key, rows.preview_key])
+    task = await request_deletion(
+        modified_async_session, DeletionResource.TRANSECT, rows.transect.id
+    )
+    await modified_async_session.commit()
+
+    await cascade_delete(**task.payload, session=modified_async_session, s3=s3)
+
+    # The unfinished upload is aborted, and all of the files deleted
+    assert s3.aborted == ["multipart-1"]
+    assert sorted(s3.deleted) == sorted(
+        upload_keys(rows.obj.id) + [rows.output_key, rows.preview_key]
+    )
+    assert published[-1] == {
+        "resource": "transect",
+        "keys_deleted": 5,
+        "completed": True,
+    }
+
+    # Only the rows of the transect are removed
+    modified_async_session.expire_all()
+    for model in (
+        Transect,
+        Submission,
+        RunStatus,
+        SubmissionOutput,
+        InputObjectAssociations,
+    ):
+        res = await modified_async_session.exec(select(model))
+        assert res.all() == []
+    res = await modified_async_session.exec(select(InputObject.id))
+    assert res.all() == [rows.other.id]
+
+    # and their storage usage is released
+    res = await modified_async_session.exec(
+        select(StorageUsage).where(StorageUsage.owner == OWNER)
+    )
+    usage = {
+        row.folder: (row.object_count, row.size_bytes) for row in res.all()
+    }
+    assert usage == {INPUTS_FOLDER: (1, 10), OUTPUTS_FOLDER: (0, 0)}
+
+
+@pytest.mark.asyncio
+async def test_cascade_delete_is_retried_from_the_start(
+    modified_async_session, published
+):
+    rows = await create_transect(modified_async_session)
+    s3 = MockS3([rows.output_key])
+    task = await request_deletion(
+        modified_async_session, DeletionResource.SUBMISSION, rows.submission.id
+    )
+    await modified_async_session.commit()
+
+    # A retry of a task that had already completed finds nothing to delete
+    for _ in range(2):
+        await cascade_delete(
+            **task.payload, session=modified_async_session, s3=s3
+        )
+
+    assert s3.deleted == [rows.output_key]
+    assert s3.keys == []
+    res = await modified_async_session.exec(
+        select(StorageUsage.object_count).where(
+            StorageUsage.folder == OUTPUTS_FOLDER
+        )
+    )
+    assert res.one() == 0
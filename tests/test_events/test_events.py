@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from uuid import uuid4
+import app.objects.hooks as hooks
+from app.config import config
+from app.events import service
+from app.events.models import Event, EventType
+from app.events.service import broker, event_due
+from app.events.views import get_event_stream, is_visible
+
+OWNER = uuid4()
+OTHER = uuid4()
+USER = SimpleNamespace(is_admin=False, id=str(OWNER))
+ADMIN = SimpleNamespace(is_admin=True, id=str(uuid4()))
+
+
+class MockRedis:
+    def __init__(self):
+        self.keys = set()
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.keys:
+            return None
+        self.keys.add(key)
+        return True
+
+
+class MockRequest:
+    """Disconnects after the stream has checked a number of times"""
+
+    def __init__(self, checks: int):
+        self.checks = checks
+
+    async def is_disconnected(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+
+
+def event(type: EventType, owner, **data) -> Event:
+    return Event(type=type, id=uuid4(), owner=owner, data=data)
+
+
+def test_is_visible():
+    own = event(EventType.INPUT_OBJECT, OWNER)
+    other = event(EventType.RUN_STATUS, OTHER)
+
+    assert is_visible(own, USER, None, None)
+    assert not is_visible(other, USER, None, None)
+    assert is_visible(other, ADMIN, None, None)
+
+    assert not is_visible(own, USER, [EventType.RUN_STATUS], None)
+    assert is_visible(own, USER, [EventType.INPUT_OBJECT], [own.id])
+    assert not is_visible(own, USER, None, [other.id])
+
+
+@pytest.mark.asyncio
+async def test_stream_filters_events_by_owner(monkeypatch):
+    own = event(EventType.INPUT_OBJECT, OWNER, offset=1)
+    other = event(EventType.INPUT_OBJECT, OTHER, offset=2)
+    queue = asyncio.Queue()
+    for e in (own, other):
+        queue.put_nowait(e)
+
+    @asynccontextmanager
+    async def subscribe():
+        yield queue
+
+    monkeypatch.setattr(broker, "subscribe", subscribe)
+    monkeypatch.setattr(config, "EVENTS_HEARTBEAT_SECONDS", 0.01)
+
+    response = await get_event_stream(
+        MockRequest(checks=3), USER, type=None, id=None
+    )
+    chunks = [chunk async for chunk in response.body_iterator]
+
+    assert response.media_type == "text/event-stream"
+    assert chunks == [
+        f"event: input_object\ndata: {own.model_dump_json()}\n\n",
+        ": keep-alive\n\n",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_event_due_once_per_interval(monkeypatch):
+    monkeypatch.setattr(service, "get_redis", lambda: redis)
+    redis = MockRedis()
+
+    assert await event_due("progress:a", 1)
+    assert not await event_due("progress:a", 1)
+    assert await event_due("progress:b", 1)
+
+
+@pytest.mark.asyncio
+async def test_upload_progress_events_are_throttled(monkeypatch):
+    published = []
+
+    async def record_upload_progress(*args):
+        pass
+
+    async def publish_event(type, id, owner, **data):
+        published.append(data["offset"])
+
+    monkeypatch.setattr(service, "get_redis", lambda: redis)
+    monkeypatch.setattr(
+        hooks, "record_upload_progress", record_upload_progress
+    )
+    monkeypatch.setattr(hooks, "publish_event", publish_event)
+    redis = MockRedis()
+
+    object_id = uuid4()
+    for offset in (10, 20, 30, 100):
+        payload = {
+            "Event": {
+                "Upload": {
+                    "ID": f"{config.INPUT_FOLDER_PREFIX}{object_id}+abc",
+                    "Size": 100,
+                    "Offset": offset,
+                }
+            }
+        }
+        await hooks.post_receive(None, USER, payload)
+
+    # The first chunk within the interval, and the last chunk
+    assert published == [10, 100]
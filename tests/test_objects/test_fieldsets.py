@@ -0,0 +1,120 @@
+import datetime
+import json
+import pickle
+import pytest
+import uuid
+from types import SimpleNamespace
+from fastapi import HTTPException
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+from app.fieldsets import sparse_model
+from app.loaders import INPUT_OBJECT_FIELDSET, TRANSECT_FIELDSET
+from app.objects.models import InputObject, InputObjectRead
+from app.responses import read_model_response
+from app.transects.models import Transect, TransectRead
+from app.transects.views import crud
+
+
+def compile_query(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect()))
+
+
+def transect() -> Transect:
+    return Transect(
+        id=uuid.uuid4(),
+        name="Transect",
+        description="Along the reef",
+        owner=uuid.uuid4(),
+        geom=from_shape(LineString([(6.5, 46.5), (6.6, 46.6)]), srid=4326),
+    )
+
+
+def test_parse():
+    assert TRANSECT_FIELDSET.parse(None) is None
+    assert TRANSECT_FIELDSET.parse("") is None
+    assert TRANSECT_FIELDSET.parse("name, latitude_start,") == frozenset(
+        {"id", "name", "latitude_start"}
+    )
+
+    with pytest.raises(HTTPException) as e:
+        TRANSECT_FIELDSET.parse("name,nope")
+    assert e.value.status_code == 400
+
+
+def test_load_only_the_fields():
+    fields = INPUT_OBJECT_FIELDSET.parse("filename,transect")
+    sql = compile_query(
+        select(InputObject).options(
+            *INPUT_OBJECT_FIELDSET.load_options(
+                fields, ("time_added_utc", "iterator")
+            )
+        )
+    )
+
+    for column in ("filename", "id", "iterator", "time_added_utc"):
+        assert f"inputobject.{column}" in sql
+    assert "inputobject.notes" not in sql
+    assert "LEFT OUTER JOIN transect AS transect_1" in sql
+
+
+def test_load_all_fields_without_fields():
+    sql = compile_query(
+        select(InputObject).options(*INPUT_OBJECT_FIELDSET.load_options())
+    )
+
+    assert "inputobject.notes" in sql
+    assert "LEFT OUTER JOIN transect AS transect_1" in sql
+
+
+def test_sparse_response():
+    fields = TRANSECT_FIELDSET.parse("name,latitude_end")
+
+    read = TRANSECT_FIELDSET.validate(transect(), fields)
+    response = read_model_response(read, TRANSECT_FIELDSET.model(fields))
+
+    body = json.loads(response.body)
+    assert set(body) == {"id", "name", "latitude_end"}
+    assert body["latitude_end"] == 46.6
+
+
+def test_full_response_without_fields():
+    read = TRANSECT_FIELDSET.validate(transect(), None)
+
+    assert type(read) is TransectRead
+
+
+def test_sparse_models_are_built_once_and_pickle():
+    fields = frozenset({"id", "filename"})
+    model = sparse_model(InputObjectRead, fields)
+    assert model is sparse_model(InputObjectRead, fields)
+
+    read = model.model_validate(
+        {
+            "id": uuid.uuid4(),
+            "filename": "a.mp4",
+            "time_added_utc": datetime.datetime(2024, 5, 1),
+        }
+    )
+    restored = pickle.loads(pickle.dumps(read))
+
+    assert type(restored) is model
+    assert restored.model_dump() == read.model_dump()
+    assert set(restored.model_dump()) == fields
+
+
+@pytest.mark.asyncio
+async def test_unknown_cursor_sort_field_with_fields():
+    with pytest.raises(HTTPException) as e:
+        await crud.get_model_data(
+            filter=None,
+            sort='["nope", "ASC"]',
+            range=None,
+            user=SimpleNamespace(is_admin=True),
+            session=None,
+            cursor="",
+            fields=TRANSECT_FIELDSET.parse("name"),
+        )
+
+    assert e.value.status_code == 400
@@ -0,0 +1,82 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+from uuid import uuid4
+from app.crud import list_plan
+from app.objects.models import InputObject
+from app.transects.models import Transect
+
+
+def compile_query(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect()))
+
+
+def test_plan_is_built_once():
+    assert list_plan(InputObject) is list_plan(InputObject)
+
+
+def test_filter_operators():
+    transect_ids = [str(uuid4()), str(uuid4())]
+    sql = compile_query(
+        list_plan(InputObject).filter(
+            select(InputObject),
+            {
+                "transect_id": transect_ids,
+                "all_parts_received": True,
+                "filename": "reef",
+                "notes": ["a", "b"],
+                "frame_count": 10,
+            },
+        )
+    )
+
+    assert "inputobject.transect_id IN (__[POSTCOMPILE_transect_id_1])" in sql
+    assert "inputobject.all_parts_received = true" in sql
+    assert "inputobject.filename ILIKE %(filename_1)s" in sql
+    assert "(inputobject.notes ILIKE %(notes_1)s ESCAPE" in sql
+    assert " OR inputobject.notes ILIKE %(notes_2)s ESCAPE" in sql
+    assert "inputobject.frame_count = %(frame_count_1)s" in sql
+
+
+def test_filter_text_escapes_wildcards():
+    query = list_plan(InputObject).filter(
+        select(InputObject), {"filename": "100%_a"}
+    )
+
+    assert "inputobject.filename ILIKE %(filename_1)s ESCAPE" in (
+        compile_query(query)
+    )
+    params = query.compile(dialect=postgresql.dialect()).params
+    assert params["filename_1"] == "%100\\%\\_a%"
+
+
+def test_filter_relationships():
+    sql = compile_query(
+        list_plan(Transect).filter(select(Transect), {"submissions": False})
+    )
+
+    assert "NOT (EXISTS (SELECT 1" in sql
+
+
+def test_filter_rejects_unknown_fields_and_ids():
+    plan = list_plan(InputObject)
+
+    for filter in ({"nope": 1}, {"parts": "x"}, {"id": "not-an-id"}):
+        with pytest.raises(HTTPException) as e:
+            plan.filter(select(InputObject), filter)
+        assert e.value.status_code == 400
+
+
+def test_sort():
+    plan = list_plan(InputObject)
+
+    sql = compile_query(
+        plan.sort(select(InputObject), ["time_added_utc", "DESC"])
+    )
+    assert "ORDER BY inputobject.time_added_utc DESC" in sql
+    assert "ORDER BY" not in compile_query(plan.sort(select(InputObject), []))
+
+    with pytest.raises(HTTPException) as e:
+        plan.sort(select(InputObject), ["transect", "ASC"])
+    assert e.value.status_code == 400
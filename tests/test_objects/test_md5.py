@@ -0,0 +1,41 @@
+import hashlib
+import pytest
+from app.config import config
+from app.objects.service import md5_s3_object
+from app.objects.utils import md5_from_etag
+
+
+class MockBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def iter_chunks(self, chunk_size: int):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+class MockS3:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def get_object(self, Bucket, Key):
+        return {"Body": MockBody(self.data)}
+
+
+def test_md5_from_etag():
+    md5 = hashlib.md5(b"video").hexdigest()
+
+    assert md5_from_etag(f'"{md5}"') == md5
+    # Multipart uploads, as made by tusd, do not carry the MD5
+    assert md5_from_etag(f'"{md5}-3"') is None
+    assert md5_from_etag(None) is None
+
+
+@pytest.mark.asyncio
+async def test_md5_s3_object_streams_whole_body(monkeypatch):
+    monkeypatch.setattr(config, "S3_STREAM_CHUNK_SIZE_BYTES", 7)
+    data = bytes(range(256)) * 10
+
+    assert await md5_s3_object(MockS3(data), "key") == (
+        hashlib.md5(data).hexdigest()
+    )
@@ -0,0 +1,211 @@
+import datetime
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+from types import SimpleNamespace
+from app.objects.models import InputObject
+from app.pagination import (
+    cache,
+    fetch_page,
+    encode_cursor,
+    decode_cursor,
+    paginate_by_cursor,
+    next_cursor,
+    NEXT_CURSOR_HEADER,
+)
+from sqlalchemy import func
+
+ADDED = datetime.datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+
+def compile_query(query) -> str:
+    return str(
+        query.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={"literal_binds": True},
+        )
+    )
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("time_added_utc", "DESC", ADDED, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(
+        cursor, "time_added_utc", "DESC", InputObject.time_added_utc
+    ) == (ADDED, 42)
+
+
+def test_cursor_rejects_other_sorts_and_garbage():
+    cursor = encode_cursor("time_added_utc", "DESC", ADDED, 42)
+
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, "filename", "DESC", InputObject.filename)
+    assert e.value.status_code == 400
+
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("not-a-cursor", "filename", "DESC", InputObject.filename)
+    assert e.value.status_code == 400
+
+
+def test_paginate_first_page():
+    sql = compile_query(
+        paginate_by_cursor(
+            select(InputObject), InputObject, "time_added_utc", "DESC", "", 10
+        )
+    )
+
+    assert "WHERE" not in sql
+    assert (
+        "ORDER BY inputobject.time_added_utc DESC, inputobject.iterator DESC"
+        in sql
+    )
+    assert "LIMIT 11" in sql
+
+
+def test_paginate_after_cursor():
+    cursor = encode_cursor("time_added_utc", "DESC", ADDED, 42)
+    sql = compile_query(
+        paginate_by_cursor(
+            select(InputObject),
+            InputObject,
+            "time_added_utc",
+            "DESC",
+            cursor,
+            10,
+        )
+    )
+
+    assert (
+        "(inputobject.time_added_utc, inputobject.iterator) < "
+        "('2024-05-01 12:30:15.250000', 42)"
+    ) in sql
+
+
+def test_paginate_ascending_keeps_nulls_last():
+    cursor = encode_cursor("filename", "ASC", "b.mp4", 7)
+    sql = compile_query(
+        paginate_by_cursor(
+            select(InputObject), InputObject, "filename", "ASC", cursor, 10
+        )
+    )
+
+    assert "(inputobject.filename, inputobject.iterator) > ('b.mp4', 7)" in sql
+    assert "inputobject.filename IS NULL" in sql
+
+    cursor = encode_cursor("filename", "ASC", None, 7)
+    sql = compile_query(
+        paginate_by_cursor(
+            select(InputObject), InputObject, "filename", "ASC", cursor, 10
+        )
+    )
+
+    assert "inputobject.filename IS NULL AND inputobject.iterator > 7" in sql
+
+
+def test_next_cursor():
+    rows = [
+        SimpleNamespace(time_added_utc=ADDED, iterator=i) for i in range(3)
+    ]
+
+    response = Response()
+    assert next_cursor(rows, "time_added_utc", "DESC", 3, response) == rows
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+    response = Response()
+    assert next_cursor(rows, "time_added_utc", "DESC", 2, response) == rows[:2]
+    assert decode_cursor(
+        response.headers[NEXT_CURSOR_HEADER],
+        "time_added_utc",
+        "DESC",
+        InputObject.time_added_utc,
+    ) == (ADDED, 1)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+    def scalars(self):
+        return FakeResult([row[0] for row in self.rows])
+
+    def scalar_one(self):
+        return self.rows[0][0]
+
+
+class FakeSession:
+    """Returns canned rows and records the SQL of what it executes"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.executed = []
+
+    async def execute(self, query):
+        self.executed.append(compile_query(query))
+        return FakeResult(self.results.pop(0))
+
+
+COUNT_QUERY = select(func.count(InputObject.iterator))
+
+
+@pytest.mark.asyncio
+async def test_fetch_page_counts_in_the_same_query():
+    session = FakeSession([("a", 7), ("b", 7)])
+
+    rows, total_count = await fetch_page(
+        session, select(InputObject).limit(2), COUNT_QUERY
+    )
+
+    assert (rows, total_count) == (["a", "b"], 7)
+    assert len(session.executed) == 1
+    assert "count(*) OVER ()" in session.executed[0]
+
+
+@pytest.mark.asyncio
+async def test_fetch_page_counts_separately():
+    # An empty page has no row to carry the count
+    session = FakeSession([], [(7,)])
+    assert await fetch_page(
+        session, select(InputObject).offset(10), COUNT_QUERY
+    ) == ([], 7)
+    assert len(session.executed) == 2
+
+    # Nor can a page after a cursor count the rows before it
+    session = FakeSession([("a",)], [(7,)])
+    assert await fetch_page(
+        session, select(InputObject), COUNT_QUERY, window=False
+    ) == (["a"], 7)
+    assert "OVER" not in session.executed[0]
+
+
+@pytest.mark.asyncio
+async def test_fetch_page_caches_the_count(monkeypatch):
+    store = {}
+
+    async def get(key):
+        return store.get(key)
+
+    async def set(key, value, expire=None):
+        store[key] = value
+
+    monkeypatch.setattr(cache, "get", get)
+    monkeypatch.setattr(cache, "set", set)
+
+    # A miss is counted in the same query, and cached
+    session = FakeSession([("a", 7), ("b", 7)])
+    assert await fetch_page(
+        session, select(InputObject).limit(2), COUNT_QUERY, count_key="n"
+    ) == (["a", "b"], 7)
+    assert store == {"n": 7}
+
+    # and a hit is served from the cache, without counting
+    session = FakeSession([("a",), ("b",)])
+    assert await fetch_page(
+        session, select(InputObject).limit(2), COUNT_QUERY, count_key="n"
+    ) == (["a", "b"], 7)
+    assert len(session.executed) == 1
+    assert "OVER" not in session.executed[0]
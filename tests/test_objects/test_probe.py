@@ -0,0 +1,103 @@
+import pytest
+import struct
+from app.config import config
+from app.objects.probe import parse_moov, probe_s3_mp4, ProbeError
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, payload: bytes, version: int = 0) -> bytes:
+    return box(box_type, struct.pack(">I", version << 24) + payload)
+
+
+def make_moov(
+    frame_count: int = 300,
+    timescale: int = 15360,
+    sample_delta: int = 512,
+) -> bytes:
+    """Build a moov box with a single video track at timescale/delta fps"""
+
+    duration = frame_count * sample_delta
+    mdhd = full_box(
+        b"mdhd", struct.pack(">IIIIHH", 0, 0, timescale, duration, 0, 0)
+    )
+    hdlr = full_box(b"hdlr", struct.pack(">I4s12x", 0, b"vide") + b"\x00")
+    stts = full_box(
+        b"stts", struct.pack(">III", 1, frame_count, sample_delta)
+    )
+    stsz = full_box(b"stsz", struct.pack(">II", 1000, frame_count))
+    stbl = box(b"stbl", stts + stsz)
+    minf = box(b"minf", stbl)
+    mdia = box(b"mdia", mdhd + hdlr + minf)
+    trak = box(b"trak", mdia)
+    mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 10000))
+
+    return box(b"moov", mvhd + trak)
+
+
+class MockBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class MockRangedS3:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.bytes_read = 0
+
+    async def get_object(self, Bucket, Key, Range):
+        start, end = Range.replace("bytes=", "").split("-")
+        chunk = self.data[int(start) : int(end) + 1]
+        self.bytes_read += len(chunk)
+        return {
+            "Body": MockBody(chunk),
+            "ContentRange": f"bytes {start}-{end}/{len(self.data)}",
+        }
+
+
+def test_parse_moov_video_track():
+    moov = make_moov(frame_count=300, timescale=15360, sample_delta=512)
+
+    fps, frame_count, duration_seconds = parse_moov(moov[8:])
+
+    assert fps == 30.0
+    assert frame_count == 300
+    assert duration_seconds == 10.0
+
+
+@pytest.mark.asyncio
+async def test_probe_faststart_reads_only_head():
+    ftyp = box(b"ftyp", b"isom" + b"\x00" * 4)
+    mdat = box(b"mdat", b"\x00" * (4 * config.VIDEO_PROBE_HEAD_BYTES))
+    s3 = MockRangedS3(ftyp + make_moov() + mdat)
+
+    fps, frame_count, _ = await probe_s3_mp4(s3, "key")
+
+    assert (fps, frame_count) == (30.0, 300)
+    assert s3.bytes_read <= config.VIDEO_PROBE_HEAD_BYTES
+
+
+@pytest.mark.asyncio
+async def test_probe_moov_at_end_of_file():
+    ftyp = box(b"ftyp", b"isom" + b"\x00" * 4)
+    mdat = box(b"mdat", b"\x00" * (4 * config.VIDEO_PROBE_HEAD_BYTES))
+    moov = make_moov(frame_count=250, timescale=25, sample_delta=1)
+    s3 = MockRangedS3(ftyp + mdat + moov)
+
+    fps, frame_count, duration_seconds = await probe_s3_mp4(s3, "key")
+
+    assert (fps, frame_count, duration_seconds) == (25.0, 250, 10.0)
+    assert s3.bytes_read < config.VIDEO_PROBE_HEAD_BYTES + len(moov) + 64
+
+
+@pytest.mark.asyncio
+async def test_probe_rejects_non_mp4():
+    s3 = MockRangedS3(b"RIFF" + b"\x00" * 1024)
+
+    with pytest.raises(ProbeError):
+        await probe_s3_mp4(s3, "key")
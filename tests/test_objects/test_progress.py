@@ -0,0 +1,175 @@
+import datetime
+import pytest
+from uuid import uuid4
+from sqlmodel import select
+from app.objects.models import InputObject, InputObjectRead
+from app.objects.progress import (
+    PROGRESS_KEY_PREFIX,
+    cache,
+    flush_upload_progress,
+    merge_upload_progress,
+    record_upload_progress,
+)
+
+NOW = datetime.datetime(2024, 5, 1, 12, 0)
+
+
+@pytest.fixture
+def progress_cache(monkeypatch):
+    """In-memory stand-in for the Redis cache"""
+
+    store = {}
+
+    async def set(key, value, expire=None):
+        store[key] = value
+
+    async def get_many(*keys):
+        return tuple(store.get(key) for key in keys)
+
+    async def get_match(pattern):
+        for key, value in list(store.items()):
+            if key.startswith(pattern.rstrip("*")):
+                yield key, value
+
+    async def incr(key):
+        store[key] = store.get(key, 0) + 1
+
+    async def delete(key):
+        store.pop(key, None)
+
+    monkeypatch.setattr(cache, "is_enable", lambda *args: True)
+    monkeypatch.setattr(cache, "set", set)
+    monkeypatch.setattr(cache, "get_many", get_many)
+    monkeypatch.setattr(cache, "get_match", get_match)
+    monkeypatch.setattr(cache, "incr", incr)
+    monkeypatch.setattr(cache, "delete", delete)
+
+    return store
+
+
+def read_object(**values) -> InputObjectRead:
+    return InputObjectRead(
+        id=uuid4(), owner=uuid4(), time_added_utc=NOW, **values
+    )
+
+
+def progress(message: str, last_part_received_utc: datetime.datetime):
+    return {
+        "processing_message": message,
+        "last_part_received_utc": last_part_received_utc,
+    }
+
+
+@pytest.mark.asyncio
+async def test_record_progress_in_cache(progress_cache):
+    object_id = uuid4()
+
+    # No session is needed, nothing is written to the database
+    await record_upload_progress(None, object_id, 50, 200)
+
+    recorded = progress_cache[f"{PROGRESS_KEY_PREFIX}{object_id}"]
+    assert recorded["processing_message"] == "Upload progress: 25.00%"
+
+
+@pytest.mark.asyncio
+async def test_merge_unflushed_progress(progress_cache):
+    behind = read_object(
+        all_parts_received=False,
+        last_part_received_utc=NOW,
+        processing_message="Upload progress: 10.00%",
+    )
+    ahead = read_object(
+        all_parts_received=False,
+        last_part_received_utc=NOW + datetime.timedelta(minutes=1),
+        processing_message="Upload progress: 90.00%",
+    )
+    finished = read_object(
+        all_parts_received=True,
+        last_part_received_utc=NOW,
+        processing_message="Done",
+    )
+    for obj in (behind, ahead, finished):
+        progress_cache[f"{PROGRESS_KEY_PREFIX}{obj.id}"] = progress(
+            "Upload progress: 50.00%", NOW + datetime.timedelta(seconds=30)
+        )
+
+    await merge_upload_progress([behind, ahead, finished])
+
+    assert behind.processing_message == "Upload progress: 50.00%"
+    assert behind.last_part_received_utc == NOW + datetime.timedelta(
+        seconds=30
+    )
+    # Progress older than the database is not merged
+    assert ahead.processing_message == "Upload progress: 90.00%"
+    assert finished.processing_message == "Done"
+
+
+@pytest.mark.asyncio
+async def test_merge_without_cache(monkeypatch):
+    monkeypatch.setattr(cache, "is_enable", lambda *args: False)
+    obj = read_object(all_parts_received=False, processing_message="a")
+
+    assert await merge_upload_progress([obj]) == [obj]
+    assert obj.processing_message == "a"
+
+
+@pytest.mark.asyncio
+async def test_flush_upload_progress(modified_async_session, progress_cache):
+    owner = uuid4()
+    behind = InputObject(
+        owner=owner,
+        all_parts_received=False,
+        last_part_received_utc=NOW,
+        processing_message="Upload progress: 10.00%",
+    )
+    ahead = InputObject(
+        owner=owner,
+        all_parts_received=False,
+        last_part_received_utc=NOW + datetime.timedelta(minutes=1),
+        processing_message="Upload progress: 90.00%",
+    )
+    never = InputObject(owner=owner, all_parts_received=False)
+    finished = InputObject(
+        owner=owner,
+        all_parts_received=True,
+        last_part_received_utc=NOW,
+        processing_message="Video statistics generated successfully",
+    )
+    for obj in (behind, ahead, never, finished):
+        modified_async_session.add(obj)
+        progress_cache[f"{PROGRESS_KEY_PREFIX}{obj.id}"] = progress(
+            "Upload progress: 50.00%", NOW + datetime.timedelta(seconds=30)
+        )
+    await modified_async_session.commit()
+
+    await flush_upload_progress(session=modified_async_session, s3=None)
+
+    modified_async_session.expire_all()
+    res = await modified_async_session.exec(select(InputObject))
+    messages = {obj.id: obj.processing_message for obj in res.all()}
+
+    assert messages[behind.id] == "Upload progress: 50.00%"
+    assert messages[never.id] == "Upload progress: 50.00%"
+    # Progress only moves forward, and finished uploads keep their state
+    assert messages[ahead.id] == "Upload progress: 90.00%"
+    assert messages[finished.id] == "Video statistics generated successfully"
+
+
+@pytest.mark.asyncio
+async def test_record_progress_without_cache(
+    modified_async_session, monkeypatch
+):
+    monkeypatch.setattr(cache, "is_enable", lambda *args: False)
+    obj = InputObject(owner=uuid4(), all_parts_received=False)
+    modified_async_session.add(obj)
+    await modified_async_session.commit()
+
+    await record_upload_progress(modified_async_session, obj.id, 1, 4)
+
+    modified_async_session.expire_all()
+    res = await modified_async_session.exec(
+        select(InputObject).where(InputObject.id == obj.id)
+    )
+    obj = res.one()
+    assert obj.processing_message == "Upload progress: 25.00%"
+    assert obj.last_part_received_utc is not None
@@ -0,0 +1,61 @@
+import pytest
+from fastapi import Response
+from types import SimpleNamespace
+from app.objects.models import InputObject
+from app.transects.models import Transect
+from app.pagination import NEXT_CURSOR_HEADER
+from app.query_cache import query_key, result_headers, cache
+
+ADMIN = SimpleNamespace(is_admin=True, id="a")
+USER = SimpleNamespace(is_admin=False, id="u")
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    generations = {}
+
+    async def get_many(*keys):
+        return tuple(generations.get(key) for key in keys)
+
+    monkeypatch.setattr(cache, "is_enable", lambda *args: True)
+    monkeypatch.setattr(cache, "get_many", get_many)
+
+    return generations
+
+
+@pytest.mark.asyncio
+async def test_query_key(generations):
+    models = (InputObject, Transect)
+    key = await query_key("objects", models, USER, {"a": 1, "b": [2]})
+
+    assert key.startswith("query:objects:u:0.0:")
+    # Params are normalised
+    assert key == await query_key("objects", models, USER, {"b": [2], "a": 1})
+    assert key != await query_key("objects", models, USER, {"a": 2})
+    assert key != await query_key("objects", models, ADMIN, {"a": 1})
+
+    # A write to any of the models moves the key on
+    generations["generation:transect"] = 3
+    assert (await query_key("objects", models, USER, {})).startswith(
+        "query:objects:u:0.3:"
+    )
+
+
+@pytest.mark.asyncio
+async def test_query_key_without_cache(monkeypatch):
+    monkeypatch.setattr(cache, "is_enable", lambda *args: False)
+
+    assert await query_key("objects", (InputObject,), USER, {}) is None
+
+
+def test_result_headers():
+    response = Response()
+    response.headers["Content-Range"] = "objects 0-9/20"
+    response.headers["X-Other"] = "1"
+    assert result_headers(response) == {"Content-Range": "objects 0-9/20"}
+
+    response.headers[NEXT_CURSOR_HEADER] = "abc"
+    assert result_headers(response) == {
+        "Content-Range": "objects 0-9/20",
+        NEXT_CURSOR_HEADER: "abc",
+    }
@@ -0,0 +1,77 @@
+import datetime
+import json
+import pytest
+import uuid
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString
+from app.objects.models import InputObjectRead
+from app.responses import read_model_response
+from app.submissions.models import TransectRead as SubmissionTransectRead
+from app.transects.geometry import decode_wkb
+from app.transects.models import Transect, TransectRead
+
+
+def transect() -> Transect:
+    transect = Transect(
+        id=uuid.uuid4(),
+        name="Transect",
+        owner=uuid.uuid4(),
+        geom=from_shape(LineString([(6.5, 46.5), (6.6, 46.6)]), srid=4326),
+    )
+    transect.inputs = []
+    transect.submissions = []
+
+    return transect
+
+
+@pytest.mark.asyncio
+async def test_same_json_as_response_model():
+    models = [
+        InputObjectRead(
+            id=uuid.uuid4(),
+            owner=uuid.uuid4(),
+            filename="a.mp4",
+            time_added_utc=datetime.datetime(2024, 5, 1, 12, 30),
+            transect=transect(),
+        ),
+        InputObjectRead(
+            id=uuid.uuid4(),
+            owner=uuid.uuid4(),
+            time_added_utc=datetime.datetime(2024, 5, 2),
+        ),
+    ]
+    field = create_response_field(name="Response", type_=list[InputObjectRead])
+    expected = JSONResponse(
+        await serialize_response(field=field, response_content=models)
+    ).body
+
+    response = read_model_response(models, InputObjectRead)
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == json.loads(expected)
+    assert json.loads(response.body)[0]["transect"]["latitude_end"] == 46.6
+
+
+def test_single_model_and_headers():
+    response = Response()
+    response.headers["Content-Range"] = "transects 0-0/1"
+
+    read = TransectRead.model_validate(transect())
+    result = read_model_response(read, TransectRead, response)
+
+    assert json.loads(result.body)["longitude_start"] == 6.5
+    assert result.headers["Content-Range"] == "transects 0-0/1"
+    assert result.headers["content-length"] == str(len(result.body))
+
+
+def test_submission_transect_geometry_is_decoded_once():
+    decode_wkb.cache_clear()
+    reads = [SubmissionTransectRead.model_validate(transect()) for _ in "ab"]
+
+    assert decode_wkb.cache_info().misses == 1
+    assert reads[0].geom == reads[1].geom
+    assert (reads[1].latitude_start, reads[1].longitude_end) == (46.5, 6.6)
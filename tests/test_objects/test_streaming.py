@@ -0,0 +1,143 @@
+import pytest
+import datetime
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.objects.streaming import (
+    parse_range_header,
+    if_range_matches,
+    stream_s3_object,
+)
+
+LAST_MODIFIED = datetime.datetime(
+    2024, 5, 1, 12, 30, 15, 250000, tzinfo=datetime.timezone.utc
+)
+
+
+class MockBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def iter_chunks(self, chunk_size: int):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+class MockS3:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.ranges_requested = []
+
+    async def head_object(self, Bucket, Key):
+        return {
+            "ContentLength": len(self.data),
+            "ETag": '"abc"',
+            "LastModified": LAST_MODIFIED,
+        }
+
+    async def get_object(self, Bucket, Key, Range=None):
+        self.ranges_requested.append(Range)
+        if Range is None:
+            return {"Body": MockBody(self.data)}
+        start, end = Range.replace("bytes=", "").split("-")
+        return {"Body": MockBody(self.data[int(start) : int(end) + 1])}
+
+
+def make_request(headers: dict[str, str]) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "headers": [
+                (k.lower().encode(), v.encode()) for k, v in headers.items()
+            ],
+        }
+    )
+
+
+async def read_body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_parse_range_header():
+    assert parse_range_header(None, 100) is None
+    assert parse_range_header("bytes=0-9", 100) == [(0, 9)]
+    assert parse_range_header("bytes=90-", 100) == [(90, 99)]
+    assert parse_range_header("bytes=-10", 100) == [(90, 99)]
+    assert parse_range_header("bytes=95-200", 100) == [(95, 99)]
+    assert parse_range_header("bytes=0-9,5-19,50-59", 100) == [
+        (0, 19),
+        (50, 59),
+    ]
+
+    # Malformed or unsupported headers are ignored
+    assert parse_range_header("items=0-9", 100) is None
+    assert parse_range_header("bytes=9-0", 100) is None
+    assert parse_range_header("bytes=a-b", 100) is None
+
+    with pytest.raises(HTTPException) as e:
+        parse_range_header("bytes=100-", 100)
+    assert e.value.status_code == 416
+    assert e.value.headers["Content-Range"] == "bytes */100"
+
+
+def test_if_range_matches():
+    assert if_range_matches(None, '"abc"', LAST_MODIFIED)
+    assert if_range_matches('"abc"', '"abc"', LAST_MODIFIED)
+    assert not if_range_matches('"def"', '"abc"', LAST_MODIFIED)
+    assert not if_range_matches('W/"abc"', '"abc"', LAST_MODIFIED)
+    assert if_range_matches(
+        "Wed, 01 May 2024 12:30:15 GMT", '"abc"', LAST_MODIFIED
+    )
+    assert not if_range_matches(
+        "Wed, 01 May 2024 12:00:00 GMT", '"abc"', LAST_MODIFIED
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_single_range():
+    s3 = MockS3(bytes(range(100)))
+
+    response = await stream_s3_object(
+        s3, "key", make_request({"Range": "bytes=10-19"}), "file.bin"
+    )
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 10-19/100"
+    assert response.headers["Content-Length"] == "10"
+    assert await read_body(response) == bytes(range(10, 20))
+    assert s3.ranges_requested == ["bytes=10-19"]
+
+
+@pytest.mark.asyncio
+async def test_stream_ignores_range_if_range_differs():
+    s3 = MockS3(bytes(range(100)))
+
+    response = await stream_s3_object(
+        s3,
+        "key",
+        make_request({"Range": "bytes=10-19", "If-Range": '"other"'}),
+        "file.bin",
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert await read_body(response) == bytes(range(100))
+
+
+@pytest.mark.asyncio
+async def test_stream_multiple_ranges():
+    s3 = MockS3(bytes(range(100)))
+
+    response = await stream_s3_object(
+        s3, "key", make_request({"Range": "bytes=0-4,50-54"}), "file.bin"
+    )
+    body = await read_body(response)
+    boundary = response.headers["Content-Type"].split("boundary=")[1]
+
+    assert response.status_code == 206
+    assert int(response.headers["Content-Length"]) == len(body)
+    assert body.endswith(f"\r\n--{boundary}--\r\n".encode())
+    assert b"Content-Range: bytes 0-4/100\r\n\r\n" + bytes(range(5)) in body
+    assert (
+        b"Content-Range: bytes 50-54/100\r\n\r\n" + bytes(range(50, 55))
+    ) in body
@@ -0,0 +1,161 @@
+import datetime
+import pytest
+from uuid import uuid4
+from sqlmodel import select
+from app.config import config
+from app.objects.models import InputObject
+from app.objects.service import (
+    S3_DELETE_BATCH_SIZE,
+    delete_s3_keys,
+    upload_keys,
+)
+from app.objects.utils import sweep_incomplete_objects
+from app.status.models import StorageUsage
+from app.status.service import INPUTS_FOLDER, record_storage_usage
+
+
+class MockS3:
+    def __init__(self, errors: list[dict] | None = None):
+        self.aborted = []
+        self.deleted = []
+        self.errors = errors or []
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append((Key, UploadId))
+
+    async def delete_objects(self, Bucket, Delete):
+        self.deleted.append([obj["Key"] for obj in Delete["Objects"]])
+        assert Delete["Quiet"]
+        return {"Errors": self.errors}
+
+
+@pytest.mark.asyncio
+async def test_delete_s3_keys_in_batches():
+    s3 = MockS3(errors=[{"Key": "k0", "Code": "AccessDenied"}])
+    keys = [f"k{i}" for i in range(2 * S3_DELETE_BATCH_SIZE + 5)]
+
+    assert await delete_s3_keys(s3, keys) == len(keys)
+    assert [len(batch) for batch in s3.deleted] == [
+        S3_DELETE_BATCH_SIZE,
+        S3_DELETE_BATCH_SIZE,
+        5,
+    ]
+    assert sum(s3.deleted, []) == keys
+
+
+@pytest.mark.asyncio
+async def test_delete_s3_keys_without_keys():
+    s3 = MockS3()
+
+    assert await delete_s3_keys(s3, []) == 0
+    assert s3.deleted == []
+
+
+@pytest.mark.asyncio
+async def test_sweep_incomplete_objects(modified_async_session, monkeypatch):
+    monkeypatch.setattr(config, "INCOMPLETE_OBJECT_CONSIDER_ABANDONED", 60)
+    monkeypatch.setattr(config, "INCOMPLETE_OBJECT_TIMEOUT_SECONDS", 3600)
+
+    owner = uuid4()
+    now = datetime.datetime.now()
+    abandoned = InputObject(
+        owner=owner,
+        upload_id="multipart-1",
+        size_bytes=100,
+        all_parts_received=False,
+        last_part_received_utc=now - datetime.timedelta(hours=2),
+    )
+    stalled = InputObject(
+        owner=owner,
+        size_bytes=200,
+        all_parts_received=False,
+        last_part_received_utc=now - datetime.timedelta(minutes=5),
+        processing_message="Uploading...",
+    )
+    uploading = InputObject(
+        owner=owner,
+        size_bytes=300,
+        all_parts_received=False,
+        last_part_received_utc=now,
+        processing_message="Uploading...",
+    )
+    complete = InputObject(
+        owner=owner,
+        size_bytes=400,
+        all_parts_received=True,
+        last_part_received_utc=now - datetime.timedelta(hours=2),
+        processing_message="Done",
+    )
+    objects = [abandoned, stalled, uploading, complete]
+    for obj in objects:
+        modified_async_session.add(obj)
+    await record_storage_usage(
+        modified_async_session, INPUTS_FOLDER, owner, 4, 1000
+    )
+    await modified_async_session.commit()
+
+    s3 = MockS3()
+    await sweep_incomplete_objects(s3=s3, session=modified_async_session)
+
+    # The abandoned upload is aborted, and its keys and row deleted
+    assert s3.aborted == [(upload_keys(abandoned.id)[0], "multipart-1")]
+    assert s3.deleted == [upload_keys(abandoned.id)]
+
+    modified_async_session.expire_all()
+    res = await modified_async_session.exec(select(InputObject))
+    remaining = {obj.id: obj for obj in res.all()}
+    assert set(remaining) == {stalled.id, uploading.id, complete.id}
+
+    # Only the stalled upload has its message updated
+    message = remaining[stalled.id].processing_message
+    assert message.startswith("Uploading... Last part received ")
+    assert message.endswith(" seconds ago. ")
+    assert remaining[uploading.id].processing_message == "Uploading..."
+    assert remaining[complete.id].processing_message == "Done"
+
+    # and the usage reserved by the abandoned upload is released
+    res = await modified_async_session.exec(
+        select(StorageUsage).where(StorageUsage.owner == owner)
+    )
+    usage = res.one()
+    assert (usage.object_count, usage.size_bytes) == (3, 900)
+
+
+@pytest.mark.asyncio
+async def test_sweep_without_incomplete_objects(modified_async_session):
+    s3 = MockS3()
+    await sweep_incomplete_objects(s3=s3, session=modified_async_session)
+
+    assert s3.aborted == []
+    assert s3.deleted == []
+
+
+@pytest.mark.asyncio
+async def test_sweep_skips_tombstoned_objects(
+    modified_async_session, monkeypatch
+):
+    monkeypatch.setattr(config, "INCOMPLETE_OBJECT_CONSIDER_ABANDONED", 60)
+    monkeypatch.setattr(config, "INCOMPLETE_OBJECT_TIMEOUT_SECONDS", 3600)
+
+    now = datetime.datetime.now()
+    tombstoned = InputObject(
+        owner=uuid4(),
+        upload_id="multipart-1",
+        size_bytes=100,
+        all_parts_received=False,
+        last_part_received_utc=now - datetime.timedelta(hours=2),
+        processing_message="Uploading...",
+        deleted_utc=now,
+    )
+    modified_async_session.add(tombstoned)
+    await modified_async_session.commit()
+
+    s3 = MockS3()
+    await sweep_incomplete_objects(s3=s3, session=modified_async_session)
+
+    # Left to its cascade_delete task, which also releases its usage
+    assert s3.aborted == []
+    assert s3.deleted == []
+    modified_async_session.expire_all()
+    res = await modified_async_session.exec(select(InputObject))
+    assert res.one().processing_message == "Uploading..."
@@ -0,0 +1,33 @@
+import pytest
+import datetime
+import io
+import zipfile
+from app.objects.zipstream import stream_zip
+
+
+async def iter_chunks(data: bytes, chunk_size: int = 7):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+@pytest.mark.asyncio
+async def test_stream_zip_is_readable():
+    files = {
+        "model.ply": bytes(range(256)) * 100,
+        "nested/percentage_covers.json": b'{"coral": 0.5}',
+        "empty.txt": b"",
+    }
+    modified = datetime.datetime(2024, 5, 1, 12, 30, 14)
+
+    async def entries():
+        for name, data in files.items():
+            yield name, modified, iter_chunks(data)
+
+    archive = b"".join([chunk async for chunk in stream_zip(entries())])
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(files)
+        for name, data in files.items():
+            assert zf.read(name) == data
+        assert zf.getinfo("model.ply").date_time == (2024, 5, 1, 12, 30, 14)
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import pytest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import app.processing as processing
+from app.config import config
+from app.processing import run_in_process, shutdown_process_pool
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    """A fresh pool and bound for each test, shut down after it"""
+
+    monkeypatch.setattr(processing, "_executor", None)
+    monkeypatch.setattr(processing, "_slots", None)
+    yield
+    shutdown_process_pool()
+
+
+@pytest.mark.asyncio
+async def test_work_runs_off_the_loop(process_pool):
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    # Start the pool first, so that spawning it is not measured
+    assert await run_in_process(os.getpid) != os.getpid()
+
+    ticker = asyncio.create_task(tick())
+    try:
+        await run_in_process(time.sleep, 0.5)
+    finally:
+        ticker.cancel()
+
+    # The loop kept running while the work slept in another process
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_jobs_in_the_pool_are_bounded(process_pool, monkeypatch):
+    monkeypatch.setattr(config, "PROCESS_POOL_MAX_WORKERS", 1)
+    monkeypatch.setattr(config, "PROCESS_POOL_MAX_QUEUE", 2)
+    # Threads stand in for processes, to count the jobs submitted at once
+    pool = ThreadPoolExecutor(max_workers=10)
+    monkeypatch.setattr(processing, "get_process_pool", lambda: pool)
+
+    lock = threading.Lock()
+    release = threading.Event()
+    submitted = peak = 0
+
+    def job():
+        nonlocal submitted, peak
+        with lock:
+            submitted += 1
+            peak = max(peak, submitted)
+        release.wait(5)
+        with lock:
+            submitted -= 1
+
+    jobs = [asyncio.create_task(run_in_process(job)) for _ in range(6)]
+    await asyncio.sleep(0.2)
+    assert submitted == 3
+
+    release.set()
+    await asyncio.gather(*jobs)
+    pool.shutdown()
+
+    assert peak == 3
@@ -0,0 +1,49 @@
+from sqlalchemy.dialects import postgresql
+from types import SimpleNamespace
+from app.search.models import SearchResultType
+from app.matching import like_pattern
+from app.search.views import search_query
+from app.submissions.models import Submission
+
+
+def compile_query(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect()))
+
+
+def test_like_pattern_escapes_wildcards():
+    assert like_pattern("reef") == "%reef%"
+    assert like_pattern("100%_a\\b") == "%100\\%\\_a\\\\b%"
+
+
+def test_search_query():
+    columns = [Submission.name, Submission.description]
+    admin = SimpleNamespace(is_admin=True, id="x")
+    user = SimpleNamespace(is_admin=False, id="x")
+
+    sql = compile_query(
+        search_query(
+            Submission,
+            SearchResultType.SUBMISSION,
+            Submission.time_added_utc,
+            columns,
+            "reef",
+            admin,
+        )
+    )
+    assert "submission.name ILIKE %(name_1)s" in sql
+    assert "submission.description ILIKE %(description_1)s" in sql
+    assert "similarity(coalesce(submission.name" in sql
+    assert "submission.deleted_utc IS NULL" in sql
+    assert "submission.owner" not in sql.split("WHERE")[1]
+
+    sql = compile_query(
+        search_query(
+            Submission,
+            SearchResultType.SUBMISSION,
+            Submission.time_added_utc,
+            columns,
+            "reef",
+            user,
+        )
+    )
+    assert "submission.owner = %(owner_1)s" in sql
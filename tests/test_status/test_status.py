@@ -0,0 +1,37 @@
+import pytest
+from types import SimpleNamespace
+import app.status.views as views
+from app.status.models import S3Status
+
+USAGE = S3Status(total_object_count=3, total_size=300)
+
+
+@pytest.fixture(autouse=True)
+def status(monkeypatch):
+    async def get_kubernetes_status(session):
+        return ["job"], True
+
+    async def get_s3_status(session, owner=None):
+        assert owner is None
+        return USAGE, True
+
+    monkeypatch.setattr(views, "get_kubernetes_status", get_kubernetes_status)
+    monkeypatch.setattr(views, "get_s3_status", get_s3_status)
+
+
+@pytest.mark.asyncio
+async def test_admins_see_bucket_usage_and_jobs():
+    status = await views.get_jobs(SimpleNamespace(is_admin=True), None)
+
+    assert status.s3_local == USAGE
+    assert status.kubernetes == ["job"]
+    assert status.s3_status
+
+
+@pytest.mark.asyncio
+async def test_users_see_availability_only():
+    status = await views.get_jobs(SimpleNamespace(is_admin=False), None)
+
+    assert status.s3_local == S3Status()
+    assert status.kubernetes == []
+    assert status.s3_status and status.kubernetes_status
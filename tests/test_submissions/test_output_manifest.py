@@ -0,0 +1,164 @@
+import datetime
+import pytest
+from uuid import uuid4
+from sqlmodel import select
+from app.config import config
+from app.status.models import StorageUsage
+from app.status.service import OUTPUTS_FOLDER
+from app.submissions.models import Submission
+from app.submissions.outputs.models import SubmissionOutput
+from app.submissions.status.models import RunStatus
+from app.submissions.utils import get_output_manifest, refresh_output_manifest
+
+NOW = datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+class MockPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    async def paginate(self, Bucket, Prefix):
+        self.s3.listings += 1
+        keys = sorted(key for key in self.s3.objects if key.startswith(Prefix))
+        # One object per page, to list across pages
+        for key in keys:
+            yield {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "Size": self.s3.objects[key],
+                        "ETag": '"etag"',
+                        "LastModified": NOW,
+                    }
+                ]
+            }
+
+
+class MockS3:
+    def __init__(self, objects: dict[str, int] | None = None):
+        self.objects = objects or {}
+        self.listings = 0
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return MockPaginator(self)
+
+
+def output_key(submission: Submission, filename: str) -> str:
+    return f"{config.S3_PREFIX}/outputs/{submission.id}/{filename}"
+
+
+async def create_submission(session, successful: bool = True) -> Submission:
+    submission = Submission(owner=uuid4(), name="Run")
+    session.add(submission)
+    session.add(
+        RunStatus(submission_id=submission.id, is_successful=successful)
+    )
+    await session.commit()
+
+    return submission
+
+
+async def get_usage(session, owner) -> tuple[int, int]:
+    res = await session.exec(
+        select(StorageUsage).where(
+            StorageUsage.folder == OUTPUTS_FOLDER,
+            StorageUsage.owner == owner,
+        )
+    )
+    usage = res.one()
+    return usage.object_count, usage.size_bytes
+
+
+@pytest.mark.asyncio
+async def test_refresh_records_usage_delta(modified_async_session):
+    submission = await create_submission(modified_async_session)
+    s3 = MockS3(
+        {
+            output_key(submission, "a.csv"): 100,
+            output_key(submission, "b.png"): 200,
+        }
+    )
+
+    outputs = await refresh_output_manifest(
+        submission.id, submission.owner, modified_async_session, s3
+    )
+
+    assert [(o.filename, o.size_bytes) for o in outputs] == [
+        ("a.csv", 100),
+        ("b.png", 200),
+    ]
+    assert outputs[0].content_type == "text/csv"
+    assert outputs[0].last_modified == NOW.replace(tzinfo=None)
+    assert await get_usage(modified_async_session, submission.owner) == (
+        2,
+        300,
+    )
+
+    # Only the difference with the previous manifest is recorded
+    del s3.objects[output_key(submission, "b.png")]
+    s3.objects[output_key(submission, "a.csv")] = 50
+    await refresh_output_manifest(
+        submission.id, submission.owner, modified_async_session, s3
+    )
+
+    modified_async_session.expire_all()
+    res = await modified_async_session.exec(select(SubmissionOutput))
+    assert [(o.filename, o.size_bytes) for o in res.all()] == [("a.csv", 50)]
+    assert await get_usage(modified_async_session, submission.owner) == (
+        1,
+        50,
+    )
+
+
+@pytest.mark.asyncio
+async def test_manifest_is_listed_once(modified_async_session):
+    submission = await create_submission(modified_async_session)
+    s3 = MockS3()
+
+    # A successful run without outputs is listed the first time only
+    for _ in range(2):
+        assert (
+            await get_output_manifest(submission, modified_async_session, s3)
+            == []
+        )
+        modified_async_session.expire_all()
+        res = await modified_async_session.exec(
+            select(Submission).where(Submission.id == submission.id)
+        )
+        submission = res.one()
+
+    assert s3.listings == 1
+    assert submission.outputs_listed_utc is not None
+
+
+@pytest.mark.asyncio
+async def test_manifest_is_read_from_the_database(modified_async_session):
+    submission = await create_submission(modified_async_session)
+    s3 = MockS3(
+        {
+            output_key(submission, "b.png"): 2,
+            output_key(submission, "a.csv"): 1,
+        }
+    )
+    await refresh_output_manifest(
+        submission.id, submission.owner, modified_async_session, s3
+    )
+
+    outputs = await get_output_manifest(submission, modified_async_session, s3)
+
+    assert [output.filename for output in outputs] == ["a.csv", "b.png"]
+    assert s3.listings == 1
+
+
+@pytest.mark.asyncio
+async def test_manifest_of_unfinished_run(modified_async_session):
+    submission = await create_submission(
+        modified_async_session, successful=False
+    )
+    s3 = MockS3({output_key(submission, "a.csv"): 1})
+
+    assert (
+        await get_output_manifest(submission, modified_async_session, s3) == []
+    )
+    assert s3.listings == 0
@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+from app.submissions.outputs.pointcloud import (
+    read_ply,
+    voxel_downsample,
+    encode_point_cloud,
+    decode_point_cloud,
+    build_levels,
+    point_count,
+    PointCloudError,
+)
+
+
+def write_binary_ply(path, positions, colours, extra_element=False) -> str:
+    header = ["ply", "format binary_little_endian 1.0"]
+    if extra_element:
+        header += ["element camera 2", "property float focal"]
+    header += [
+        f"element vertex {len(positions)}",
+        "property float x",
+        "property float y",
+        "property float z",
+        "property uchar red",
+        "property uchar green",
+        "property uchar blue",
+        "element face 0",
+        "property list uchar int vertex_indices",
+        "end_header",
+    ]
+    vertices = np.zeros(
+        len(positions),
+        dtype=[
+            ("x", "<f4"),
+            ("y", "<f4"),
+            ("z", "<f4"),
+            ("red", "u1"),
+            ("green", "u1"),
+            ("blue", "u1"),
+        ],
+    )
+    vertices["x"], vertices["y"], vertices["z"] = positions.T
+    vertices["red"], vertices["green"], vertices["blue"] = colours.T
+
+    filename = str(path / "cloud.ply")
+    with open(filename, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode())
+        if extra_element:
+            f.write(np.array([1.5, 2.5], dtype="<f4").tobytes())
+        f.write(vertices.tobytes())
+
+    return filename
+
+
+def random_cloud(count: int = 5000) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-10, 10, size=(count, 3)).astype(np.float32)
+    colours = rng.integers(0, 256, size=(count, 3)).astype(np.uint8)
+
+    return positions, colours
+
+
+@pytest.mark.parametrize("extra_element", [False, True])
+def test_read_binary_ply(tmp_path, extra_element):
+    positions, colours = random_cloud(100)
+    filename = write_binary_ply(tmp_path, positions, colours, extra_element)
+
+    read_positions, read_colours = read_ply(filename)
+
+    np.testing.assert_allclose(read_positions, positions)
+    np.testing.assert_array_equal(read_colours, colours)
+
+
+def test_read_ascii_ply(tmp_path):
+    filename = tmp_path / "cloud.ply"
+    filename.write_text(
+        "ply\nformat ascii 1.0\ncomment made by hand\n"
+        "element vertex 2\nproperty float x\nproperty float y\n"
+        "property float z\nend_header\n0 1 2\n3 4 5\n"
+    )
+
+    positions, colours = read_ply(str(filename))
+
+    np.testing.assert_allclose(positions, [[0, 1, 2], [3, 4, 5]])
+    assert colours is None
+
+
+def test_read_ply_errors(tmp_path):
+    filename = tmp_path / "cloud.ply"
+    filename.write_bytes(b"not a ply\n")
+    with pytest.raises(PointCloudError):
+        read_ply(str(filename))
+
+    filename.write_bytes(
+        b"ply\nformat binary_little_endian 1.0\nelement vertex 10\n"
+        b"property float x\nproperty float y\nproperty float z\n"
+        b"end_header\n" + bytes(12)
+    )
+    with pytest.raises(PointCloudError, match="truncated"):
+        read_ply(str(filename))
+
+
+def test_voxel_downsample_merges_into_weighted_centroids():
+    positions = np.array([[0.1, 0.1, 0.1], [0.3, 0.3, 0.3], [1.5, 0.5, 0.5]])
+    colours = np.array([[0, 0, 0], [100, 100, 100], [255, 0, 0]], np.uint8)
+    weights = np.array([1.0, 3.0, 2.0])
+
+    merged, merged_colours, merged_weights = voxel_downsample(
+        positions, colours, weights, np.zeros(3), 1.0
+    )
+
+    np.testing.assert_allclose(merged, [[0.25, 0.25, 0.25], [1.5, 0.5, 0.5]])
+    np.testing.assert_array_equal(merged_colours, [[75] * 3, [255, 0, 0]])
+    np.testing.assert_array_equal(merged_weights, [4, 2])
+
+
+def test_encode_round_trip():
+    positions, colours = random_cloud(100)
+    positions = positions.astype(np.float64)
+    bounds_min, bounds_max = positions.min(axis=0), positions.max(axis=0)
+
+    data = encode_point_cloud(positions, colours, bounds_min, bounds_max)
+    decoded, decoded_colours = decode_point_cloud(data)
+
+    assert point_count(data) == 100
+    assert len(data) == 36 + 100 * 9
+    np.testing.assert_allclose(decoded, positions, atol=20 / 65535)
+    np.testing.assert_array_equal(decoded_colours, colours)
+
+
+def test_build_levels(tmp_path):
+    positions, colours = random_cloud()
+    filename = write_binary_ply(tmp_path, positions, colours)
+
+    levels = build_levels(filename, 4, 2)
+    counts = [point_count(level) for level in levels]
+
+    # 2, 4, 8 and 16 cells along each axis of a uniformly filled cube
+    assert counts[:3] == [8, 64, 512]
+    assert counts[2] < counts[3] <= len(positions)
+
+    # Levels are nested, so every level has the centroid of all the points
+    for level in levels:
+        decoded, _ = decode_point_cloud(level)
+        assert len(decoded)
+    coarsest, _ = decode_point_cloud(levels[0])
+    np.testing.assert_allclose(
+        coarsest.mean(axis=0), positions.mean(axis=0), atol=1
+    )
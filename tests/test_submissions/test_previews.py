@@ -0,0 +1,237 @@
+import cv2
+import datetime
+import json
+import numpy as np
+import pytest
+import shutil
+from botocore.exceptions import ClientError
+from uuid import uuid4
+import app.submissions.utils as utils
+from app.submissions.models import Submission
+from app.submissions.outputs.models import SubmissionOutput
+from app.submissions.outputs.pointcloud import PointCloudError
+from app.submissions.outputs.tiles import TileError
+from app.submissions.utils import (
+    build_point_cloud_levels,
+    build_tile_pyramid,
+    get_point_cloud_levels,
+    get_tile_pyramid,
+    preview_cache_prefix,
+)
+from tests.test_submissions.test_pointcloud import (
+    random_cloud,
+    write_binary_ply,
+)
+
+NOW = datetime.datetime(2024, 5, 1, 12, 0)
+
+
+class MockBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class MockS3:
+    def __init__(self):
+        self.objects = {}
+
+    async def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": MockBody(self.objects[Key])}
+
+    async def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+
+
+@pytest.fixture
+def scratch(monkeypatch, tmp_path):
+    """Downloads copy a local file, and builds run in this process"""
+
+    sources = {}
+
+    async def download_to_scratch(s3, key, suffix=""):
+        filename = str(tmp_path / f"download{suffix}")
+        shutil.copy(sources[key], filename)
+        return filename
+
+    async def run_in_process(func, *args):
+        return func(*args)
+
+    monkeypatch.setattr(utils.config, "SCRATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(utils, "download_to_scratch", download_to_scratch)
+    monkeypatch.setattr(utils, "run_in_process", run_in_process)
+
+    return sources
+
+
+def output(filename: str, etag: str = '"v1"') -> SubmissionOutput:
+    return SubmissionOutput(
+        id=uuid4(),
+        submission_id=uuid4(),
+        key=f"outputs/{filename}",
+        filename=filename,
+        size_bytes=1,
+        etag=etag,
+        last_modified=NOW,
+    )
+
+
+async def create_output(session, filename: str) -> SubmissionOutput:
+    submission = Submission(owner=uuid4(), name="Run")
+    session.add(submission)
+    await session.flush()
+    cloud = output(filename)
+    cloud.submission_id = submission.id
+    session.add(cloud)
+    await session.commit()
+
+    return cloud
+
+
+@pytest.mark.asyncio
+async def test_point_cloud_levels_from_index():
+    s3 = MockS3()
+    cloud = output("cloud.ply")
+    prefix = preview_cache_prefix(cloud)
+
+    # Not built yet
+    assert await get_point_cloud_levels(cloud, s3) is None
+
+    s3.objects[f"{prefix}/index.json"] = b'{"point_counts": [8, 64]}'
+    assert await get_point_cloud_levels(cloud, s3) == [8, 64]
+
+    # Another version of the output has its own levels
+    assert await get_point_cloud_levels(output("cloud.ply", '"v2"'), s3) is (
+        None
+    )
+
+    s3.objects[f"{prefix}/index.json"] = b'{"error": "Not a PLY file"}'
+    with pytest.raises(PointCloudError, match="Not a PLY file"):
+        await get_point_cloud_levels(cloud, s3)
+
+
+@pytest.mark.asyncio
+async def test_build_point_cloud_levels(
+    modified_async_session, scratch, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(utils.config, "POINT_CLOUD_LOD_LEVELS", 3)
+    monkeypatch.setattr(utils.config, "POINT_CLOUD_BASE_GRID_CELLS", 2)
+    cloud = await create_output(modified_async_session, "cloud.ply")
+    positions, colours = random_cloud()
+    scratch[cloud.key] = write_binary_ply(tmp_path, positions, colours)
+    s3 = MockS3()
+    prefix = preview_cache_prefix(cloud)
+
+    await build_point_cloud_levels(
+        str(cloud.id), prefix, session=modified_async_session, s3=s3
+    )
+
+    assert sorted(s3.objects) == [
+        f"{prefix}/0.bin",
+        f"{prefix}/1.bin",
+        f"{prefix}/2.bin",
+        f"{prefix}/index.json",
+    ]
+    assert await get_point_cloud_levels(cloud, s3) == [8, 64, 512]
+
+    # Built once, and skipped by tasks queued for a previous version
+    s3.objects.clear()
+    await build_point_cloud_levels(
+        str(cloud.id), f"{prefix}-old", session=modified_async_session, s3=s3
+    )
+    assert s3.objects == {}
+
+
+@pytest.mark.asyncio
+async def test_build_point_cloud_levels_records_errors(
+    modified_async_session, scratch, tmp_path
+):
+    cloud = await create_output(modified_async_session, "cloud.ply")
+    scratch[cloud.key] = str(tmp_path / "invalid.ply")
+    with open(scratch[cloud.key], "wb") as f:
+        f.write(b"not a point cloud")
+    s3 = MockS3()
+
+    await build_point_cloud_levels(
+        str(cloud.id),
+        preview_cache_prefix(cloud),
+        session=modified_async_session,
+        s3=s3,
+    )
+
+    (index,) = s3.objects.values()
+    assert "error" in json.loads(index)
+    with pytest.raises(PointCloudError):
+        await get_point_cloud_levels(cloud, s3)
+
+
+@pytest.mark.asyncio
+async def test_tile_pyramid_from_index():
+    s3 = MockS3()
+    raster = output("map.png")
+    prefix = preview_cache_prefix(raster)
+
+    assert await get_tile_pyramid(raster, s3) is None
+
+    s3.objects[f"{prefix}/tiles.json"] = b'{"width": 1, "max_zoom": 0}'
+    assert await get_tile_pyramid(raster, s3) == {"width": 1, "max_zoom": 0}
+
+    s3.objects[f"{prefix}/tiles.json"] = b'{"error": "Not a raster"}'
+    with pytest.raises(TileError, match="Not a raster"):
+        await get_tile_pyramid(raster, s3)
+
+
+@pytest.mark.asyncio
+async def test_build_tile_pyramid(modified_async_session, scratch, tmp_path):
+    raster = await create_output(modified_async_session, "map.png")
+    scratch[raster.key] = str(tmp_path / "map.png")
+    cv2.imwrite(scratch[raster.key], np.zeros((300, 600, 3), np.uint8))
+    s3 = MockS3()
+    prefix = preview_cache_prefix(raster)
+
+    await build_tile_pyramid(
+        str(raster.id), prefix, session=modified_async_session, s3=s3
+    )
+
+    assert await get_tile_pyramid(raster, s3) == {
+        "width": 600,
+        "height": 300,
+        "tile_size": 256,
+        "max_zoom": 2,
+    }
+    assert f"{prefix}/tiles/2/2/1.png" in s3.objects
+    assert len(s3.objects) == 9 + 1
+
+    # Built once
+    s3.objects = {f"{prefix}/tiles.json": s3.objects[f"{prefix}/tiles.json"]}
+    await build_tile_pyramid(
+        str(raster.id), prefix, session=modified_async_session, s3=s3
+    )
+    assert len(s3.objects) == 1
+
+
+@pytest.mark.asyncio
+async def test_build_tile_pyramid_records_errors(
+    modified_async_session, scratch, tmp_path
+):
+    raster = await create_output(modified_async_session, "map.png")
+    scratch[raster.key] = str(tmp_path / "invalid.png")
+    with open(scratch[raster.key], "wb") as f:
+        f.write(b"not an image")
+    s3 = MockS3()
+
+    await build_tile_pyramid(
+        str(raster.id),
+        preview_cache_prefix(raster),
+        session=modified_async_session,
+        s3=s3,
+    )
+
+    (index,) = s3.objects.values()
+    assert "error" in json.loads(index)
+    with pytest.raises(TileError):
+        await get_tile_pyramid(raster, s3)
@@ -0,0 +1,111 @@
+import pytest
+from types import SimpleNamespace
+from uuid import uuid4
+from sqlmodel import select
+import app.submissions.utils as utils
+from app.submissions.models import Submission
+from app.submissions.status.models import RunStatus
+from app.tasks.models import Task
+
+JOB_ID = "deepreef-job"
+
+
+@pytest.fixture
+def job(monkeypatch):
+    """The Kubernetes job of the run, and the events published about it"""
+
+    job = SimpleNamespace(
+        job_id=f"{JOB_ID}-0-0", status="Running", time_started=None
+    )
+    published = []
+
+    async def get_submission_job_by_name(submission_id, job_id):
+        return job
+
+    async def get_cached_job_log(pod_name):
+        return "log"
+
+    async def publish_event(type, id, owner, **data):
+        published.append(data)
+
+    monkeypatch.setattr(
+        utils, "get_submission_job_by_name", get_submission_job_by_name
+    )
+    monkeypatch.setattr(utils, "get_cached_job_log", get_cached_job_log)
+    monkeypatch.setattr(utils, "publish_event", publish_event)
+    job.published = published
+
+    return job
+
+
+async def create_run(session, **values) -> Submission:
+    submission = Submission(owner=uuid4(), name="Run")
+    session.add(submission)
+    session.add(
+        RunStatus(
+            submission_id=submission.id,
+            kubernetes_pod_name=JOB_ID,
+            **values,
+        )
+    )
+    await session.commit()
+
+    return submission
+
+
+@pytest.mark.asyncio
+async def test_running_job_publishes_changes_only(modified_async_session, job):
+    submission = await create_run(
+        modified_async_session, status="Pending", is_running=True
+    )
+
+    for _ in range(3):
+        await utils.check_submission_status(
+            submission.id, JOB_ID, modified_async_session, None
+        )
+
+    # Published once, when the job started running, and not for each poll
+    assert [event["status"] for event in job.published] == ["Running"]
+
+    # Each poll queues the next one
+    res = await modified_async_session.exec(
+        select(Task).where(Task.name == "check_submission_status")
+    )
+    assert len(res.all()) == 3
+
+
+@pytest.mark.asyncio
+async def test_succeeded_job_records_outputs_once(
+    modified_async_session, job, monkeypatch
+):
+    refreshed = []
+
+    async def refresh_output_manifest(submission_id, owner, session, s3):
+        refreshed.append(submission_id)
+        return []
+
+    async def populate_percentage_covers(submission_id, session, s3):
+        pass
+
+    monkeypatch.setattr(
+        utils, "refresh_output_manifest", refresh_output_manifest
+    )
+    monkeypatch.setattr(
+        utils, "populate_percentage_covers", populate_percentage_covers
+    )
+    job.status = "Succeeded"
+    submission = await create_run(
+        modified_async_session, status="Running", is_running=True
+    )
+
+    # eg. the task retried after the run was recorded as successful
+    for _ in range(2):
+        await utils.check_submission_status(
+            submission.id, JOB_ID, modified_async_session, None
+        )
+
+    assert refreshed == [submission.id]
+    res = await modified_async_session.exec(select(RunStatus))
+    run_status = res.one()
+    assert run_status.is_successful
+    assert not run_status.is_running
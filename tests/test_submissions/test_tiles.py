@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+import os
+import pytest
+from app.submissions.outputs.tiles import build_pyramid, max_zoom, TileError
+
+
+def test_max_zoom():
+    assert max_zoom(100, 50, 256) == 0
+    assert max_zoom(256, 256, 256) == 0
+    assert max_zoom(257, 10, 256) == 1
+    assert max_zoom(600, 300, 256) == 2
+    assert max_zoom(10, 5000, 256) == 5
+
+
+def test_build_pyramid(tmp_path):
+    image = np.zeros((300, 600, 3), dtype=np.uint8)
+    image[:, :300] = (255, 0, 0)
+    cv2.imwrite(str(tmp_path / "map.png"), image)
+    directory = tmp_path / "tiles"
+
+    width, height, zoom = build_pyramid(
+        str(tmp_path / "map.png"), str(directory), 256
+    )
+
+    assert (width, height, zoom) == (600, 300, 2)
+    tiles = {
+        os.path.relpath(os.path.join(root, name), directory)
+        for root, _, names in os.walk(directory)
+        for name in names
+    }
+    assert tiles == {
+        "0/0/0.png",
+        "1/0/0.png",
+        "1/1/0.png",
+        "2/0/0.png",
+        "2/0/1.png",
+        "2/1/0.png",
+        "2/1/1.png",
+        "2/2/0.png",
+        "2/2/1.png",
+    }
+
+    # Edge tiles are padded with transparency to the full tile size
+    tile = cv2.imread(str(directory / "2/2/1.png"), cv2.IMREAD_UNCHANGED)
+    assert tile.shape == (256, 256, 4)
+    assert tile[0, 0, 3] == 255
+    assert tile[100, 100, 3] == 0
+
+    # The whole raster fits in the tile at zoom 0
+    tile = cv2.imread(str(directory / "0/0/0.png"), cv2.IMREAD_UNCHANGED)
+    assert tuple(tile[0, 0]) == (255, 0, 0, 255)
+    assert tuple(tile[0, 140]) == (0, 0, 0, 255)
+    assert tile[80, 0, 3] == 0
+
+
+def test_build_pyramid_rejects_other_files(tmp_path):
+    (tmp_path / "map.png").write_bytes(b"not an image")
+
+    with pytest.raises(TileError):
+        build_pyramid(str(tmp_path / "map.png"), str(tmp_path / "tiles"), 256)
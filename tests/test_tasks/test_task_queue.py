@@ -0,0 +1,320 @@
+import asyncio
+import contextlib
+import datetime
+import pytest
+from sqlalchemy.sql import text
+from sqlmodel import select
+from app.config import config
+from app.db import async_session, engine
+from app.tasks.models import PeriodicRun, Task, TaskStatus
+from app.tasks.service import (
+    PERIODIC_TASKS,
+    TASK_HANDLERS,
+    claim_task,
+    enqueue,
+    enqueue_unique,
+    prune_finished_tasks,
+    requeue_stale_tasks,
+    retry_delay_seconds,
+    run_periodic,
+    run_task,
+)
+from app.worker import work
+
+
+async def get_task(session, task_id) -> Task:
+    session.expire_all()
+    res = await session.exec(select(Task).where(Task.id == task_id))
+    return res.one()
+
+
+@pytest.mark.asyncio
+async def test_claim_oldest_due_task(modified_async_session):
+    later = await enqueue(modified_async_session, "t", delay_seconds=60)
+    first = await enqueue(modified_async_session, "t", {"n": 1})
+    second = await enqueue(modified_async_session, "t", {"n": 2})
+
+    claimed = await claim_task(modified_async_session, "worker-1")
+    assert claimed.id == first.id
+    assert claimed.status == TaskStatus.RUNNING
+    assert claimed.attempts == 1
+    assert claimed.locked_by == "worker-1"
+
+    claimed = await claim_task(modified_async_session, "worker-1")
+    assert claimed.id == second.id
+
+    # The delayed task is not due yet
+    assert await claim_task(modified_async_session, "worker-1") is None
+    assert (await get_task(modified_async_session, later.id)).status == (
+        TaskStatus.QUEUED
+    )
+
+
+@pytest.mark.asyncio
+async def test_claim_skips_locked_tasks(modified_async_session):
+    task = await enqueue(modified_async_session, "t")
+
+    # Another worker holds the row lock, between its SELECT and its UPDATE
+    async with async_session() as other:
+        res = await other.exec(
+            select(Task).where(Task.id == task.id).with_for_update()
+        )
+        res.one()
+
+        async with async_session() as session:
+            assert await claim_task(session, "worker-2") is None
+
+        await other.rollback()
+
+    async with async_session() as session:
+        claimed = await claim_task(session, "worker-2")
+    assert claimed.id == task.id
+
+
+@pytest.mark.asyncio
+async def test_failed_task_is_retried_with_backoff(
+    modified_async_session, monkeypatch
+):
+    async def fail(session, s3):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(TASK_HANDLERS, "fail", fail)
+    task = await enqueue(modified_async_session, "fail", max_attempts=2)
+
+    claimed = await claim_task(modified_async_session, "worker-1")
+    before = datetime.datetime.now()
+    await run_task(claimed, modified_async_session, None)
+
+    task = await get_task(modified_async_session, task.id)
+    assert task.status == TaskStatus.QUEUED
+    assert task.last_error == "boom"
+    assert task.locked_by is None
+    assert task.run_after >= before + datetime.timedelta(
+        seconds=retry_delay_seconds(1)
+    )
+
+    # Due again, and failed for good on the last attempt
+    task.run_after = datetime.datetime.now()
+    modified_async_session.add(task)
+    await modified_async_session.commit()
+
+    claimed = await claim_task(modified_async_session, "worker-1")
+    assert claimed.attempts == 2
+    await run_task(claimed, modified_async_session, None)
+
+    task = await get_task(modified_async_session, task.id)
+    assert task.status == TaskStatus.FAILED
+
+
+def test_retry_delay_is_exponential_and_capped():
+    assert retry_delay_seconds(1) == config.TASK_RETRY_BACKOFF_SECONDS
+    assert retry_delay_seconds(3) == config.TASK_RETRY_BACKOFF_SECONDS * 4
+    assert retry_delay_seconds(100) == config.TASK_RETRY_BACKOFF_MAX_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_handler_receives_payload(modified_async_session, monkeypatch):
+    received = {}
+
+    async def handler(session, s3, **payload):
+        received.update(payload)
+
+    monkeypatch.setitem(TASK_HANDLERS, "record", handler)
+    task = await enqueue(modified_async_session, "record", {"a": "b"})
+
+    claimed = await claim_task(modified_async_session, "worker-1")
+    await run_task(claimed, modified_async_session, None)
+
+    assert received == {"a": "b"}
+    task = await get_task(modified_async_session, task.id)
+    assert task.status == TaskStatus.SUCCEEDED
+
+
+@pytest.mark.asyncio
+async def test_requeue_stale_tasks(modified_async_session, monkeypatch):
+    stale = await enqueue(modified_async_session, "t")
+    fresh = await enqueue(modified_async_session, "t")
+    now = datetime.datetime.now()
+    for task, locked_at in (
+        (stale, now - datetime.timedelta(seconds=10)),
+        (fresh, now),
+    ):
+        task.status = TaskStatus.RUNNING
+        task.locked_at = locked_at
+        task.locked_by = "gone"
+        modified_async_session.add(task)
+    await modified_async_session.commit()
+
+    monkeypatch.setattr(config, "TASK_LOCK_TIMEOUT_SECONDS", 5)
+    await requeue_stale_tasks(modified_async_session)
+
+    stale = await get_task(modified_async_session, stale.id)
+    assert stale.status == TaskStatus.QUEUED
+    assert stale.locked_by is None
+    fresh = await get_task(modified_async_session, fresh.id)
+    assert fresh.status == TaskStatus.RUNNING
+
+
+@pytest.mark.asyncio
+async def test_periodic_runs_on_one_worker(
+    modified_async_session, monkeypatch
+):
+    runs = []
+
+    async def job(session, s3):
+        runs.append(s3)
+
+    monkeypatch.setitem(PERIODIC_TASKS, "job", (60, job))
+
+    # Another worker is running the job
+    async with engine.connect() as conn:
+        await conn.execute(
+            text("SELECT pg_advisory_lock(hashtext('periodic:job'))")
+        )
+        assert not await run_periodic("job", "s3")
+        await conn.execute(
+            text("SELECT pg_advisory_unlock(hashtext('periodic:job'))")
+        )
+        await conn.commit()
+
+    assert await run_periodic("job", "s3")
+    assert runs == ["s3"]
+
+
+@pytest.mark.asyncio
+async def test_periodic_runs_once_per_interval(
+    modified_async_session, monkeypatch
+):
+    runs = []
+
+    async def job(session, s3):
+        runs.append(s3)
+
+    monkeypatch.setitem(PERIODIC_TASKS, "job", (60, job))
+
+    assert await run_periodic("job", "worker-1")
+    # Another worker checks within the interval
+    assert not await run_periodic("job", "worker-2")
+    assert runs == ["worker-1"]
+
+    run = await modified_async_session.get(PeriodicRun, "job")
+    run.last_run_utc -= datetime.timedelta(seconds=61)
+    modified_async_session.add(run)
+    await modified_async_session.commit()
+
+    assert await run_periodic("job", "worker-2")
+    assert runs == ["worker-1", "worker-2"]
+
+
+@pytest.mark.asyncio
+async def test_running_task_lock_is_renewed(
+    modified_async_session, monkeypatch
+):
+    async def handler(session, s3):
+        await asyncio.sleep(2)
+
+    monkeypatch.setitem(TASK_HANDLERS, "slow", handler)
+    monkeypatch.setattr(config, "TASK_HEARTBEAT_SECONDS", 0.5)
+    monkeypatch.setattr(config, "TASK_LOCK_TIMEOUT_SECONDS", 1)
+    task = await enqueue(modified_async_session, "slow")
+    claimed = await claim_task(modified_async_session, "worker-1")
+    claimed_at = claimed.locked_at
+
+    running = asyncio.create_task(
+        run_task(claimed, modified_async_session, None)
+    )
+    await asyncio.sleep(1.5)
+    async with async_session() as session:
+        await requeue_stale_tasks(session)
+        task = await get_task(session, task.id)
+    assert task.status == TaskStatus.RUNNING
+    assert task.locked_at > claimed_at
+
+    await running
+    task = await get_task(modified_async_session, task.id)
+    assert task.status == TaskStatus.SUCCEEDED
+    assert task.locked_at is None
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_queued_tasks(modified_async_session, monkeypatch):
+    done = asyncio.Event()
+
+    async def handler(session, s3):
+        done.set()
+
+    monkeypatch.setitem(TASK_HANDLERS, "signal", handler)
+    task = await enqueue(modified_async_session, "signal")
+
+    worker = asyncio.create_task(work("worker-1", None))
+    try:
+        await asyncio.wait_for(done.wait(), timeout=10)
+
+        for _ in range(50):
+            task = await get_task(modified_async_session, task.id)
+            if task.status == TaskStatus.SUCCEEDED:
+                break
+            await asyncio.sleep(0.1)
+        assert task.status == TaskStatus.SUCCEEDED
+    finally:
+        worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await worker
+
+
+@pytest.mark.asyncio
+async def test_prune_finished_tasks(modified_async_session):
+    old = datetime.datetime.now() - datetime.timedelta(
+        seconds=config.TASK_FAILED_RETENTION_SECONDS + 60
+    )
+    recent = datetime.datetime.now()
+    tasks = {
+        (status, when): Task(name="t", status=status, last_updated=when)
+        for status in TaskStatus
+        for when in (old, recent)
+    }
+    for task in tasks.values():
+        modified_async_session.add(task)
+    await modified_async_session.commit()
+
+    assert await prune_finished_tasks(modified_async_session, None) == 2
+
+    res = await modified_async_session.exec(select(Task.id))
+    remaining = set(res.all())
+    for (status, when), task in tasks.items():
+        pruned = when == old and status in (
+            TaskStatus.SUCCEEDED,
+            TaskStatus.FAILED,
+        )
+        assert (task.id not in remaining) == pruned
+
+
+@pytest.mark.asyncio
+async def test_enqueue_unique_shares_running_tasks(modified_async_session):
+    first = await enqueue_unique(
+        modified_async_session, "build", {"key": "a", "n": 1}, unique_on="key"
+    )
+    same = await enqueue_unique(
+        modified_async_session, "build", {"key": "a", "n": 2}, unique_on="key"
+    )
+    other = await enqueue_unique(
+        modified_async_session, "build", {"key": "b"}, unique_on="key"
+    )
+    assert same.id == first.id
+    assert other.id != first.id
+
+    # Claimed tasks are shared until they finish
+    claimed = await claim_task(modified_async_session, "worker-1")
+    assert claimed.id == first.id
+    same = await enqueue_unique(
+        modified_async_session, "build", {"key": "a"}, unique_on="key"
+    )
+    assert same.id == first.id
+
+    claimed.status = TaskStatus.SUCCEEDED
+    modified_async_session.add(claimed)
+    await modified_async_session.commit()
+    again = await enqueue_unique(
+        modified_async_session, "build", {"key": "a"}, unique_on="key"
+    )
+    assert again.id != first.id
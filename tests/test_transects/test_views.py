@@ -0,0 +1,69 @@
+import pytest
+import uuid
+from httpx import ASGITransport, AsyncClient
+from app.config import config
+from app.auth.services import get_user_info
+from app.db import get_session
+from app.main import app
+from app.query_cache import cache
+from app.transects.models import Transect
+from app.transects.views import get_one
+
+ROUTE = f"{config.API_PREFIX}/transects"
+
+
+class MockSession:
+    def __init__(self):
+        self.added = []
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        pass
+
+    async def refresh(self, obj):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_update_accepts_flat_body(monkeypatch, test_user_one):
+    monkeypatch.setattr(cache, "is_enable", lambda *args: False)
+    transect = Transect(id=uuid.uuid4(), name="Transect", owner=uuid.uuid4())
+    session = MockSession()
+
+    def override_get_session():
+        yield session
+
+    for dependency, override in (
+        (get_one, lambda: transect),
+        (get_session, override_get_session),
+        (get_user_info, lambda: test_user_one),
+    ):
+        monkeypatch.setitem(app.dependency_overrides, dependency, override)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        res = await client.put(
+            f"{ROUTE}/{transect.id}",
+            json={
+                "name": "Transect",
+                "description": "new",
+                "latitude_start": 46.5,
+                "longitude_start": 6.5,
+                "latitude_end": 46.6,
+                "longitude_end": 6.6,
+            },
+        )
+
+    assert res.status_code == 200, res.text
+    assert res.json()["description"] == "new"
+    assert session.added == [transect]
+
+
+def test_update_request_body_is_the_update_model():
+    schema = app.openapi()["paths"][f"{ROUTE}/{{transect_id}}"]["put"]
+
+    assert schema["requestBody"]["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/TransectUpdate"
+    }